@@ -1,4 +1,5 @@
 from drivers.instrument import Instrument
+from drivers.OperationCompletion import OperationCompletion
 from numpy import *
 import numpy
 import visa
@@ -29,6 +30,7 @@ class Agilent_EXA_N9010A(Instrument):
         self._address = address
         rm = visa.ResourceManager()
         self._visainstrument = rm.open_resource(self._address, timeout=10000)# no term_chars for GPIB!!!!!
+        self._completion = OperationCompletion(self._visainstrument)
         self._freqpoints = 0
         self._zerospan=False
         self._list_sweep = False
@@ -416,17 +418,18 @@ class Agilent_EXA_N9010A(Instrument):
         rbw_list: array-like
             list of the resolution bandwidths to be used for corresponding frequencies
         """
-        self._visainstrument.write(":CONFigure:LIST")
-        self._list_sweep = True
+        with self.batch():
+            self._visainstrument.write(":CONFigure:LIST")
+            self._list_sweep = True
 
-        freqs_str = "".join(["%f,"%freq for freq in frequency_list])
-        self._visainstrument.write(":LIST:FREQ "+freqs_str[:-1])
+            freqs_str = "".join(["%f,"%freq for freq in frequency_list])
+            self._visainstrument.write(":LIST:FREQ "+freqs_str[:-1])
 
-        rbws_str = "".join(["%f,"%rbw for rbw in rbw_list])
-        self._visainstrument.write(":LIST:BAND:RES "+rbws_str[:-1])
+            rbws_str = "".join(["%f,"%rbw for rbw in rbw_list])
+            self._visainstrument.write(":LIST:BAND:RES "+rbws_str[:-1])
 
-        sweep_times = "".join(["%f,"%swt for swt in ones_like(frequency_list)/1e3])
-        self._visainstrument.write(":LIST:SWEep:TIME "+sweep_times[:-1])
+            sweep_times = "".join(["%f,"%swt for swt in ones_like(frequency_list)/1e3])
+            self._visainstrument.write(":LIST:SWEep:TIME "+sweep_times[:-1])
 
     def setup_swept_sa(self, center_freq=5e9, span=1e9, nop=1001, rbw=1e6):
         """
@@ -636,27 +639,33 @@ class Agilent_EXA_N9010A(Instrument):
         return self.get_tracedata()
 
     def prepare_for_stb(self):
-        # Clear the instrument's Status Byte
-        self._visainstrument.write("*CLS")
-        # Enable for the OPC bit (bit 0, which has weight 1) in the instrument's
-        # Event Status Register, so that when that bit's value transitions from 0 to 1
-        # then the Event Status Register bit in the Status Byte (bit 5 of that byte)
-        # will become set.
-        self._visainstrument.write("*ESE 1")
+        # Clear the instrument's Status Byte and enable the OPC bit (bit 0) in
+        # the Event Status Register, so that the Event Status Register bit in the
+        # Status Byte (bit 5) becomes set and requests service when it is done
+        self.flush_batch()
+        self._completion.prepare()
         return "OPC bit enabled (*ESE 1)."
 
-    def wait_for_stb(self):
-        self._visainstrument.write("*OPC")
-        done = False
-        while not(done):
-            bla = self._visainstrument.query("*STB?")
-            try:
-                stb_value = int(bla)
-            except:
-                print("Error in wait(): value returned: {0}".format(bla))
-            else:
-                done = (2**5 == (2**5 & stb_value))
-                sleep(0.01)
+    def wait_for_stb(self, timeout=None):
+        """
+        Waits until the operations started after prepare_for_stb() are
+        complete, see OperationCompletion
+
+        Parameters
+        ----------
+        timeout: float, s
+            unlimited if None
+        """
+        self.flush_batch()
+        self._completion.wait(timeout)
+
+    async def wait_for_stb_async(self, timeout=None):
+        """
+        Same as wait_for_stb(...) for use in coroutines, lets other
+        instruments be commanded meanwhile
+        """
+        self.flush_batch()
+        await self._completion.wait_async(timeout)
 
 
 
@@ -57,36 +57,37 @@ class MXG(Instrument):
         Method allowing to set all of the VNA parameters at once (bandwidth, nop,
         power, averages and freq_limits)
         """
-        keys = parameters_dict.keys()
-        if "power" in keys:
-            self.set_power(parameters_dict["power"])
-        if "frequency" in keys:
-            self.set_frequency(parameters_dict["frequency"])
-
-        if "sweep_trg_src" in keys:
-            self.set_freq_sweep()
-
-        if "frequencies" in keys:
-            freqs = parameters_dict["frequencies"]
-            self.set_freq_limits((freqs[0], freqs[-1]))
-            self.set_nop(len(freqs))
-
-        if "sweep_trg_src" in keys:
-            self.set_sweep_type()
-            self.set_trig_type_single()
-        else:
-            self.set_single_point()
-
-        if "sweep_trg_src" in keys:
-            self.set_sweep_trg_src(parameters_dict["sweep_trg_src"])
-
-        if "sweep_trg_src" in keys:
-            self.sweep_cont_trig()
-
-        if "InSweep_trg_src" in keys:
-            self.set_InSweep_trg_src(parameters_dict["InSweep_trg_src"])
-        if "ext_trig_channel" in keys:
-            self.set_ext_trig_channel(parameters_dict["ext_trig_channel"])\
+        with self.batch():
+            keys = parameters_dict.keys()
+            if "power" in keys:
+                self.set_power(parameters_dict["power"])
+            if "frequency" in keys:
+                self.set_frequency(parameters_dict["frequency"])
+
+            if "sweep_trg_src" in keys:
+                self.set_freq_sweep()
+
+            if "frequencies" in keys:
+                freqs = parameters_dict["frequencies"]
+                self.set_freq_limits((freqs[0], freqs[-1]))
+                self.set_nop(len(freqs))
+
+            if "sweep_trg_src" in keys:
+                self.set_sweep_type()
+                self.set_trig_type_single()
+            else:
+                self.set_single_point()
+
+            if "sweep_trg_src" in keys:
+                self.set_sweep_trg_src(parameters_dict["sweep_trg_src"])
+
+            if "sweep_trg_src" in keys:
+                self.sweep_cont_trig()
+
+            if "InSweep_trg_src" in keys:
+                self.set_InSweep_trg_src(parameters_dict["InSweep_trg_src"])
+            if "ext_trig_channel" in keys:
+                self.set_ext_trig_channel(parameters_dict["ext_trig_channel"])
 
     def use_internal_clock(self, is_clock_internal):
         if is_clock_internal:
@@ -0,0 +1,135 @@
+"""
+Waiting for the completion of the overlapped operations (sweeps, averaging)
+of SCPI instruments without polling the status byte.
+
+The instrument is asked to set the Operation Complete bit when all the pending
+operations are done (*OPC). The bit is propagated into the Event Status Bit of
+the status byte (*ESE 1), which requests service (*SRE 32), and the service
+request is awaited as a VISA event. Interfaces without service requests (e.g.
+raw sockets) wait for the reply to the *OPC? query instead. Both take a single
+round trip, and the completion is noticed immediately rather than at the next
+poll.
+
+Blocking waits of independent instruments may be overlapped with the async
+API or with run_concurrently(...):
+
+>>> completions = [OperationCompletion(vna._visainstrument), OperationCompletion(exa._visainstrument)]
+>>> for completion, device in zip(completions, (vna, exa)):
+>>>     completion.prepare()
+>>>     device.sweep_single()
+>>> run_concurrently(*[completion.wait for completion in completions])
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from pyvisa import constants
+from pyvisa.errors import VisaIOError
+
+
+class OperationCompletion:
+
+    def __init__(self, resource, use_srq=True):
+        """
+        Parameters
+        ----------
+        resource: pyvisa.resources.MessageBasedResource
+            opened instrument
+        use_srq: bool
+            try to wait for the service request first, the *OPC? query is
+            used if False or if the interface does not support it
+        """
+        self._resource = resource
+        self._use_srq = use_srq
+
+    def prepare(self):
+        """
+        Clears the status and enables the propagation of the Operation
+        Complete bit, call before starting the operations to wait for
+        """
+        self._resource.write("*CLS")
+        # Operation Complete bit (bit 0 of the Event Status Register) sets the
+        # Event Status Bit (bit 5 of the Status Byte)...
+        self._resource.write("*ESE 1")
+        if self._use_srq:
+            # ...which requests service
+            self._resource.write("*SRE 32")
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the operations started after prepare() are complete
+
+        Parameters
+        ----------
+        timeout: float, s
+            maximum waiting time, unlimited if None
+        """
+        if self._use_srq:
+            try:
+                self._wait_for_srq(timeout)
+                return
+            except (VisaIOError, NotImplementedError) as e:
+                if isinstance(e, VisaIOError) and e.error_code == constants.StatusCode.error_timeout:
+                    raise TimeoutError("Operation is not complete after %s s" % timeout) from e
+                # service requests are not supported by the interface
+                self._use_srq = False
+        self._wait_for_opc_query(timeout)
+
+    async def wait_async(self, timeout=None):
+        """
+        Same as wait(...), but lets other coroutines run meanwhile
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.wait, timeout)
+
+    def _wait_for_srq(self, timeout):
+        event_type = constants.EventType.service_request
+        self._resource.enable_event(event_type, constants.EventMechanism.queue)
+        try:
+            self._resource.write("*OPC")
+            self._resource.wait_on_event(event_type, self._to_visa_timeout(timeout))
+            # serial poll clears the request
+            self._resource.read_stb()
+        finally:
+            self._resource.disable_event(event_type, constants.EventMechanism.queue)
+            self._resource.discard_events(event_type, constants.EventMechanism.queue)
+
+    def _wait_for_opc_query(self, timeout):
+        # the reply comes when the operations are complete, so the query
+        # must not time out before
+        old_timeout = self._resource.timeout
+        self._resource.timeout = None if timeout is None else timeout * 1e3
+        try:
+            self._resource.query("*OPC?")
+        except VisaIOError as e:
+            if e.error_code == constants.StatusCode.error_timeout:
+                raise TimeoutError("Operation is not complete after %s s" % timeout) from e
+            raise
+        finally:
+            self._resource.timeout = old_timeout
+
+    @staticmethod
+    def _to_visa_timeout(timeout):
+        return constants.VI_TMO_INFINITE if timeout is None else int(timeout * 1e3)
+
+
+def run_concurrently(*functions):
+    """
+    Calls the functions in separate threads, e.g. to command or wait for
+    independent instruments at once
+
+    Returns
+    -------
+    list
+        results of the functions in the same order
+    """
+    with ThreadPoolExecutor(max(len(functions), 1)) as executor:
+        futures = [executor.submit(function) for function in functions]
+        return [future.result() for future in futures]
+
+
+async def run_concurrently_async(*functions):
+    """
+    Same as run_concurrently(...) for use in coroutines
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*[loop.run_in_executor(None, function) for function in functions])
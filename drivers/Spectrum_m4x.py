@@ -11,6 +11,8 @@ https://spectrum-instrumentation.com/sites/default/files/download/m4x22_datashee
 '''
 
 
+from functools import lru_cache
+
 import numpy as np
 from scipy import fftpack
 from scipy.fftpack import fft, fftfreq
@@ -32,6 +34,7 @@ class SPCM_MODE(Enum):
     STANDARD = "STANDARD"
     MULTIMODE = "MULTIMODE"
     AVERAGING = "AVERAGING"
+    FIFO = "FIFO"
     UNDEFINED = "UNDEFINED"
 
 
@@ -39,10 +42,22 @@ class SPCM_TRIGGER(Enum):
     AUTOTRIG = "AUTOTIG"
     EXT0 = "EXT0"
 
+def _page_aligned_empty(nbytes, alignment=4096):
+    """
+    Uninitialized uint8 array whose data starts at a page boundary,
+    as required for the DMA buffers of the card
+    """
+    raw = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = -raw.ctypes.data % alignment
+    return raw[offset:offset + nbytes]
+
+
 class SPCM:
     DC, AC = 0, 1
     AVG_ON = False
     MODEL_NAME = "M4X.2212-X4"
+    # DMA notify sizes have to be multiples of the page size (see manual p.70)
+    NOTIFY_ALIGNMENT = 4096
 
     def __init__(self, path):
         self.hCard = spcm_hOpen(create_string_buffer(path))
@@ -57,6 +72,8 @@ class SPCM:
 
         self._segment_size: int = None
         self._bufsize: int = 0  # size of the card buffer allocated in bytes
+        # page-aligned DMA buffers reused between acquisitions, keyed by size in bytes
+        self._buffers: dict = {}
         self._trigger_mode = SPC_TM_POS# | SPC_TM_REARM
         self._trig_term = 0
         self._trig_acdc = 0
@@ -126,6 +143,8 @@ class SPCM:
             n_avg = int(pars_dict["n_avg"])
             if (self.mode == SPCM_MODE.AVERAGING) and (n_avg < 4):
                 n_avg = 4
+            if (self.mode == SPCM_MODE.FIFO) and (1 < n_avg < 4):
+                n_avg = 4
             self.n_avg = n_avg
         if "trig_source" in pars_dict:
             trig_source = pars_dict["trig_source"]
@@ -154,6 +173,8 @@ class SPCM:
             self.setup_multiple_recoding_mode()
         elif self.mode == SPCM_MODE.AVERAGING:
             self.setup_averaging_mode()
+        elif self.mode == SPCM_MODE.FIFO:
+            self.setup_fifo_mode()
         elif self.mode == SPCM_MODE.UNDEFINED:
             # mode was intentionally left underfined so the real mode of
             # operation will be decided later by the measurement class
@@ -186,6 +207,11 @@ class SPCM:
         return spcm_dwDefTransfer_i64(self.hCard, SPCM_BUF_DATA, SPCM_DIR_CARDTOPC, int32(notifysize), byref(buffer),
                                       int64(offset), int64(buffer.__len__()))
 
+    def __def_array_transfer(self, buffer, notifysize=0):
+        """Define Card -> PC transfer into a numpy array of uint8"""
+        return spcm_dwDefTransfer_i64(self.hCard, SPCM_BUF_DATA, SPCM_DIR_CARDTOPC, uint32(notifysize),
+                                      c_void_p(buffer.ctypes.data), uint64(0), uint64(buffer.nbytes))
+
     def __invalidate_buffer(self):
         """Invalidate the buffer in the digitizer"""
         return spcm_dwInvalidateBuf(self.hCard, SPCM_BUF_DATA)
@@ -285,6 +311,40 @@ class SPCM:
         self.AVG_ON = False
         self.__handle_error()
 
+    def setup_fifo_multi_rec(self, segmentsize, posttrigger, loops=0):
+        """Setup FIFO Multiple Recording mode
+            Segments are streamed to the PC while the card keeps acquiring
+            Parameters:
+            -----------
+            loops: int
+                number of segments to acquire, 0 for endless acquisition"""
+        self.__write_to_reg_32(SPC_CARDMODE, SPC_REC_FIFO_MULTI)
+        self.__write_to_reg_32(SPC_SEGMENTSIZE, segmentsize)
+        self.__write_to_reg_32(SPC_POSTTRIGGER, posttrigger)
+        self.__write_to_reg_64(SPC_LOOPS, loops)
+        self.AVG_ON = False
+        self.__handle_error()
+
+    def setup_fifo_block_avg(self, segmentsize, posttrigger, averages, loops=0):
+        """Setup FIFO mode with the Block Averaging Module
+            Every segment is averaged over 'averages' triggers on the card
+            and streamed to the PC while the card keeps acquiring
+            Parameters:
+            -----------
+            loops: int
+                number of averaged segments to acquire, 0 for endless acquisition"""
+        if averages <= 256:
+            self.__write_to_reg_32(SPC_CARDMODE, SPC_REC_FIFO_AVERAGE_16BIT)
+        else:
+            self.__write_to_reg_32(SPC_CARDMODE, SPC_REC_FIFO_AVERAGE)
+
+        self.__write_to_reg_32(SPC_AVERAGES, averages)
+        self.__write_to_reg_32(SPC_SEGMENTSIZE, segmentsize)
+        self.__write_to_reg_32(SPC_POSTTRIGGER, posttrigger)
+        self.__write_to_reg_64(SPC_LOOPS, loops)
+        self.AVG_ON = True
+        self.__handle_error()
+
     def setup_channel(self, channelnum, amplitude):
         """Setup channels of the Digitizer
             Parameters:
@@ -398,14 +458,8 @@ class SPCM:
         #  standard mode (this seems to be perfectly valid only for averaging mode)
         #  due to the fact it is multiplied by 4
         mul = None
-        if self.mode == SPCM_MODE.AVERAGING:
-            # 16 bit data mode due to low averaging
-            if self.n_avg <= 256:
-                mul = 2
-            else:
-                mul = 4
-        if self.mode == SPCM_MODE.STANDARD:
-            mul = 1
+        if self.mode in (SPCM_MODE.AVERAGING, SPCM_MODE.FIFO, SPCM_MODE.STANDARD, SPCM_MODE.MULTIMODE):
+            mul = self.get_sample_dtype().itemsize
         self._bufsize = self.n_seg * self._segment_size * mul * len(self.channels)  # in bytes
 
     def get_how_many_samples_to_drop_in_front(self):
@@ -509,9 +563,26 @@ class SPCM:
         self.__handle_error()
         return cnt
 
+    def _get_buffer(self, nbytes):
+        """
+        Page-aligned uint8 buffer of the given size that is allocated once
+        and reused by all the following acquisitions of the same size
+        """
+        if nbytes not in self._buffers:
+            self._buffers[nbytes] = _page_aligned_empty(nbytes)
+        return self._buffers[nbytes]
+
     def obtain_data(self):
-        pcData = (int8 * self._bufsize)()
-        res = self.__def_simp_transfer(pcData)  # define Card -> PC transfer buffer
+        """
+        Returns
+        -------
+        numpy.ndarray
+            Read-only view of the persistent buffer the data was transferred
+            into. It is overwritten by the next acquisition, so the data has
+            to be processed, scaled with scale_data(...) or copied before that.
+        """
+        pcData = self._get_buffer(self._bufsize)
+        res = self.__def_array_transfer(pcData)  # define Card -> PC transfer buffer
         if res is not 0:
             print("Error: %d" % res)
             return None
@@ -519,14 +590,129 @@ class SPCM:
                                M2CMD_DATA_STARTDMA | M2CMD_DATA_WAITDMA)  # Start the transfer and wait till it's completed
         self.__write_to_reg_32(SPC_M2CMD, M2CMD_DATA_STOPDMA)  # Explicitly stop DMA transfer
         self.__invalidate_buffer()  # Invalidate the buffer
-        if self.mode == SPCM_MODE.AVERAGING:
+        data = pcData.view(self.get_sample_dtype())
+        data.flags.writeable = False
+        return data
+
+    def get_structured_view(self, data):
+        """
+        Parameters
+        ----------
+        data: numpy.ndarray
+            flat interleaved data returned by measure() or stream(...)
+
+        Returns
+        -------
+        numpy.ndarray, shape (n_seg, segment size, number of channels)
+            view of the same memory
+        """
+        n_channels = len(self.channels)
+        n_samples = self.n_seg * self._segment_size * n_channels
+        return data[:n_samples].reshape(self.n_seg, self._segment_size, n_channels)
+
+    def scale_data(self, data, out=None):
+        """
+        Converts the raw samples to mV in a single pass without intermediate
+        arrays. Conversion is according to p.81 of the manual.
+
+        Parameters
+        ----------
+        data: numpy.ndarray
+            flat interleaved data returned by measure() or stream(...)
+        out: numpy.ndarray of float32, shape (n_seg, segment size, number of channels)
+            array to write the result into, allocated if None
+
+        Returns
+        -------
+        numpy.ndarray of float32, shape (n_seg, segment size, number of channels)
+        """
+        return np.multiply(self.get_structured_view(data),
+                           np.float32(self.ch_amplitude / 128 / self.n_avg),
+                           out=out, dtype=np.float32, casting="unsafe")
+
+    def get_sample_dtype(self):
+        """
+        Returns
+        -------
+        numpy.dtype
+            type of the samples transferred from the card in the current mode
+        """
+        if self.mode == SPCM_MODE.AVERAGING or (self.mode == SPCM_MODE.FIFO and self.n_avg > 1):
             if self.n_avg <= 256:
-                # 16 bit averagin mode
-                return np.frombuffer(pcData, dtype=np.int16)
+                # 16 bit averaging mode
+                return np.dtype(np.int16)
             else:
-                return np.frombuffer(pcData, dtype=np.int32)
+                return np.dtype(np.int32)
         else:
-            return np.frombuffer(pcData, dtype=np.int8)
+            return np.dtype(np.int8)
+
+    def stream(self, n_blocks=None, ring_blocks=16, timeout=10000):
+        """
+        Continuous acquisition in the FIFO mode set by setup_fifo_mode(...)
+
+        The card writes into a ring buffer in the PC memory while the data
+        already acquired is being processed, so no triggers are lost during
+        the processing as long as the ring buffer does not overflow.
+
+        Parameters
+        ----------
+        n_blocks: int
+            number of blocks to acquire, endless acquisition if None
+        ring_blocks: int
+            minimum ring buffer size in blocks. It is rounded up to a whole
+            number of notify chunks (the smallest multiple of both the block
+            and the page size) and to at least two of them, so that the card
+            may fill one chunk while the other is processed
+        timeout: int, ms
+            maximum time to wait for a block
+
+        Yields
+        ------
+        numpy.ndarray
+            Read-only views of the ring buffer, each containing 'n_seg'
+            segments formatted as the output of measure(). A view is only
+            valid until the next block is requested: it is handed back to the
+            card then, so it has to be processed or copied before that.
+        """
+        if self.mode != SPCM_MODE.FIFO:
+            raise CardError("Card is not in the FIFO mode, call setup_fifo_mode(...) first")
+        dtype = self.get_sample_dtype()
+        block_bytes = self.n_seg * self._segment_size * len(self.channels) * dtype.itemsize
+        # notify size is the smallest multiple of both the block and the page
+        # size, so the blocks never wrap around the end of the ring buffer
+        notify_bytes = np.lcm(block_bytes, self.NOTIFY_ALIGNMENT)
+        n_chunks = max(2, -(-ring_blocks * block_bytes // notify_bytes))
+        ring = self._get_buffer(int(notify_bytes * n_chunks))
+
+        res = self.__def_array_transfer(ring, int(notify_bytes))
+        if res != 0:
+            raise CardError("Error %d while defining the FIFO transfer" % res)
+        self.set_timeout(timeout)
+        self.__write_to_reg_32(SPC_M2CMD, M2CMD_CARD_START | M2CMD_CARD_ENABLETRIGGER | M2CMD_DATA_STARTDMA)
+        self.__handle_error()
+
+        n_done = 0
+        try:
+            while n_blocks is None or n_done < n_blocks:
+                available = self.__read_reg_64(SPC_DATA_AVAIL_USER_LEN)
+                if available < block_bytes:
+                    self.__handle_timeout(
+                        self.__write_to_reg_32(SPC_M2CMD, M2CMD_DATA_WAITDMA)
+                    )
+                    if self._get_status() & M2STAT_DATA_OVERRUN:
+                        raise CardError("FIFO ring buffer overrun, the data is processed too slowly")
+                    continue
+                position = self.__read_reg_64(SPC_DATA_AVAIL_USER_POS)
+                block = ring[position:position + block_bytes].view(dtype)
+                block.flags.writeable = False
+                yield block
+                # the consumer is done with the block, give it back to the card
+                self.__write_to_reg_64(SPC_DATA_AVAIL_CARD_LEN, block_bytes)
+                n_done += 1
+        finally:
+            self.stop_card()
+            self.__write_to_reg_32(SPC_M2CMD, M2CMD_DATA_STOPDMA)
+            self.__invalidate_buffer()
 
     def setup_standard_mode(self, channels=None, ampl=None, memsize=None, pretrigger=None):
         if channels is None:
@@ -568,6 +754,8 @@ class SPCM:
 
         # if function was not invoked from 'set_parameters'
         self.mode = SPCM_MODE.MULTIMODE
+        # every segment is a single shot
+        self.n_avg = 1
 
         posttrigger_mem = segment_size - pretrigger
         memsize = num_segments * segment_size
@@ -588,6 +776,58 @@ class SPCM:
         self.setup_trigger_source()
         self.setup_sample_rate()
 
+    def setup_fifo_mode(self, channels=None, ampl=None, num_segments=None, segment_size=None, pretrigger=None,
+                        num_averages=None):
+        """
+        Prepares the card for stream(...): segments are acquired continuously
+        and, if num_averages > 1, averaged on the card over num_averages
+        consecutive triggers. A block of num_segments segments is yielded by
+        stream(...) in the same format as measure() returns in the standard,
+        multiple recording or averaging modes.
+        """
+        if channels is None:
+            channels = self.channels
+        if ampl is None:
+            ampl = self.ch_amplitude
+        if num_segments is None:
+            num_segments = self.n_seg
+        if segment_size is None:
+            segment_size = self._segment_size
+        if pretrigger is None:
+            pretrigger = self.pretrigger_in_samples
+        if num_averages is None:
+            num_averages = self.n_avg
+        if type(channels) is int:
+            channels = [channels]
+
+        # if function was not invoked from 'set_parameters'
+        self.mode = SPCM_MODE.FIFO
+        self.channels = channels
+        self.ch_amplitude = ampl
+        self.n_seg = max(1, num_segments)
+        self.n_avg = max(1, num_averages)
+        self._segment_size = segment_size
+
+        if segment_size % 32 != 0:
+            raise CardError(f"Segment size must be a multiple of 32")
+
+        posttrigger_mem = segment_size - pretrigger
+        if self.n_avg > 1:
+            if self.n_avg < 4:
+                raise CardError(f"Averaging requires at least 4 averages; you requested {self.n_avg}")
+            max_seg_size = int(64 * 1024 / len(channels))
+            if segment_size > max_seg_size:
+                raise CardError(f"Segment size {segment_size} exceeds maximal "
+                                f"segment size {max_seg_size} for {len(channels)} channels")
+            self.setup_fifo_block_avg(segment_size, posttrigger_mem, self.n_avg)
+        else:
+            self.setup_fifo_multi_rec(segment_size, posttrigger_mem)
+        self.setup_channels(channels, ampl)
+        self.setup_pxi_clock()
+        self.setup_trigger_source()
+        self.setup_sample_rate()
+        self._bufsize = self.n_seg * segment_size * self.get_sample_dtype().itemsize * len(channels)
+
     def setup_averaging_mode(self, channels=None, ampl=None, num_segments=None, segment_size=None, pretrigger=None,
                              num_averages=None):
         if channels is None:
@@ -637,17 +877,21 @@ class SPCM:
             self.trigger_source = trigger_source
             init_trigger()
 
-    def measure(self):
+    def measure(self, bufsize=None):
         """
 
         Parameters
         ----------
-        bufsize
+        bufsize: int
+            size of the transferred data in bytes, kept from the last setup if None
 
         Returns
         -------
         np.ndarray
+            see obtain_data()
         """
+        if bufsize is not None:
+            self._bufsize = bufsize
         self.start_card()
         self.wait_for_card()  # wait till the end of a measurement
         data = self.obtain_data()  # download data from the card
@@ -854,24 +1098,52 @@ class SPCM:
     @staticmethod
     def extract_useful_data(data, n_channels, segment_size,
                             samples_per_segment_to_cut_at_beginning, samples_per_segment_to_cut_at_end):
-        every = n_channels * segment_size
-        # Generation of an array of indexes to cut at the beginning
-        if samples_per_segment_to_cut_at_beginning > 0:
-            first_idxs = np.arange(0, len(data), every, dtype=np.int)
-            # to cut data from every channel
-            times_at_beginning = n_channels * samples_per_segment_to_cut_at_beginning
-            idxs_at_beginning = np.concatenate([first_idxs + i for i in range(0, times_at_beginning)])
-        else:
-            idxs_at_beginning = np.array([])
-        # Generation of an array of indexes to cut at the end
-        if samples_per_segment_to_cut_at_end > 0:
-            end = (segment_size - samples_per_segment_to_cut_at_end) * n_channels
-            first_idxs = np.arange(end, len(data), every)
-            times_at_end = n_channels * samples_per_segment_to_cut_at_end
-            idxs_at_end = np.concatenate([first_idxs + i for i in range(0, times_at_end)])
-        else:
-            idxs_at_end = np.array([])
-        # An array of all indexes to be cut
-        idxs_to_cut = np.concatenate((idxs_at_beginning, idxs_at_end))
-        # Execution
-        return np.delete(data, idxs_to_cut)
+        segments = data.reshape(-1, segment_size, n_channels)
+        return SPCM.trim_segments(segments, samples_per_segment_to_cut_at_beginning,
+                                  samples_per_segment_to_cut_at_end).reshape(-1)
+
+    @staticmethod
+    def trim_segments(data, n_front, n_end):
+        """
+        Parameters
+        ----------
+        data: numpy.ndarray, shape (n_seg, segment size, ...)
+            e.g. output of get_structured_view(...) or scale_data(...)
+        n_front, n_end: int
+            numbers of samples to drop at the beginning and at the end of
+            every segment
+
+        Returns
+        -------
+        numpy.ndarray
+            view of the data without the dropped samples
+        """
+        return data[:, n_front:data.shape[1] - n_end]
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def gate_mask(n_samples, sample_rate, repetition_period, intervals):
+        """
+        Boolean mask of the trace samples that belong to any of the intervals
+        counted from the start of every repetition period. It is cached, so
+        it is computed once per pulse sequence configuration.
+
+        Parameters
+        ----------
+        n_samples: int
+            trace length
+        sample_rate: float, Hz
+        repetition_period: float, ns
+        intervals: tuple of (float, float), ns
+            starts and ends of the intervals, both included
+
+        Returns
+        -------
+        numpy.ndarray of bool, shape (n_samples,)
+            read-only mask
+        """
+        times = 1e9 * (np.arange(n_samples) * (1 / sample_rate)) % repetition_period
+        starts, ends = np.array(intervals, dtype=float).reshape(-1, 2).T
+        mask = np.any((times[:, np.newaxis] >= starts) & (times[:, np.newaxis] <= ends), axis=1)
+        mask.flags.writeable = False
+        return mask
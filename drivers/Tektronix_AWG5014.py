@@ -18,9 +18,11 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
 from drivers.instrument import Instrument
+from drivers.WaveformCache import WaveformCache
 import visa
 import types
 import logging
+import re
 import numpy as np
 import struct
 from itertools import chain
@@ -46,6 +48,8 @@ class Tektronix_AWG5014(Instrument):
     """
 
     MAX_OUTPUT_VOLTAGE = 1
+    # standard waveform memory length
+    WAVEFORM_MEMORY_POINTS = 16200000
 
     def __init__(self, address, reset=False, clock=1e9, nop=1000, marker_enob=10):
         """
@@ -74,6 +78,10 @@ class Tektronix_AWG5014(Instrument):
         self._waveforms = [None] * 4
         self._amplitudes = [None] * 4
         self._markers = [None] * 8
+        # waveform files already sent: content hash -> file name
+        self._waveform_files = WaveformCache(self.WAVEFORM_MEMORY_POINTS)
+        # file names loaded into the channels, never evicted from the cache
+        self._loaded_files = [None] * 4
         self._clear_all_waveforms()
         self._marker_enob = marker_enob
         self._marker_voltages = [{} for _ in range(8)]
@@ -182,6 +190,11 @@ class Tektronix_AWG5014(Instrument):
 
     def _clear_all_waveforms(self):
         self._visainstrument.write('WLIST:WAVeform:DELETE ALL')
+        # waveform files sent in the previous sessions are not in the cache,
+        # so they would never be evicted
+        listing = self._visainstrument.query('MMEM:CAT?')
+        for filename in set(re.findall(r'"(wfm_[0-9a-f]{16}\.wfm),', listing)):
+            self._visainstrument.write('MMEM:DEL "%s"' % filename)
 
     def run(self):
         self._visainstrument.write('AWGC:RUN:IMM')
@@ -189,6 +202,7 @@ class Tektronix_AWG5014(Instrument):
     def load_waveform(self, channel, filename, drive='C:', path='\\'):
         self._visainstrument.write('SOUR%s:FUNC:USER "%s/%s","%s"' % \
                                    (channel, path, filename, drive))
+        self._loaded_files[channel - 1] = filename
 
     def set_waveform(self, waveform, repetition_rate, channel):
 
@@ -221,10 +235,19 @@ class Tektronix_AWG5014(Instrument):
         m1 = np.array(m1, dtype=np.int)
         m2 = np.array(m2, dtype=np.int)
 
-        filename = 'test_ch{0}.wfm'.format(channel)
-
-        self.send_waveform(w[:-1], m1[:-1], m2[:-1], filename,
-                           repetition_rate * len(w[:-1]))
+        clock = repetition_rate * len(w[:-1])
+        # files are named after their contents, so an identical waveform is
+        # sent only once
+        key = WaveformCache.make_key(w[:-1], m1[:-1], m2[:-1], clock)
+        filename = self._waveform_files.get(key)
+        if filename is None:
+            filename = 'wfm_{0}.wfm'.format(key[:16])
+            self.send_waveform(w[:-1], m1[:-1], m2[:-1], filename, clock)
+            evicted = self._waveform_files.put(key, filename, len(w) - 1,
+                                               protected=set(self._loaded_files))
+            for evicted_key, evicted_filename in evicted:
+                self._visainstrument.write('MMEM:DEL "%s"' % evicted_filename)
+                self._values['files'].pop(evicted_filename, None)
         self.load_waveform(channel, filename)
         # self.do_set_filename(filename, channel=channel)
 
@@ -322,6 +345,7 @@ class Tektronix_AWG5014(Instrument):
                     bestand = bestand + lijst[i]
         if exists:
             self._visainstrument.write('SOUR%s:FUNC:USER "%s","C:"' % (channel, name))
+            self._loaded_files[channel - 1] = name
         else:
             logging.error(__name__ + ' : Invalid filename specified %s' % name)
 
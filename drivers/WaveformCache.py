@@ -0,0 +1,106 @@
+"""
+Content-addressed LRU cache of the waveforms stored in an instrument memory.
+
+The drivers use it to skip uploading waveforms that are already in the
+instrument and to recycle the memory slots (waveform IDs, file names) of the
+least recently used waveforms when the memory limit is reached.
+"""
+from collections import OrderedDict
+from hashlib import sha1
+
+import numpy as np
+
+
+class WaveformCache:
+
+    def __init__(self, max_points, max_entries=None):
+        """
+        Parameters
+        ----------
+        max_points: int
+            total length of the cached waveforms that fits into the memory
+        max_entries: int
+            maximum number of the cached waveforms, unlimited if None
+        """
+        self._max_points = max_points
+        self._max_entries = max_entries
+        self._entries = OrderedDict()  # key: (value, points number)
+        self._points = 0
+
+    @staticmethod
+    def make_key(*arrays_and_parameters):
+        """
+        Hash of the arrays contents (including dtypes and shapes) and of any
+        other hashable parameters that define the stored waveform
+        """
+        digest = sha1()
+        for item in arrays_and_parameters:
+            if isinstance(item, np.ndarray):
+                item = np.ascontiguousarray(item)
+                digest.update(str((item.dtype.str, item.shape)).encode())
+                digest.update(item.view(np.uint8).reshape(-1).data)
+            else:
+                digest.update(repr(item).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the value stored for the key and marks it as recently used,
+        or None if the key is absent
+        """
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key, value, n_points, protected=()):
+        """
+        Stores the value and evicts the least recently used entries until the
+        limits are satisfied
+
+        Parameters
+        ----------
+        protected: collection
+            values that may not be evicted, e.g. waveforms being output
+
+        Returns
+        -------
+        list of (key, value)
+            evicted entries whose memory may be reused
+        """
+        self.pop(key)
+        self._entries[key] = (value, n_points)
+        self._points += n_points
+
+        evicted = []
+        for old_key in list(self._entries.keys())[:-1]:
+            if self._points <= self._max_points and \
+                    (self._max_entries is None or len(self._entries) <= self._max_entries):
+                break
+            old_value, old_points = self._entries[old_key]
+            if old_value in protected:
+                continue
+            del self._entries[old_key]
+            self._points -= old_points
+            evicted.append((old_key, old_value))
+        return evicted
+
+    def pop(self, key):
+        if key in self._entries:
+            value, n_points = self._entries.pop(key)
+            self._points -= n_points
+            return value
+        return None
+
+    def values(self):
+        return [value for value, n_points in self._entries.values()]
+
+    def clear(self):
+        self._entries.clear()
+        self._points = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -20,6 +20,7 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
 from drivers.instrument import Instrument
+from drivers.OperationCompletion import OperationCompletion
 import visa
 import types
 import logging
@@ -53,6 +54,7 @@ class Agilent_PNA_L(Instrument):
         self._address = address
         rm = visa.ResourceManager()
         self._visainstrument = rm.open_resource(self._address) # no term_chars for GPIB!!!!!
+        self._completion = OperationCompletion(self._visainstrument)
         self._zerospan = False
         self._freqpoints = 0
         self._ci = channel_index
@@ -63,82 +65,89 @@ class Agilent_PNA_L(Instrument):
         # Implement parameters
 
         self.add_parameter('nop', type=int,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=1, maxval=100000,
             tags=['sweep'])
 
         self.add_parameter('bandwidth', type=float,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=0, maxval=1e9,
             units='Hz', tags=['sweep'])
 
         self.add_parameter('averages', type=int,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=1, maxval=1024, tags=['sweep'])
 
         self.add_parameter('average', type=bool,
-            flags=Instrument.FLAG_GETSET)
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE)
 
         self.add_parameter('centerfreq', type=float,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=0, maxval=20e9,
-            units='Hz', tags=['sweep'])
+            units='Hz', tags=['sweep'],
+            invalidates=['center', 'startfreq', 'stopfreq', 'span'])
 
         self.add_parameter('center', type=float,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=0, maxval=20e9,
-            units='Hz', tags=['sweep'])
+            units='Hz', tags=['sweep'],
+            invalidates=['centerfreq', 'startfreq', 'stopfreq', 'span'])
 
         self.add_parameter('startfreq', type=float,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=0, maxval=20e9,
-            units='Hz', tags=['sweep'])
+            units='Hz', tags=['sweep'],
+            invalidates=['centerfreq', 'center', 'stopfreq', 'span'])
 
         self.add_parameter('stopfreq', type=float,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=0, maxval=20e9,
-            units='Hz', tags=['sweep'])
+            units='Hz', tags=['sweep'],
+            invalidates=['centerfreq', 'center', 'startfreq', 'span'])
 
         self.add_parameter('CWfreq', type=float,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=300e3, maxval=20e9,
             units='Hz', tags=['sweep'])
 
         self.add_parameter('span', type=float,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=0, maxval=20e9,
-            units='Hz', tags=['sweep'])
+            units='Hz', tags=['sweep'],
+            invalidates=['centerfreq', 'center', 'startfreq', 'stopfreq'])
 
         self.add_parameter('power', type=float,
-            flags=Instrument.FLAG_GETSET,
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
             minval=-90, maxval=12,
             units='dBm', tags=['sweep'])
 
         self.add_parameter('zerospan', type=bool,
-            flags=Instrument.FLAG_GETSET)
+            flags=Instrument.FLAG_GETSET,
+            invalidates=['nop', 'averages', 'average', 'centerfreq', 'center', 'startfreq', 'stopfreq', 'span'])
 
         self.add_parameter('channel_index', type=int,
             flags=Instrument.FLAG_GETSET)
 
         #Triggering Stuff
         self.add_parameter('trigger_source', type=bytes,
-            flags=Instrument.FLAG_GETSET)
+            flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE)
 
         # output trigger stuff by Elena
         self.add_parameter('aux_num', type=int,
-                           flags=Instrument.FLAG_GETSET)
+                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
+                           invalidates=['trig_per_point', 'pos', 'bef', 'trig_dur'])
 
         self.add_parameter('trig_per_point', type=bool,
-                           flags=Instrument.FLAG_GETSET)
+                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE)
 
         self.add_parameter('pos', type=bool,
-                           flags=Instrument.FLAG_GETSET)
+                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE)
 
         self.add_parameter('bef', type=bool,
-                           flags=Instrument.FLAG_GETSET)
+                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE)
 
         self.add_parameter('trig_dur', type=float,
-                           flags=Instrument.FLAG_GETSET,
+                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
                            minval=2e-3, units='s')
 
 
@@ -279,6 +288,7 @@ class Agilent_PNA_L(Instrument):
 
     def preset(self):
         self._visainstrument.write( "SYST:FPReset" )
+        self.invalidate_cache()
 
     def avg_clear(self):
         self._visainstrument.write(':SENS%i:AVER:CLE' %(self._ci))
@@ -364,19 +374,7 @@ class Agilent_PNA_L(Instrument):
         return float(self._visainstrument.query("CALC{0}:CORRection:EDELay:TIME?".format(self._ci)))
 
     def set_xlim(self, start, stop):
-        self.logger.debug(__name__ + ' : setting start freq to %s Hz' % start)
-        self._visainstrument.write('SENS%i:FREQ:STAR %f' % (self._ci,start))
-        self._start = start
-        self.get_centerfreq();
-        self.get_stopfreq();
-        self.get_span();
-
-        self.logger.debug(__name__ + ' : setting stop freq to %s Hz' % stop)
-        self._visainstrument.write('SENS%i:FREQ:STOP %f' % (self._ci,stop))
-        self._stop = stop
-        self.get_startfreq();
-        self.get_centerfreq();
-        self.get_span();
+        self.set_freq_limits(start, stop)
 
     def get_xlim(self):
         return self._start, self._stop
@@ -385,19 +383,17 @@ class Agilent_PNA_L(Instrument):
         return self._start, self._stop
 
     def set_freq_limits(self, start, stop):
-        self.logger.debug(__name__ + ' : setting start freq to %s Hz' % start)
-        self._visainstrument.write('SENS%i:FREQ:STAR %f' % (self._ci,start))
+        start, stop = float(start), float(stop)
+        if self._is_cached('startfreq', start) and self._is_cached('stopfreq', stop):
+            return
+        self.logger.debug(__name__ + ' : setting freq limits to %s, %s Hz' % (start, stop))
+        self.invalidate_cache('startfreq', 'stopfreq', 'centerfreq', 'center', 'span')
+        # both in one message, the related parameters are not re-queried
+        self._visainstrument.write('SENS%i:FREQ:STAR %f;STOP %f' % (self._ci, start, stop))
         self._start = start
-        self.get_centerfreq();
-        self.get_stopfreq();
-        self.get_span();
-
-        self.logger.debug(__name__ + ' : setting stop freq to %s Hz' % stop)
-        self._visainstrument.write('SENS%i:FREQ:STOP %f' % (self._ci,stop))
         self._stop = stop
-        self.get_startfreq();
-        self.get_centerfreq();
-        self.get_span();
+        self.update_value('startfreq', start)
+        self.update_value('stopfreq', stop)
 
 
     def get_parameters(self):
@@ -417,38 +413,39 @@ class Agilent_PNA_L(Instrument):
         Method allowing to set all or some of the VNA parameters at once
         (bandwidth, nop, power, averages and freq_limits)
         """
-        if "bandwidth" in parameters_dict.keys():
-            self.set_bandwidth(parameters_dict["bandwidth"])
-        if "averages" in parameters_dict.keys():
-            self.set_averages(parameters_dict["averages"])
-        if "power" in parameters_dict.keys():
-            self.set_power(parameters_dict["power"])
-        if "nop" in parameters_dict.keys():
-            self.set_nop(parameters_dict["nop"])
-        if "freq_limits" in parameters_dict.keys():
-            if (parameters_dict["sweep_type"] == "CW"):
-                self.do_set_CWfreq(numpy.mean(parameters_dict["freq_limits"]))
-            else:
-                self.set_freq_limits(*parameters_dict["freq_limits"])
-        if "span" in parameters_dict.keys():
-            self.set_span(parameters_dict["span"])
-        if "centerfreq" in parameters_dict.keys():
-            self.set_centerfreq(parameters_dict["centerfreq"])
-        if "sweep_type" in parameters_dict.keys():
-            self.set_sweep_type(parameters_dict["sweep_type"])
-
-        if "aux_num" in parameters_dict.keys():
-            self.set_aux_num(parameters_dict["aux_num"])
-        if "trigger_source" in parameters_dict.keys():
-            self.set_trigger_source(parameters_dict["trigger_source"])
-        if "trig_per_point" in parameters_dict.keys():
-            self.set_trig_per_point(parameters_dict["trig_per_point"])
-        if "pos" in parameters_dict.keys():
-            self.set_pos(parameters_dict["pos"])
-        if "bef" in parameters_dict.keys():
-            self.set_bef(parameters_dict["bef"])
-        if "trig_dur" in parameters_dict.keys():
-            self.set_trig_dur(parameters_dict["trig_dur"])
+        with self.batch():
+            if "bandwidth" in parameters_dict.keys():
+                self.set_bandwidth(parameters_dict["bandwidth"])
+            if "averages" in parameters_dict.keys():
+                self.set_averages(parameters_dict["averages"])
+            if "power" in parameters_dict.keys():
+                self.set_power(parameters_dict["power"])
+            if "nop" in parameters_dict.keys():
+                self.set_nop(parameters_dict["nop"])
+            if "freq_limits" in parameters_dict.keys():
+                if (parameters_dict["sweep_type"] == "CW"):
+                    self.do_set_CWfreq(numpy.mean(parameters_dict["freq_limits"]))
+                else:
+                    self.set_freq_limits(*parameters_dict["freq_limits"])
+            if "span" in parameters_dict.keys():
+                self.set_span(parameters_dict["span"])
+            if "centerfreq" in parameters_dict.keys():
+                self.set_centerfreq(parameters_dict["centerfreq"])
+            if "sweep_type" in parameters_dict.keys():
+                self.set_sweep_type(parameters_dict["sweep_type"])
+
+            if "aux_num" in parameters_dict.keys():
+                self.set_aux_num(parameters_dict["aux_num"])
+            if "trigger_source" in parameters_dict.keys():
+                self.set_trigger_source(parameters_dict["trigger_source"])
+            if "trig_per_point" in parameters_dict.keys():
+                self.set_trig_per_point(parameters_dict["trig_per_point"])
+            if "pos" in parameters_dict.keys():
+                self.set_pos(parameters_dict["pos"])
+            if "bef" in parameters_dict.keys():
+                self.set_bef(parameters_dict["bef"])
+            if "trig_dur" in parameters_dict.keys():
+                self.set_trig_dur(parameters_dict["trig_dur"])
 
     def do_set_CWfreq(self,freq):
         """
@@ -861,6 +858,8 @@ class Agilent_PNA_L(Instrument):
         nop = self._visainstrument.read('DISP:COUN?')
         if val < nop:
             self._ci = val
+            # the cached values belong to the previous channel
+            self.invalidate_cache()
         else:
             raise ValueError('set_channel_index(): index must be < nop channels')
     def do_get_channel_index(self):
@@ -877,27 +876,33 @@ class Agilent_PNA_L(Instrument):
         return self._ci
 
     def prepare_for_stb(self):
-        # Clear the instrument's Status Byte
-        self._visainstrument.write("*CLS")
-        # Enable for the OPC bit (bit 0, which has weight 1) in the instrument's
-        # Event Status Register, so that when that bit's value transitions from 0 to 1
-        # then the Event Status Register bit in the Status Byte (bit 5 of that byte)
-        # will become set.
-        self._visainstrument.write("*ESE 1")
+        # Clear the instrument's Status Byte and enable the OPC bit (bit 0) in
+        # the Event Status Register, so that the Event Status Register bit in the
+        # Status Byte (bit 5) becomes set and requests service when it is done
+        self.flush_batch()
+        self._completion.prepare()
         return "OPC bit enabled (*ESE 1)."
 
-    def wait_for_stb(self):
-        self._visainstrument.write("*OPC")
-        done = False
-        while not(done):
-            bla = self._visainstrument.query("*STB?")
-            try:
-                stb_value = int(bla)
-            except:
-                print("Error in wait(): value returned: {0}".format(bla))
-            else:
-                done = (2**5 == (2**5 & stb_value))
-                sleep(0.02)
+    def wait_for_stb(self, timeout=None):
+        """
+        Waits until the operations started after prepare_for_stb() are
+        complete, see OperationCompletion
+
+        Parameters
+        ----------
+        timeout: float, s
+            unlimited if None
+        """
+        self.flush_batch()
+        self._completion.wait(timeout)
+
+    async def wait_for_stb_async(self, timeout=None):
+        """
+        Same as wait_for_stb(...) for use in coroutines, lets other
+        instruments be commanded meanwhile
+        """
+        self.flush_batch()
+        await self._completion.wait_async(timeout)
 
     def set_output_state(self, state):
         """
@@ -20,6 +20,7 @@ import copy
 import time
 import math
 import inspect
+from contextlib import contextmanager
 from gettext import gettext as _L
 
 import numpy as np
@@ -52,6 +53,9 @@ class Instrument():
                                 # back from a device.
     FLAG_PERSIST = 0x10         # Write parameter to config file if it is set,
                                 # try to read again for a new instance
+    FLAG_CACHE = 0x20           # skip a 'set' if the value equals the last
+                                # one confirmed by the device, see
+                                # invalidate_cache()
 
     USE_ACCESS_LOCK = False     # For now
 
@@ -221,6 +225,9 @@ class Instrument():
                     to watch. If any of them changes, execute a get for this
                     parameter. Useful for a parameter that depends on one
                     (or more) other parameters.
+                invalidates (list of strings): parameters whose cached
+                    values become unknown when this one is set, e.g. the
+                    span of a sweep after setting its start
 
         Output: None
         """
@@ -684,7 +691,14 @@ class Instrument():
             except:
                 logging.warning('Unable to cast value "%s" to %s', value, p['type'])
 
+        # the first read-back after a set may differ only by the rounding
+        # of the device, later changes are made by something else
+        verified = p.get('queried', False) or not p.get('confirmed', False)
+        if verified and not self._cache_equal(p.get('value'), value):
+            p.pop('set_value', None)
         p['value'] = value
+        p['confirmed'] = True
+        p['queried'] = True
         return value
 
     def get(self, name, query=True, fast=False, **kwargs):
@@ -885,6 +899,14 @@ class Instrument():
         else:
             base_name = name
 
+        if self._is_cached(name, value):
+            return p['value']
+
+        # the state of the device is unknown until the write succeeds
+        p['confirmed'] = False
+        if p.get('invalidates'):
+            self.invalidate_cache(*p['invalidates'])
+
         func = p['set_func']
         if 'maxstep' in p and p['maxstep'] is not None:
             curval = p['value']
@@ -919,11 +941,13 @@ class Instrument():
         else:
             ret = func(value, **kwargs)
 
+        p['set_value'] = value
+        p['value'] = value
+        p['confirmed'] = True
+        p['queried'] = False
         if p['flags'] & self.FLAG_GET_AFTER_SET:
             value = self._get_value(name, **kwargs)
 
-
-        p['value'] = value
         return value
 
     def set(self, name, value=None, fast=False, **kwargs):
@@ -991,6 +1015,37 @@ class Instrument():
             return None
 
         p['value'] = value
+        p['set_value'] = value
+        p['confirmed'] = True
+        p['queried'] = False
+
+    def invalidate_cache(self, *names):
+        """
+        Marks the cached values of the parameters as unknown, so that the
+        next set writes them to the device. Has to be called after commands
+        that change the parameters implicitly (preset, reset, etc.).
+
+        Input:  names of the parameters (strings), all if none given
+        Output: None
+        """
+        for name in names if names else self._parameters.keys():
+            if name in self._parameters:
+                self._parameters[name]['confirmed'] = False
+
+    def _is_cached(self, name, value):
+        """
+        Returns True if setting the value of the parameter may be skipped
+        """
+        p = self._parameters[name]
+        return bool(p['flags'] & Instrument.FLAG_CACHE) and p.get('confirmed', False) and \
+            self._cache_equal(p.get('set_value'), value)
+
+    @staticmethod
+    def _cache_equal(cached, value):
+        try:
+            return bool(np.all(cached == value)) and np.shape(cached) == np.shape(value)
+        except (TypeError, ValueError):
+            return False
 
     def get_argspec_dict(self, a):
         return dict(args=a[0], varargs=a[1], keywords=a[2], defaults=a[3])
@@ -1084,6 +1139,51 @@ class Instrument():
         """
         self._locked = False
 
+    @contextmanager
+    def batch(self, max_length=None):
+        """
+        Context in which the writes of the driver to its VISA resource are
+        collected and sent as one semicolon-joined message on exit, when a
+        query is made or when any other resource method is used.
+        Queries made by the driver are sent in the same message with the
+        pending writes. More queries may be deferred with
+        CommandBatch.defer_query(...) and resolved all at once:
+
+        >>> with vna.batch() as batch:
+        >>>     vna.set_parameters(parameters)
+        >>>     span = batch.defer_query("SENS1:FREQ:SPAN?")
+        >>> span = float(span.get_value())
+
+        Input:  max_length (int): the maximum length of a message, unlimited
+                    if None
+        Output: CommandBatch
+        """
+        if isinstance(self._visainstrument, CommandBatch):
+            yield self._visainstrument
+            return
+
+        resource = self._visainstrument
+        batch = CommandBatch(resource, max_length)
+        self._visainstrument = batch
+        try:
+            yield batch
+        finally:
+            self._visainstrument = resource
+            try:
+                batch.flush()
+            except Exception:
+                # cached values may have never reached the device
+                self.invalidate_cache()
+                raise
+
+    def flush_batch(self):
+        """
+        Sends the commands collected by batch(), if any, e.g. before
+        accessing the VISA resource of the instrument directly
+        """
+        if isinstance(self._visainstrument, CommandBatch):
+            self._visainstrument.flush()
+
     def set_default_read_var(self, name):
         """
         For future use.
@@ -1143,3 +1243,114 @@ class GPIBInstrument(Instrument):
     def __init__(self, *args, **kwargs):
         kwargs['lockclass'] = 'GPIB'
         Instrument.__init__(self, *args, **kwargs)
+
+
+class DeferredQuery():
+    """
+    Reply to a query deferred in Instrument.batch(), available after the
+    batch is sent
+    """
+
+    def __init__(self, command):
+        self._command = command
+        self._value = None
+        self._resolved = False
+
+    def get_command(self):
+        return self._command
+
+    def get_value(self):
+        if not self._resolved:
+            raise RuntimeError('Query %s is not sent yet' % self._command)
+        return self._value
+
+    def _resolve(self, value):
+        self._value = value
+        self._resolved = True
+
+
+class CommandBatch():
+    """
+    Stands in for the VISA resource of an instrument in Instrument.batch()
+    """
+
+    def __init__(self, resource, max_length=None):
+        self._resource = resource
+        self._max_length = max_length
+        self._commands = []
+        self._queries = []
+
+    def write(self, command):
+        command = self._normalize(command)
+        if self._max_length is not None and self._commands and \
+                len(self._join(self._commands + [command])) > self._max_length:
+            self.flush()
+        self._commands.append(command)
+
+    def query(self, command):
+        """
+        Sends the pending commands and deferred queries with this one
+
+        Output: reply to this query (string)
+        """
+        return self._send(DeferredQuery(self._normalize(command)))
+
+    def defer_query(self, command):
+        """
+        Output: DeferredQuery resolved when the batch is sent
+        """
+        query = DeferredQuery(self._normalize(command))
+        self._queries.append(query)
+        return query
+
+    def flush(self):
+        """
+        Sends the pending commands and deferred queries
+        """
+        self._send()
+
+    def __getattr__(self, name):
+        # read(), query_binary_values(...), timeout, etc. of the resource
+        # must see the pending commands executed
+        if name.startswith("_"):
+            raise AttributeError(name)
+        self.flush()
+        return getattr(self._resource, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            self.flush()
+            setattr(self._resource, name, value)
+
+    def _send(self, query=None):
+        commands, queries = self._commands, self._queries
+        if query is not None:
+            queries = queries + [query]
+        self._commands, self._queries = [], []
+        message = self._join(commands + [query.get_command() for query in queries])
+
+        if not queries:
+            if commands:
+                self._resource.write(message)
+            return None
+
+        replies = self._resource.query(message).strip().split(";")
+        if len(replies) != len(queries):
+            raise ValueError('Expected %d replies to "%s", got "%s"' %
+                             (len(queries), message, ";".join(replies)))
+        for query, reply in zip(queries, replies):
+            query._resolve(reply)
+        return replies[-1]
+
+    @staticmethod
+    def _normalize(command):
+        return command.strip().rstrip(";").strip()
+
+    @staticmethod
+    def _join(commands):
+        # a command after a semicolon is relative to the subsystem of the
+        # previous one unless it starts from the root with a colon
+        return ";".join(command if i == 0 or command.startswith((":", "*"))
+                        else ":" + command for i, command in enumerate(commands))
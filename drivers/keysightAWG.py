@@ -17,6 +17,7 @@
 
 
 from drivers.instrument import Instrument
+from drivers.WaveformCache import WaveformCache
 from numpy import *
 import numpy as np
 import visa
@@ -49,6 +50,9 @@ class KeysightAWG(Instrument):
 
         self._visainstrument.write(":DIG:TRAN:INT 1")
 
+        # hashes of the waveforms in the volatile memory of the channels
+        self._volatile_waveform_keys = {1: None, 2: None}
+
         self.add_parameter('outp1',
                            flags=Instrument.FLAG_GETSET, units='', type=int)
 
@@ -301,11 +305,17 @@ class KeysightAWG(Instrument):
 
         """
         waveform_array = around(waveform_array * 8191).astype(int)
+        key = WaveformCache.make_key(waveform_array)
+        if self._volatile_waveform_keys.get(channel) == key:
+            # already there
+            return
+        self._volatile_waveform_keys[channel] = None
         self._visainstrument.write("*OPC")
         # self._visainstrument.write(":DATA%d VOLATILE, "%channel+array_string)
         self._visainstrument.write_binary_values(":DATA%d:DAC VOLATILE," % channel,
                                                  waveform_array, "h", True)
         self._visainstrument.query("*OPC?")
+        self._volatile_waveform_keys[channel] = key
 
         """Output switches"""
 
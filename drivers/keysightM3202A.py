@@ -4,6 +4,7 @@ https://literature.cdn.keysight.com/litweb/pdf/M3201-90001.pdf?id=2787170
 """
 
 from drivers.instrument import Instrument
+from drivers.WaveformCache import WaveformCache
 
 from drivers.keysightSD1 import SD_AOU, SD_Wave
 from drivers.keysightSD1 import SD_TriggerModes, SD_TriggerExternalSources, SD_TriggerBehaviors, SD_TriggerDirections
@@ -16,6 +17,12 @@ from scipy.interpolate import interp1d
 
 class KeysightM3202A:
     MAX_OUTPUT_VOLTAGE = 1.5  # V
+    # 2 GB of on-board waveform memory, 2 bytes per sample
+    WAVEFORM_MEMORY_POINTS = 1024 ** 3
+    MAX_CACHED_WAVEFORMS = 1024
+    # waveform IDs below are left for the explicitly numbered waveforms,
+    # see load_modulating_waveform(...)
+    FIRST_CACHED_WAVEFORM_ID = 16
 
     def __init__(self, slot, chassis=0, allow_unmatched_waveforms = True):
         '''
@@ -76,6 +83,13 @@ class KeysightM3202A:
 
         self._allow_unmatched_waveforms = allow_unmatched_waveforms
 
+        # waveforms already in the board RAM: content hash -> waveform ID
+        self._waveform_cache = WaveformCache(self.WAVEFORM_MEMORY_POINTS, self.MAX_CACHED_WAVEFORMS)
+        self._free_waveform_ids = []
+        self._next_waveform_id = self.FIRST_CACHED_WAVEFORM_ID
+        # resampled and normalized waveforms: content hash -> (array, normalization)
+        self._resampling_cache = WaveformCache(self.WAVEFORM_MEMORY_POINTS, max_entries=16)
+
         self.clear()  # clear internal memory and AWG queues according to p.67 of the user guide
 
     def _handle_error(self, ret_val):
@@ -108,6 +122,9 @@ class KeysightM3202A:
             # clear ALL: internal memory and AWG queues
             ret = self.module.waveformFlush()
             self._handle_error(ret)
+            self._waveform_cache.clear()
+            self._free_waveform_ids = []
+            self._next_waveform_id = self.FIRST_CACHED_WAVEFORM_ID
 
     def synchronize_channels(self, *channels):
         self.synchronized_channels = channels
@@ -422,32 +439,42 @@ class KeysightM3202A:
         if (round(frequency * (len(waveform))) > 1e9):
             raise Exception("frequency is exceeding AWG sampling rate: 1 GHz")
 
-        duration_initial = 1 / frequency * 1e9 if frequency != 0 else 10.0  # float
-        # interpolating input waveform to the next step
-        # that rescales waveform to fit frequency
-        interpolation_method = "cubic" if frequency != 0 else "linear"
-        old_x = np.linspace(0, duration_initial, len(waveform) + 1)
-        f_wave = interp1d(old_x, np.concatenate((waveform, [waveform[0]])), kind=interpolation_method)
-
-        # in order to satisfy NOTE_1 we simply make 10 subsequent waveforms
-        # but to provide frequency accuracy, we are sampling from
-        # interval 1000 times wider then the original, and we are extending
-        # interpolation function domain using its periodicity
-        # duration = duration_initial*1e4 if duration_initial < 1e2 else 1e6  # here it is
-
-        duration = duration_initial
-        new_x = np.linspace(0, duration, int(np.round(duration / self.get_sample_rate() * 1e9)), endpoint=False)
-
-        # converting domain values in the function domain
-        new_x_converted = np.remainder(new_x, duration_initial)
-        waveform_array = f_wave(new_x_converted)  # obtaining new waveform walues
-
-        normalization = np.max(np.abs(waveform_array))
+        # the same waveform is usually output many times during a sweep, so
+        # the resampling result is reused
+        key = WaveformCache.make_key(np.asarray(waveform, dtype=float), frequency,
+                                     self.get_sample_rate())
+        cached = self._resampling_cache.get(key)
+        if cached is not None:
+            waveform_array, normalization = cached
+        else:
+            duration_initial = 1 / frequency * 1e9 if frequency != 0 else 10.0  # float
+            # interpolating input waveform to the next step
+            # that rescales waveform to fit frequency
+            interpolation_method = "cubic" if frequency != 0 else "linear"
+            old_x = np.linspace(0, duration_initial, len(waveform) + 1)
+            f_wave = interp1d(old_x, np.concatenate((waveform, [waveform[0]])), kind=interpolation_method)
+
+            # in order to satisfy NOTE_1 we simply make 10 subsequent waveforms
+            # but to provide frequency accuracy, we are sampling from
+            # interval 1000 times wider then the original, and we are extending
+            # interpolation function domain using its periodicity
+            # duration = duration_initial*1e4 if duration_initial < 1e2 else 1e6  # here it is
+
+            duration = duration_initial
+            new_x = np.linspace(0, duration, int(np.round(duration / self.get_sample_rate() * 1e9)), endpoint=False)
+
+            # converting domain values in the function domain
+            new_x_converted = np.remainder(new_x, duration_initial)
+            waveform_array = f_wave(new_x_converted)  # obtaining new waveform walues
+
+            normalization = np.max(np.abs(waveform_array))
+            waveform_array /= normalization  # normalize waveform to (-1,1) interval
+            waveform_array.flags.writeable = False
+            self._resampling_cache.put(key, (waveform_array, normalization), len(waveform_array))
 
         if (self.waveshape_types[channel - 1] == SD_Waveshapes.AOU_AWG):
             self.output_voltages[channel - 1] = normalization
 
-        waveform_array /= normalization  # normalize waveform to (-1,1) interval
         self.repetition_frequencies[channel - 1] = frequency
         # waveform_array = np.array(waveform_array, dtype=np.float16, copy=True)
         self._load_array_into_AWG(waveform_array, channel)
@@ -468,12 +495,6 @@ class KeysightM3202A:
         from copy import deepcopy
         waveform_array_normalized = deepcopy(waveform_array_normalized)
         self.waveforms[channel - 1] = waveform_array_normalized
-        self.waveform_ids[channel - 1] = channel
-
-        # creating SD_Wave() object from keysight API
-        wave = SD_Wave()
-        wave.newFromArrayDouble(SD_WaveformTypes.WAVE_ANALOG, waveform_array_normalized)
-        wave_id = channel - 1
 
         # setting function generation waveshape type parameters
         # OFF, direct AWG, SINUSOIDAL, TRIANGULAR and more
@@ -481,13 +502,30 @@ class KeysightM3202A:
         ret = self.module.channelWaveShape(channel - 1, self.waveshape_types[channel - 1])
         self._handle_error(ret)
 
-        # load waveform to board RAM
-        ret = self.module.waveformLoad(wave, wave_id)
-        if (ret == SD_Error.INVALID_OBJECTID):
-            # probably, such wave_id already exists
-            ret = self.module.waveformReLoad(wave, wave_id)
+        # identical waveforms are loaded to board RAM only once
+        key = WaveformCache.make_key(np.asarray(waveform_array_normalized, dtype=float))
+        wave_id = self._waveform_cache.get(key)
+        if wave_id is None:
+            wave_id = self._free_waveform_ids.pop() if len(self._free_waveform_ids) > 0 \
+                else self._allocate_waveform_id()
 
-        self._handle_error(ret)
+            # creating SD_Wave() object from keysight API
+            wave = SD_Wave()
+            wave.newFromArrayDouble(SD_WaveformTypes.WAVE_ANALOG, waveform_array_normalized)
+
+            # load waveform to board RAM
+            ret = self.module.waveformLoad(wave, wave_id)
+            if (ret == SD_Error.INVALID_OBJECTID):
+                # probably, such wave_id already exists
+                ret = self.module.waveformReLoad(wave, wave_id)
+
+            self._handle_error(ret)
+
+            # waveforms queued in other channels are kept
+            evicted = self._waveform_cache.put(key, wave_id, len(waveform_array_normalized),
+                                               protected=set(self.waveform_ids))
+            self._free_waveform_ids += [evicted_id for evicted_key, evicted_id in evicted]
+        self.waveform_ids[channel - 1] = wave_id
 
         # clear channel queue
         self.module.AWGflush(channel - 1)
@@ -506,6 +544,11 @@ class KeysightM3202A:
         ret = self.module.channelAmplitude(channel - 1, self.output_voltages[channel - 1])
         self._handle_error(ret)
 
+    def _allocate_waveform_id(self):
+        wave_id = self._next_waveform_id
+        self._next_waveform_id += 1
+        return wave_id
+
     def _start_AWG(self, channel):
         """
 
@@ -0,0 +1,180 @@
+"""
+Refining sampling of a regular grid of swept parameter values.
+
+The grid is split into cells with the corners on a coarse subgrid. All the
+corners are measured first, then the cells where the data changes most are
+split in halves along every axis and the new corners are measured, and so on,
+until the requested fraction of the grid is measured. The points that are not
+measured are filled by multilinear interpolation over the corners of the
+smallest cell containing them, so the data always looks like a full grid.
+"""
+import heapq
+from itertools import product
+
+import numpy as np
+
+
+class AdaptiveSampler:
+
+    def __init__(self, shape, coarse_step=4, max_fraction=0.3,
+                 cells_per_batch=4, uniform_weight=0.05):
+        """
+        Parameters
+        ----------
+        shape: list of int
+            numbers of values of the swept parameters
+        coarse_step: int
+            step of the initial subgrid in the grid points
+        max_fraction: float
+            the sampling stops when this fraction of the grid is measured
+        cells_per_batch: int
+            how many cells are split at once
+        uniform_weight: float
+            loss of a cell with a flat data relative to a cell with the data
+            changing across the whole range; the larger, the more uniform the
+            sampling is
+        """
+        self._shape = tuple(shape)
+        self._coarse_step = max(1, coarse_step)
+        self._max_fraction = max_fraction
+        self._cells_per_batch = cells_per_batch
+        self._uniform_weight = uniform_weight
+        self._measured = np.zeros(self._shape, dtype=bool)
+        self._cells = []  # heap of (-loss, lo, hi)
+        self._leaves = []  # cells that will not be split anymore
+
+    def get_measured_mask(self):
+        """
+        Boolean mask of the points that were actually measured, updated in
+        place during the sampling
+        """
+        return self._measured
+
+    def get_max_points_number(self):
+        size = int(np.prod(self._shape))
+        return min(size, max(int(np.ceil(self._max_fraction * size)),
+                             int(np.prod([len(self._axis_breakpoints(axis_size))
+                                          for axis_size in self._shape]))))
+
+    def batches(self, get_data):
+        """
+        Generates the points to measure.
+
+        Parameters
+        ----------
+        get_data: callable
+            returns the data array with the first axes corresponding to the
+            grid, the points of the previously yielded batches have to be
+            there by the time the next batch is requested
+
+        Yields
+        ------
+        numpy.ndarray of int, shape (points number, parameters number)
+            indices of the points to measure
+        """
+        points = self._initial_points()
+        yield points
+        self._measured[tuple(points.T)] = True
+        points_number = int(self._measured.sum())
+
+        data = get_data()
+        self._scale = max(np.ptp(np.abs(data[self._measured])), np.finfo(float).tiny)
+        # an axis with a single value spans a degenerate (0, 0) interval
+        spans = [list(zip(axis_breakpoints[:-1], axis_breakpoints[1:])) or [(0, 0)]
+                 for axis_breakpoints in (self._axis_breakpoints(size) for size in self._shape)]
+        for cell_spans in product(*spans):
+            lo, hi = np.array(cell_spans, dtype=int).T
+            self._push_cell(lo, hi, data)
+        self.fill(data)
+
+        max_points_number = self.get_max_points_number()
+        while len(self._cells) > 0 and points_number < max_points_number:
+            split_cells = [heapq.heappop(self._cells)[1:]
+                           for _ in range(min(self._cells_per_batch, len(self._cells)))]
+            children = [child for lo, hi in split_cells
+                        for child in self._split(np.array(lo), np.array(hi))]
+            # the corners of the cells with the largest loss go first, so
+            # that the last batch is cut at the maximum points number
+            points = list(dict.fromkeys(point for lo, hi in children
+                                        for point in sorted(self._corners(lo, hi))
+                                        if not self._measured[point]))
+            points = np.array(sorted(points[:max_points_number - points_number]), dtype=int)
+            if len(points) > 0:
+                yield points
+                self._measured[tuple(points.T)] = True
+                points_number += len(points)
+
+            data = get_data()
+            for lo, hi in children:
+                self._push_cell(lo, hi, data)
+            # only the split cells have new corners, the rest of the grid
+            # keeps its interpolation
+            self._fill_cells(children, data)
+
+        self._leaves += [(np.array(lo), np.array(hi)) for _, lo, hi in self._cells]
+        self._cells = []
+        self.fill(get_data())
+
+    def fill(self, data):
+        """
+        Interpolates the data in the points that were not measured, in place
+        """
+        self._fill_cells(self._leaves + [(np.array(lo), np.array(hi)) for _, lo, hi in self._cells],
+                         data)
+
+    def _fill_cells(self, cells, data):
+        for lo, hi in cells:
+            block = tuple(slice(lo_k, hi_k + 1) for lo_k, hi_k in zip(lo, hi))
+            block_shape = tuple(hi - lo + 1)
+            if self._measured[block].all():
+                continue
+            corners = self._corners(lo, hi)
+            interpolated = np.zeros(block_shape + data.shape[len(self._shape):], dtype=data.dtype)
+            for corner in corners:
+                weight = np.ones(block_shape)
+                for axis, (lo_k, hi_k) in enumerate(zip(lo, hi)):
+                    if hi_k == lo_k:
+                        continue
+                    t = np.arange(hi_k - lo_k + 1) / (hi_k - lo_k)
+                    axis_weight = t if corner[axis] == hi_k else 1 - t
+                    weight = weight * axis_weight.reshape([-1 if k == axis else 1
+                                                           for k in range(len(lo))])
+                weight = weight.reshape(block_shape + (1,) * (data.ndim - len(self._shape)))
+                interpolated += weight * data[corner]
+            not_measured = ~self._measured[block]
+            data[block][not_measured] = interpolated[not_measured]
+
+    def _axis_breakpoints(self, size):
+        breakpoints = list(range(0, size, self._coarse_step))
+        if breakpoints[-1] != size - 1:
+            breakpoints.append(size - 1)
+        return np.array(breakpoints, dtype=int)
+
+    def _initial_points(self):
+        breakpoints = [self._axis_breakpoints(size) for size in self._shape]
+        return np.array(list(product(*breakpoints)), dtype=int).reshape(-1, len(self._shape))
+
+    @staticmethod
+    def _corners(lo, hi):
+        return list(set(product(*[(int(lo_k), int(hi_k)) for lo_k, hi_k in zip(lo, hi)])))
+
+    @staticmethod
+    def _split(lo, hi):
+        mid = (lo + hi) // 2
+        axes_bounds = [[(lo_k, mid_k), (mid_k, hi_k)] if hi_k - lo_k > 1 else [(lo_k, hi_k)]
+                       for lo_k, mid_k, hi_k in zip(lo, mid, hi)]
+        return [(np.array([bounds[0] for bounds in child], dtype=int),
+                 np.array([bounds[1] for bounds in child], dtype=int))
+                for child in product(*axes_bounds)]
+
+    def _push_cell(self, lo, hi, data):
+        if np.all(hi - lo <= 1):
+            self._leaves.append((lo, hi))
+            return
+        corners_data = np.array([data[corner] for corner in self._corners(lo, hi)])
+        # largest deviation of the corners from their mean, relative to the
+        # data range, stands for the gradient and the curvature inside the cell
+        deviation = np.max(np.abs(corners_data - corners_data.mean(axis=0))) / self._scale
+        extent = np.mean((hi - lo) / np.maximum(np.array(self._shape) - 1, 1))
+        loss = extent * (deviation + self._uniform_weight)
+        heapq.heappush(self._cells, (-loss, tuple(lo), tuple(hi)))
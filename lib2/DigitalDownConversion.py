@@ -0,0 +1,90 @@
+"""
+Demodulation of digitized IQ traces at given intermediate frequencies.
+
+Instead of computing the full spectrum of a trace to pick a single bin, the
+trace is multiplied by a complex reference oscillating at the frequency of
+interest and integrated:
+
+    S(f) = sum_n w_n (I_n + 1j Q_n) exp(-2j pi f n / sample_rate) / sum_n w_n
+
+which is O(N) per tone. The references are cached, so repeated traces of the
+same length only cost the dot products.
+"""
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+
+def demodulate(data_i, data_q, sample_rate, frequencies, window=None, bin_centered=False):
+    """
+    Parameters
+    ----------
+    data_i, data_q: numpy.ndarray, shape (..., N)
+        I and Q quadratures of the traces, the last axis is time; data_q may
+        be None for a real signal
+    sample_rate: float, Hz
+    frequencies: float or sequence of float, Hz
+        frequencies to demodulate at, negative for the left sideband
+    window: str or tuple
+        window applied to the trace before the integration, see
+        scipy.signal.get_window(...); rectangular if None
+    bin_centered: bool
+        if True, every frequency is replaced by the nearest frequency of the
+        N-point DFT, so the result coincides with the corresponding bin of
+        numpy.fft.fft(data_i + 1j * data_q) / N (for no window)
+
+    Returns
+    -------
+    complex or numpy.ndarray of complex, shape (..., number of frequencies)
+        complex amplitudes of the tones
+    """
+    single_tone = np.ndim(frequencies) == 0
+    frequencies = tuple(float(frequency) for frequency in np.atleast_1d(frequencies))
+    n_samples = np.shape(data_i)[-1]
+    cos_ref, sin_ref = reference(n_samples, float(sample_rate), frequencies,
+                                 window, bin_centered)
+
+    # (I + jQ)(cos - j sin) without complex temporaries of the trace size
+    real = np.dot(data_i, cos_ref.T)
+    imag = -np.dot(data_i, sin_ref.T)
+    if data_q is not None:
+        real += np.dot(data_q, sin_ref.T)
+        imag += np.dot(data_q, cos_ref.T)
+    result = real + 1j * imag
+    return result[..., 0] if single_tone else result
+
+
+@lru_cache(maxsize=16)
+def reference(n_samples, sample_rate, frequencies, window=None, bin_centered=False):
+    """
+    Weighted reference oscillations for demodulate(...)
+
+    Returns
+    -------
+    cos_ref, sin_ref: numpy.ndarray, shape (number of frequencies, n_samples)
+        read-only arrays of w_n cos(2 pi f n / sample_rate) / sum_n w_n and the
+        same with sin
+    """
+    samples = np.arange(n_samples)
+    if bin_centered:
+        # the bins of the fftshift'ed DFT are -(N // 2) ... (N - 1) // 2
+        bins = np.ceil(np.array(frequencies) * n_samples / sample_rate - 0.5)
+        bins = np.clip(bins, -(n_samples // 2), (n_samples - 1) // 2).astype(np.int64)
+        # integer arithmetic keeps the phase exact for long traces
+        phases = 2 * np.pi * (np.outer(bins, samples) % n_samples) / n_samples
+    else:
+        cycles = np.outer(np.array(frequencies) / sample_rate, samples)
+        phases = 2 * np.pi * (cycles - np.floor(cycles))
+
+    if window is None:
+        weights = np.full(n_samples, 1 / n_samples)
+    else:
+        weights = signal.get_window(window, n_samples, fftbins=False)
+        weights = weights / np.sum(weights)
+
+    cos_ref = np.cos(phases) * weights
+    sin_ref = np.sin(phases) * weights
+    cos_ref.flags.writeable = False
+    sin_ref.flags.writeable = False
+    return cos_ref, sin_ref
@@ -8,7 +8,55 @@ from matplotlib import pyplot as plt, colorbar
 
 from scipy import optimize
 from numpy.linalg import cholesky
-from tqdm import tqdm_notebook
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _likelihood_and_gradient(x, operators, values):
+    """
+    Tomo.likelihood(...) and its gradient over x
+
+    Parameters
+    ----------
+    operators: array of shape (number of measurements, dim, dim)
+        measurement operators
+    values: array of shape (number of measurements,)
+        measured expected values
+    """
+    dim = operators.shape[1]
+    t = _x_to_cholesky_factor(x, dim)
+    s = t.conj().T @ t
+    trace = np.trace(s).real
+    expectations = np.einsum("mij,ji->m", operators, s) / trace
+    residuals = expectations - values
+    likelihood = np.sum(np.abs(residuals) ** 2)
+
+    # d likelihood = 2 Re tr(g ds) for the unnormalized s = t^+ t
+    g = (np.einsum("m,mij->ij", residuals.conj(), operators) -
+         np.dot(residuals.conj(), expectations) * np.identity(dim)) / trace
+    # ...= 2 Re sum(w * dt)
+    w = (t @ g).conj() + (g @ t.conj().T).T
+
+    gradient = np.empty_like(x)
+    gradient[:dim] = 2 * np.diagonal(w).real * np.sign(x[:dim])
+    rows, columns = np.triu_indices(dim, 1)
+    gradient[dim::2] = 2 * w[rows, columns].real
+    gradient[dim + 1::2] = -2 * w[rows, columns].imag
+    return likelihood, gradient
+
+
+def _x_to_cholesky_factor(x, dim):
+    """
+    Upper triangular t of Tomo.x_to_rho(...) as an array
+    """
+    t = np.zeros((dim, dim), complex)
+    t[np.diag_indices(dim)] = np.abs(x[:dim])
+    t[np.triu_indices(dim, 1)] = x[dim::2] + 1j * x[dim + 1::2]
+    return t
+
+
+def _minimize_likelihood(x0, operators, values):
+    return optimize.minimize(_likelihood_and_gradient, x0, args=(operators, values),
+                             jac=True, method="L-BFGS-B")
 
 
 class Tomo:
@@ -34,6 +82,8 @@ class Tomo:
         self._local_rotations = []
         self._measurement_operators = []
         self._measurements = []
+        # (measurements, operators, values), see _get_stacked_measurements()
+        self._stacked_measurements = None
 
     @staticmethod
     def x_to_rho(x):                                # Density matrix parametrization via Choletsky decomposition
@@ -124,28 +174,57 @@ class Tomo:
         """
         self._measurements = meas
 
+    def _get_stacked_measurements(self):
+        """
+        Returns
+        -------
+        operators: array of shape (number of measurements, dim, dim)
+            all the measurement operators of self._measurements (rotated)
+        values: array of shape (number of measurements,)
+            the corresponding measured expected values
+        """
+        if self._stacked_measurements is None or \
+                self._stacked_measurements[0] is not self._measurements:
+            pairs = [pair for meas_op_results in self._measurements for pair in meas_op_results]
+            operators = np.array([op.full() if isinstance(op, Qobj) else op for op, ex in pairs],
+                                 dtype=complex)
+            values = np.array([ex for op, ex in pairs], dtype=complex)
+            self._stacked_measurements = (self._measurements, operators, values)
+        return self._stacked_measurements[1:]
+
     def likelihood(self, x):                        # Вычисление Likelihood по загруженным измерениям \
-        rho = self.x_to_rho(x)                      # для матрицы плотности заданной через x
-        lh = 0
-        for meas_op_results in self._measurements: # summing among different measurable operators
-            for (op, ex) in meas_op_results:  # summing through tomography rotations
-                lh += np.abs(expect(rho, op) - ex) ** 2
-        return lh
-
-    def find_rho(self, averages=30, x0=None): # Минимизации Likelihood
-        x0_passed = deepcopy(x0)
-        for n in tqdm_notebook(range(averages), desc='Tomography: Likelihood minimization', ncols=700):
-            if x0_passed is None:
-                x0 = np.random.rand(self._dim ** 2) * 2 - 1
-            else:
-                x0 = x0_passed + 0.1*(np.random.rand(self._dim ** 2) * 2 - 1)
-            new = optimize.minimize(self.likelihood, x0, method='Nelder-Mead')
-            if n == 0:
-                best = new
-            else:
-                if new.fun < best.fun:
-                    best = new
-            print("\r" + str(self.likelihood(best.x)), end="", flush=True)
+        return _likelihood_and_gradient(x, *self._get_stacked_measurements())[0]
+
+    def find_rho(self, averages=30, x0=None, n_workers=0): # Минимизации Likelihood
+        """
+        Minimizes the likelihood with L-BFGS from several starting points
+        and returns the best density matrix
+
+        Parameters
+        ----------
+        averages: int
+            number of starting points, random or scattered around x0
+        x0: array
+            parameters of the expected density matrix, see rho_to_x(...)
+        n_workers: int
+            number of processes sharing the starting points, 0 to minimize
+            in this process
+        """
+        if x0 is None:
+            x0s = np.random.rand(averages, self._dim ** 2) * 2 - 1
+        else:
+            x0s = x0 + 0.1 * (np.random.rand(averages, self._dim ** 2) * 2 - 1)
+        operators, values = self._get_stacked_measurements()
+
+        if n_workers > 0:
+            with ProcessPoolExecutor(n_workers) as executor:
+                results = list(executor.map(_minimize_likelihood, x0s,
+                                            [operators] * averages, [values] * averages))
+        else:
+            results = [_minimize_likelihood(x0, operators, values) for x0 in x0s]
+
+        best = min(results, key=lambda result: result.fun)
+        print("\r" + str(best.fun), end="", flush=True)
         return self.x_to_rho(best.x)
 
 class DispersiveJointTomography(VNATimeResolvedDispersiveMeasurement):
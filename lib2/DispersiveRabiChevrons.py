@@ -1,4 +1,5 @@
 from lib2.VNATimeResolvedDispersiveMeasurement2D import *
+from lib2.DispersiveRabiOscillations import DispersiveRabiOscillationsResult
 
 
 class DispersiveRabiChevrons(VNATimeResolvedDispersiveMeasurement2D):
@@ -43,6 +44,10 @@ class DispersiveRabiChevrons(VNATimeResolvedDispersiveMeasurement2D):
 
 
 class DispersiveRabiChevronsResult(VNATimeResolvedDispersiveMeasurement2DResult):
+
+    _trace_result_class = DispersiveRabiOscillationsResult
+    _trace_parameter_name = "excitation_duration"
+
     def __init__(self, name, sample_name):
         self._if_shift = None
         super().__init__(name, sample_name)
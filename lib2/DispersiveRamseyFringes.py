@@ -1,5 +1,6 @@
 from matplotlib import pyplot as plt, colorbar
 from lib2.VNATimeResolvedDispersiveMeasurement2D import *
+from lib2.DispersiveRamsey import DispersiveRamseyResult
 
 
 class DispersiveRamseyFringes(VNATimeResolvedDispersiveMeasurement2D):
@@ -32,6 +33,9 @@ class DispersiveRamseyFringes(VNATimeResolvedDispersiveMeasurement2D):
 
 class DispersiveRamseyFringesResult(VNATimeResolvedDispersiveMeasurement2DResult):
 
+    _trace_result_class = DispersiveRamseyResult
+    _trace_parameter_name = "ramsey_delay"
+
     def _prepare_data_for_plot(self, data):
         return data["excitation_frequency"] / 1e9, \
                data["ramsey_delay"] / 1e3, \
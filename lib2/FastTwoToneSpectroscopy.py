@@ -18,13 +18,9 @@ class FastFluxTwoToneSpectroscopy(FastTwoToneSpectroscopyBase):
                                      detect_resonator=True if flux_control_parameter is not None else False)
 
     def set_swept_parameters(self, flux_parameter_values):
-        setter = self._adaptive_setter if self._adaptive else self._triggering_setter
+        setter = self._adaptive_setter if self._adaptive else self._flux_parameter_setter
         swept_pars = {self._parameter_name: [setter, flux_parameter_values]}
-        super().set_swept_parameters(**swept_pars)
-
-    def _triggering_setter(self, value):
-        self._flux_parameter_setter(value)
-        self._mw_src[0].send_sweep_trigger()  # telling mw_src to be ready to start
+        self._set_swept_parameters(**swept_pars)
 
     def _adaptive_setter(self, value):
         self._flux_parameter_setter(value)
@@ -54,7 +50,6 @@ class FastFluxTwoToneSpectroscopy(FastTwoToneSpectroscopyBase):
         self._mw_src[0].set_output_state("ON")
         vna_parameters["freq_limits"] = (res_freq, res_freq)
         self._vna[0].set_parameters(vna_parameters)  # set new freq_limits
-        self._mw_src[0].send_sweep_trigger()  # telling mw_src to be ready to start
 
 
 class FastPowerTwoToneSpectroscopy(FastTwoToneSpectroscopyBase):
@@ -71,12 +66,8 @@ class FastPowerTwoToneSpectroscopy(FastTwoToneSpectroscopyBase):
                                      flux_control_parameter=flux_control_parameter)
 
     def set_swept_parameters(self, power_values):
-        swept_pars = {'Power [dBm]': [self._triggering_setter, power_values]}
-        super().set_swept_parameters(**swept_pars)
-
-    def _triggering_setter(self, value):
-        self._mw_src[0].set_power(value)
-        self._mw_src[0].send_sweep_trigger()  # telling mw_src to be ready to start
+        swept_pars = {'Power [dBm]': [self._mw_src[0].set_power, power_values]}
+        self._set_swept_parameters(**swept_pars)
 
 
 class FastAcStarkTwoToneSpectroscopy(FastTwoToneSpectroscopyBase):
@@ -93,7 +84,7 @@ class FastAcStarkTwoToneSpectroscopy(FastTwoToneSpectroscopyBase):
 
     def set_swept_parameters(self, readout_powers):
         swept_pars = {'Readout power [dBm]': [self._adaptive_setter, readout_powers]}
-        super().set_swept_parameters(**swept_pars)
+        self._set_swept_parameters(**swept_pars)
 
     def _adaptive_setter(self, power):
         powers = self._swept_pars["Readout power [dBm]"][1]
@@ -132,4 +123,3 @@ class FastAcStarkTwoToneSpectroscopy(FastTwoToneSpectroscopyBase):
         vna_parameters["freq_limits"] = (res_freq, res_freq)
 
         self._vna[0].set_parameters(vna_parameters)
-        self._mw_src[0].send_sweep_trigger()  # telling mw_src to start
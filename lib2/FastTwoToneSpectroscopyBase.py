@@ -33,22 +33,10 @@ class FastTwoToneSpectroscopyBase(Measurement):
         self._last_resonator_result = None
         self._frequencies = None
         self._resonator_area = None
-        # frequencies are no longer in self._swept_pars
-        # sweep over frequencies is provided automatically through
-        # trigger settings of the mw_src -> there is no need to call
-        # mw_src.set_frequency() setter and cycle through frequency parameters
-        # in Measurement._record_data()
-        # but it is still swept parameter in some sense.
-        # TODO: I propose following solution
-        # We should implement the following mechanics:
-        # Whenever this happens: some parameters are swept automatically and they are part of the
-        # visualization process.
-        #  We should just modify Measurement._record_data() in order to
-        # be able to determine such situation and skip cycling through this parameters,
-        # maybe by some additional parameter like swept_automatically=["par_name1",...,"par_nameN"]
-        # or maybe by implementing trigger interface in all device classes that could be triggered by
-        # external hardware signal and those who can trigger other devices. This is simple class with 2
-        # attributes at most. The deal is to verify a consistency of the idea before starting actual coding
+        # frequencies are swept by the mw_src itself: it steps its frequency
+        # list on every VNA point trigger, so they are passed as hardware swept
+        # parameter to Measurement.set_swept_parameters(...), see
+        # _set_swept_parameters(...)
         self._flux_control_type = flux_control_type
         if flux_control_type is FluxControlType.CURRENT:
             self._flux_parameter_setter = self._current_src[0].set_current
@@ -100,10 +88,12 @@ class FastTwoToneSpectroscopyBase(Measurement):
 
         super().set_fixed_parameters(vna=dev_params['vna'], mw_src=dev_params['mw_src'])
 
-    def _prepare_measurement_result_data(self, parameter_names, parameters_values):
-        measurement_data = super()._prepare_measurement_result_data(parameter_names, parameters_values)
-        measurement_data["Frequency [Hz]"] = self._frequencies
-        return measurement_data
+    def _set_swept_parameters(self, **swept_pars):
+        hardware_swept_pars = {"Frequency [Hz]": (self._arm_mw_src_sweep, self._frequencies)}
+        super().set_swept_parameters(hardware_swept_pars, **swept_pars)
+
+    def _arm_mw_src_sweep(self):
+        self._mw_src[0].send_sweep_trigger()  # telling mw_src to be ready to start
 
     def _detect_resonator(self, vna_parameters, plot=True):
         parameters = {"nop": vna_parameters["resonator_detection_nop"],
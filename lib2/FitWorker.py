@@ -0,0 +1,69 @@
+"""
+Fitting of the live data outside of the plotting thread.
+
+The plotting thread only requests a fit when the data has changed and draws
+the last fit available; the fit itself runs in a daemon thread. The requests
+made while a fit is running are merged into one, so the fits never queue up
+behind the data.
+"""
+from threading import Condition, Thread
+
+
+class FitWorker:
+
+    # the thread exits after waiting this long for a request, s
+    IDLE_TIMEOUT = 10
+
+    def __init__(self, fit):
+        """
+        Parameters
+        ----------
+        fit: callable
+            fit(), fits the newest data and stores the result
+        """
+        self._fit = fit
+        self._condition = Condition()
+        self._requested = False
+        self._busy = False
+        self._thread = None
+
+    def request(self):
+        """
+        Asks for a fit of the newest data without waiting for it
+        """
+        with self._condition:
+            self._requested = True
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """
+        Waits until the requested fits are done
+
+        Returns
+        -------
+        bool
+            False if the timeout has expired
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._requested and not self._busy,
+                                            timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(lambda: self._requested, self.IDLE_TIMEOUT):
+                    self._thread = None
+                    return
+                self._requested = False
+                self._busy = True
+            try:
+                self._fit()
+            except Exception as e:
+                print("FitWorker: fit failed:", e)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
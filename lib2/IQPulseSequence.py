@@ -8,12 +8,17 @@ from scipy import signal
 from lib.iq_mixer_calibration import IQCalibrationData
 
 from itertools import cycle, islice
+from functools import lru_cache, partial
 
 from typing import Dict, List
 
 
 class PulseSequence():
     def __init__(self, waveform_resolution):
+        # pulses are stored as arrays or as functions computing them and are
+        # rendered into one waveform only when it is requested
+        self._segments = []
+        self._n_points = 0
         self._waveform = np.empty(0)
         # signal interpreted as having this resolution in ns
         # then AWG tries it best to output this signal with the resolution involved
@@ -22,41 +27,166 @@ class PulseSequence():
 
     def append_pulse(self, points):
         if len(points) > 1:
-            self._waveform = concatenate((self._waveform, points))
+            self._segments.append(points)
+            self._n_points += len(points)
+            self._waveform = None
         else:
             # We ingore pulses of zero length
             return
 
+    def append_lazy_pulse(self, n_points, render):
+        """
+        Appends a pulse of n_points that will be computed by render() when
+        the waveform is requested
+        """
+        if n_points > 1:
+            self._segments.append(render)
+            self._n_points += n_points
+            self._waveform = None
+
+    def _set_waveform(self, waveform):
+        self._segments = [waveform]
+        self._n_points = len(waveform)
+        self._waveform = waveform
+
     def __add__(self, other):
-        copy = deepcopy(self)
-        copy._waveform = np.concatenate((copy._waveform[:-1], other._waveform))
-        return copy
+        result = PulseSequence(self._waveform_resolution)
+        result._set_waveform(np.concatenate((self.get_waveform()[:-1], other.get_waveform())))
+        return result
 
     def direct_add(self, another):
-        copy = deepcopy(self)
+        result = PulseSequence(self._waveform_resolution)
         try:
-            copy._waveform = self._waveform + another._waveform
-            return copy
+            result._set_waveform(self.get_waveform() + another.get_waveform())
+            return result
         except Exception as e:
             print("Direct summation is not possible:", e)
-            print(self._waveform.shape,another._waveform.shape)
+            print(self.get_waveform().shape, another.get_waveform().shape)
             raise e
 
     def total_points(self):
-        return len(self._waveform)
+        return self._n_points
 
     def get_duration(self):
         return self._waveform_resolution * self.total_points()
 
+    def render(self):
+        """
+        Computes the waveform from the pulses into a single array
+        """
+        if self._waveform is not None:
+            return
+        segments = [np.asarray(segment() if callable(segment) else segment)
+                    for segment in self._segments]
+        dtype = np.empty(0).dtype
+        for segment in segments:
+            dtype = np.promote_types(dtype, segment.dtype)
+        waveform = np.empty(self._n_points, dtype=dtype)
+        start = 0
+        for segment in segments:
+            waveform[start:start + len(segment)] = segment
+            start += len(segment)
+        self._segments = [waveform]
+        self._waveform = waveform
+
     def get_waveform(self):
+        self.render()
         return self._waveform
 
     def get_waveform_resolution(self):
         return self._waveform_resolution
 
     def plot(self, **kwargs):
-        times = linspace(0, self.get_duration(), len(self._waveform))
-        plt.plot(times, self._waveform, **kwargs)
+        waveform = self.get_waveform()
+        times = linspace(0, self.get_duration(), len(waveform))
+        plt.plot(times, waveform, **kwargs)
+
+
+@lru_cache(maxsize=256)
+def _pulse_time_points(N_time_steps, waveform_resolution):
+    duration = N_time_steps * waveform_resolution
+    # divide duration into N_time_steps intervals
+    points = linspace(0, duration, N_time_steps, endpoint=False)
+    points.flags.writeable = False
+    return points
+
+
+@lru_cache(maxsize=256)
+def _pulse_window(window, N_time_steps, waveform_resolution, window_parameter):
+    """
+    Returns the modulating window of a sine pulse and its time derivative,
+    see IQPulseBuilder.add_sine_pulse(...). The arrays are shared and read-only
+    """
+    duration = N_time_steps * waveform_resolution
+    points = _pulse_time_points(N_time_steps, waveform_resolution)
+
+    def rectangular():
+        return ones_like(points), zeros_like(points)
+
+    def gaussian():
+        B = exp(-(duration / 2) ** 2 / 2 / (duration / 3) ** 2)
+        window = (exp(-(points - duration / 2) ** 2 / 2 / (duration / 3) ** 2) - B) / (1 - B)
+        if (N_time_steps > 0):
+            derivative = gradient(window, waveform_resolution)
+            derivative[0] = derivative[-1] = 0
+        else:
+            derivative = 0
+        return window, derivative
+
+    def hahn():
+        window = sin(pi * linspace(0, N_time_steps, N_time_steps, endpoint=False) / N_time_steps) ** 2
+        if N_time_steps > 0:
+            derivative = gradient(window, waveform_resolution)
+            derivative[0] = derivative[-1] = 0
+        else:
+            derivative = 0
+        return window, derivative
+
+    def tukey():
+        # https://docs.scipy.org/doc/scipy-1.0.0/reference/generated/scipy.signal.tukey.html
+        window = signal.tukey(N_time_steps, alpha=window_parameter)
+        if N_time_steps > 1:
+            derivative = gradient(window, waveform_resolution)
+            derivative[0] = derivative[-1] = 0
+        else:
+            derivative = 0
+        return window, derivative
+
+    def kaiser():
+        # https://docs.scipy.org/doc/scipy-1.0.0/reference/generated/scipy.signal.kaiser.html
+        window = signal.kaiser(N_time_steps, beta=window_parameter)
+        if N_time_steps > 0:
+            derivative = gradient(window, waveform_resolution)
+            derivative[0] = derivative[-1] = 0
+        else:
+            derivative = 0
+        return window, derivative
+
+    windows = {"rectangular": rectangular, "gaussian": gaussian, "hahn": hahn, "tukey": tukey, "kaiser": kaiser}
+    window, derivative = windows[window]()
+    for array in (window, derivative):
+        if isinstance(array, ndarray):
+            array.flags.writeable = False
+    return window, derivative
+
+
+def _sine_pulse_waveform(N_time_steps, waveform_resolution, frequency, if_phase, phase,
+                         if_amplitude, if_offset, window, window_parameter, hd_amplitude):
+    """
+    One quadrature of the pulse added by IQPulseBuilder.add_sine_pulse(...);
+    if_phase is None for the quadrature without the IF phase shift
+    """
+    points = _pulse_time_points(N_time_steps, waveform_resolution)
+    if if_phase is None:
+        carrier = if_amplitude * exp(1j * (frequency * points + phase))
+    else:
+        carrier = if_amplitude * exp(1j * (frequency * points + if_phase + phase))
+
+    window, derivative = _pulse_window(window, N_time_steps, waveform_resolution, window_parameter)
+
+    hd_correction = - derivative * hd_amplitude / 2 / (-2 * pi * 0.2)  # anharmonicity
+    carrier = window * real(carrier) + hd_correction * imag(carrier)
+    return carrier + if_offset
 
 
 class IQPulseSequence():
@@ -353,66 +483,19 @@ class IQPulseBuilder():
 
         N_time_steps = int(np.round(duration / self._waveform_resolution))
 
-        duration = N_time_steps * self._waveform_resolution
-
         phase += self._pulse_seq_I.total_points() * self._waveform_resolution * frequency
-        points = linspace(0, duration, N_time_steps, endpoint=False)  # divide duration into N_time_steps intervals
-        carrier_I = if_amp1 * exp(1j * (frequency * points + if_phase + phase))
-        carrier_Q = if_amp2 * exp(1j * (frequency * points + phase))
-
-        # print(real(carrier_Q)
-
-        def rectangular():
-            return ones_like(points), zeros_like(points)
-
-        def gaussian():
-            B = exp(-(duration / 2) ** 2 / 2 / (duration / 3) ** 2)
-            window = (exp(-(points - duration / 2) ** 2 / 2 / (duration / 3) ** 2) - B) / (1 - B)
-            if (N_time_steps > 0):
-                derivative = gradient(window, self._waveform_resolution)
-                derivative[0] = derivative[-1] = 0
-            else:
-                derivative = 0
-            return window, derivative
-
-        def hahn():
-            window = sin(pi * linspace(0, N_time_steps, N_time_steps, endpoint=False) / N_time_steps) ** 2
-            if N_time_steps > 0:
-                derivative = gradient(window, self._waveform_resolution)
-                derivative[0] = derivative[-1] = 0
-            else:
-                derivative = 0
-            return window, derivative
-
-        def tukey():
-            # https://docs.scipy.org/doc/scipy-1.0.0/reference/generated/scipy.signal.tukey.html
-            window = signal.tukey(N_time_steps, alpha=window_parameter)
-            if N_time_steps > 1:
-                derivative = gradient(window, self._waveform_resolution)
-                derivative[0] = derivative[-1] = 0
-            else:
-                derivative = 0
-            return window, derivative
-
-        def kaiser():
-            # https://docs.scipy.org/doc/scipy-1.0.0/reference/generated/scipy.signal.kaiser.html
-            window = signal.kaiser(N_time_steps, beta=window_parameter)
-            if N_time_steps > 0:
-                derivative = gradient(window, self._waveform_resolution)
-                derivative[0] = derivative[-1] = 0
-            else:
-                derivative = 0
-            return window, derivative
-
-        windows = {"rectangular": rectangular, "gaussian": gaussian, "hahn": hahn, "tukey": tukey, "kaiser": kaiser}
-        window, derivative = windows[window]()
-
-        hd_correction = - derivative * hd_amplitude / 2 / (-2 * pi * 0.2)  # anharmonicity
-        carrier_I = window * real(carrier_I) + hd_correction * imag(carrier_I)
-        carrier_Q = window * real(carrier_Q) + hd_correction * imag(carrier_Q)
-
-        self._pulse_seq_I.append_pulse(carrier_I + if_offs1)
-        self._pulse_seq_Q.append_pulse(carrier_Q + if_offs2)
+        window_parameter = window_parameter if window in ("tukey", "kaiser") else None
+        if N_time_steps > 1:
+            # the window is cached, so errors in its parameters show up here
+            _pulse_window(window, N_time_steps, self._waveform_resolution, window_parameter)
+
+        # the pulse is computed when the sequence waveform is requested
+        self._pulse_seq_I.append_lazy_pulse(N_time_steps, partial(
+            _sine_pulse_waveform, N_time_steps, self._waveform_resolution, frequency,
+            if_phase, phase, if_amp1, if_offs1, window, window_parameter, hd_amplitude))
+        self._pulse_seq_Q.append_lazy_pulse(N_time_steps, partial(
+            _sine_pulse_waveform, N_time_steps, self._waveform_resolution, frequency,
+            None, phase, if_amp2, if_offs2, window, window_parameter, hd_amplitude))
         return self
 
     def add_sine_pulse_from_string(self, pulse_string, pulse_duration,
@@ -518,6 +601,8 @@ class IQPulseBuilder():
         Returns the IQ sequence containing I and Q pulse sequences and the total
         duration of the pulse sequence in ns
         """
+        self._pulse_seq_I.render()
+        self._pulse_seq_Q.render()
         to_return = IQPulseSequence(self._pulse_seq_I, self._pulse_seq_Q)
         self._pulse_seq_I = PulseSequence(self._waveform_resolution)
         self._pulse_seq_Q = PulseSequence(self._waveform_resolution)
@@ -2,9 +2,9 @@ import pyvisa
 from matplotlib._pylab_helpers import Gcf
 from matplotlib import pyplot as plt
 
-from itertools import product
 from functools import reduce
 from operator import mul
+import os
 import sys
 import numpy as np
 from numpy import zeros, complex_, ptp
@@ -12,9 +12,13 @@ from numpy import zeros, complex_, ptp
 from drivers import *
 from datetime import datetime as dt
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from typing import Dict, Tuple, List
 
-from lib2.MeasurementResult import MeasurementResult
+from lib2.MeasurementResult import MeasurementResult, find
+from lib2 import ResultStorage
+from lib2.AdaptiveSampler import AdaptiveSampler
 from lib2.ResonatorDetector import ResonatorDetector
 from lib2.ExperimentParameters import GlobalParameters, ResonatorType
 
@@ -69,6 +73,10 @@ class Measurement:
          'k6220': [["k6220"], [k6220, "K6220"]]
          }
 
+    # The IQ AWGs of the qubit drive are loaded after the local oscillator
+    # (see set_parameter_loading(...)), since they upconvert its frequency
+    _default_loading_dependencies = {"q_awg": ["q_lo"], "q_iqawg": ["q_lo"]}
+
     def __init__(self, name, sample_name, devs_aliases_map, plot_update_interval=5):
         """
         Constructor creates variables for devices passed to it and initialises all devices.
@@ -124,12 +132,27 @@ class Measurement:
         self._name = name
         self._sample_name = sample_name
         self._plot_update_interval = plot_update_interval
+        self._progress_update_interval = 0.5  # seconds between progress prints
+        self._pipeline_workers = 0  # see set_pipelining(...)
+        self._parallel_loading = False  # see set_parameter_loading(...)
+        self._loading_dependencies = dict(self._default_loading_dependencies)
+        self._sweep_order = "raster"  # see set_sweep_order(...)
+        self._parameter_costs = None
+        self._adaptive_sampling = None  # see set_adaptive_sampling(...)
         self._raw_data = None  # measurement results are stored here
         self._swept_pars: Dict[str, Tuple] = None
         self._swept_pars_names: List[str] = None
+        self._hardware_swept_pars: Dict[str, Tuple] = {}
         # TODO: explicit definition of members in child classes
         self._measurement_result = None  # should be initialized in child class
 
+        # on-disk log of the measured points, see set_checkpointing(...)
+        self._checkpointing = False
+        self._checkpoint_queue_size = 1000
+        self._checkpoint_path = None
+        self._checkpoint = None  # ResultStorage.CheckpointWriter while measuring
+        self._done_points = None  # mask of the points loaded by resume()
+
         self._resonator_detector = ResonatorDetector(type=GlobalParameters().resonator_type)
 
         self._devs_aliases_map = devs_aliases_map
@@ -179,12 +202,149 @@ class Measurement:
         exa_parameters
         fixed_pars: {'dev1': {'par1': value1, 'par2': value2},
                      'dev2': {par1: value1, par2: ...}...}
+
+        Devices that share no hardware may be loaded in parallel threads, see
+        set_parameter_loading(...)
         """
+        entries = []
         for dev_name in self._fixed_pars.keys():
             dev_list = getattr(self, '_' + dev_name)
             for pars, dev in zip(self._fixed_pars[dev_name], dev_list):
+                entries.append((dev_name, pars, dev))
+
+        if self._parallel_loading:
+            chains = self._group_by_hardware([dev for dev_name, pars, dev in entries])
+        else:
+            chains = [list(range(len(entries)))]
+        chains = self._order_loading_chains(chains, [dev_name for dev_name, pars, dev in entries])
+
+        def load(chain, predecessors):
+            for future in predecessors:
+                future.result()
+            for idx in chain:
+                dev_name, pars, dev = entries[idx]
                 dev.set_parameters(pars)
 
+        if len(chains) == 1:
+            load(chains[0][0], [])
+            return
+        # every chain has its own thread, so that waiting for the
+        # predecessors never starves them
+        with ThreadPoolExecutor(len(chains)) as executor:
+            futures = []
+            for chain, predecessors in chains:
+                futures.append(executor.submit(load, chain, [futures[i] for i in predecessors]))
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def _get_hardware(dev):
+        """
+        Ids of the driver objects the device consists of, e.g. the local
+        oscillator and the IQAWG of an IQVectorGenerator
+        """
+        def is_driver(obj):
+            return type(obj).__module__.startswith("drivers.")
+
+        hardware = set()
+        stack = [dev]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in hardware:
+                continue
+            hardware.add(id(obj))
+            for value in getattr(obj, "__dict__", {}).values():
+                if isinstance(value, (list, tuple)):
+                    stack.extend(item for item in value if is_driver(item))
+                elif is_driver(value):
+                    stack.append(value)
+        return hardware
+
+    @staticmethod
+    def _group_by_hardware(devs):
+        """
+        Splits the indices of the devices into chains that share no hardware,
+        in the original order within every chain
+        """
+        chains = []
+        for idx, dev in enumerate(devs):
+            hardware = Measurement._get_hardware(dev)
+            sharing = [chain for chain in chains if chain[1] & hardware]
+            merged = ([i for chain in sharing for i in chain[0]] + [idx],
+                      hardware.union(*[chain[1] for chain in sharing]))
+            chains = [chain for chain in chains if not chain[1] & hardware] + [merged]
+        return sorted([sorted(indices) for indices, hardware in chains])
+
+    def _order_loading_chains(self, chains, dev_names):
+        """
+        Orders the chains and the devices within them by the loading
+        dependencies
+
+        Returns
+        -------
+        list of (list of int, list of int)
+            device indices of every chain and indices of the chains that must
+            be loaded before it, predecessors go first
+        """
+        def depends(i, j):
+            return dev_names[j] in self._loading_dependencies.get(dev_names[i], ())
+
+        ordered_chains = []
+        for chain in chains:
+            ordered = []
+            remaining = list(chain)
+            while remaining:
+                idx = next((i for i in remaining if not any(depends(i, j) for j in remaining
+                                                            if j != i)), None)
+                if idx is None:
+                    raise ValueError("Cyclic loading dependencies of %s"
+                                     % sorted({dev_names[i] for i in remaining}))
+                ordered.append(idx)
+                remaining.remove(idx)
+            ordered_chains.append(ordered)
+
+        predecessors = [{k for k, other in enumerate(ordered_chains) if k != n and
+                         any(depends(i, j) for i in chain for j in other)}
+                        for n, chain in enumerate(ordered_chains)]
+        result, positions = [], {}
+        remaining = list(range(len(ordered_chains)))
+        while remaining:
+            n = next((n for n in remaining if predecessors[n] <= positions.keys()), None)
+            if n is None:
+                raise ValueError("Cyclic loading dependencies of %s"
+                                 % sorted({dev_names[i] for n in remaining
+                                           for i in ordered_chains[n]}))
+            positions[n] = len(result)
+            result.append((ordered_chains[n], sorted(positions[k] for k in predecessors[n])))
+            remaining.remove(n)
+        return result
+
+    def set_parameter_loading(self, parallel=True, **dependencies):
+        """
+        Sets how set_fixed_parameters(...) loads the parameters into the
+        devices. In the parallel mode every group of devices that share no
+        hardware is configured in its own thread, so the loading takes as
+        long as the slowest device instead of all of them. By default the
+        devices are loaded one by one in the order of set_fixed_parameters(...),
+        which is only changed where the dependencies require.
+
+        The devices that share no driver objects but still depend on each
+        other have to be declared in 'dependencies'. The qubit AWGs ('q_awg',
+        'q_iqawg') are loaded after 'q_lo' unless overridden here.
+
+        Parameters
+        ----------
+        parallel: bool
+            if False, the devices are loaded one by one
+        dependencies:
+            {device name: names of the devices to load before it}, e.g.
+            vna=["mw_src"] to tune the source before the VNA
+        """
+        self._parallel_loading = parallel
+        self._loading_dependencies = dict(self._default_loading_dependencies)
+        self._loading_dependencies.update({dev_name: list(names) for dev_name, names
+                                           in dependencies.items()})
+
     def set_fixed_parameters(self, **fixed_pars):
         """
         fixed_pars: {'dev1': {'par1': value1, 'par2': value2},
@@ -195,14 +355,26 @@ class Measurement:
             self._measurement_result.get_context().get_equipment()[dev_name] = fixed_pars[dev_name]
         self._load_fixed_parameters_into_devices()
 
-    def set_swept_parameters(self, **swept_pars):
+    def set_swept_parameters(self, hardware_swept_pars=None, **swept_pars):
         """
         swept_pars = {'par1_name': (par1_setter_func, [par1_val1, par1_val1 ]),
                       'par2_name': (par2_setter_func, par2_values_list), ...}
+
+        hardware_swept_pars = {'par_name': (arm_func, par_values_list), ...}
+            parameters that are stepped by the hardware itself during a single
+            call of _recording_iteration() (VNA list sweep, EXG/MXG list mode
+            triggered by the VNA, AWG sequence). Their values are never set
+            from the sweep loop: arm_func() (may be None) is called before
+            each acquisition to prepare the next hardware sweep, and
+            _recording_iteration() must return the data for all of their
+            values at once. They are the last dimensions of the data array.
         """
         self._swept_pars = swept_pars
         self._swept_pars_names = list(swept_pars.keys())
-        self._measurement_result.set_parameter_names(self._swept_pars_names)
+        self._hardware_swept_pars = hardware_swept_pars \
+            if hardware_swept_pars is not None else {}
+        self._measurement_result.set_parameter_names(
+            self._swept_pars_names + list(self._hardware_swept_pars.keys()))
         self._last_swept_pars_values = \
             {name: None for name in self._swept_pars_names}
 
@@ -212,6 +384,141 @@ class Measurement:
                 self._last_swept_pars_values[name] = value
                 self._swept_pars[name][0](value)  # this is setter call, look carefully
 
+    def _arm_hardware_sweeps(self):
+        for arm_func, values in self._hardware_swept_pars.values():
+            if arm_func is not None:
+                arm_func()
+
+    def set_pipelining(self, workers=2):
+        """
+        Enables the pipelined mode in which the processing of a point runs in
+        a pool of worker threads while the setters are called and the next
+        point is acquired.
+
+        The measurement class has to implement _acquire_iteration() and
+        _process_iteration(...) instead of a single _recording_iteration().
+
+        Parameters
+        ----------
+        workers: int
+            the size of the worker pool, which is also the maximum number of
+            points that are acquired but not yet processed; 0 turns the
+            pipelined mode off
+        """
+        if workers > 0:
+            def defining_class(method_name):
+                return next(cls for cls in type(self).__mro__ if method_name in vars(cls))
+
+            acquiring_class = defining_class("_acquire_iteration")
+            # _recording_iteration() overridden below the class that splits
+            # it would be bypassed
+            if acquiring_class is Measurement or \
+                    not issubclass(acquiring_class, defining_class("_recording_iteration")):
+                raise NotImplementedError("%s does not support the pipelined mode"
+                                          % type(self).__name__)
+        self._pipeline_workers = workers
+
+    def set_sweep_order(self, order="raster", parameter_costs=None):
+        """
+        Sets the order in which the points of a multidimensional sweep are
+        visited. The data is stored at the same indices for any order.
+
+        Parameters
+        ----------
+        order: str
+            "raster" -- the innermost parameter runs from the first to the
+                last value and jumps back for every step of the outer ones
+            "serpentine" -- inner parameters run back and forth, so that
+                every parameter changes by one value at a time
+            "min_slew" -- serpentine over the sorted values of each
+                parameter, which minimizes the largest change of any
+                parameter between consecutive points
+        parameter_costs: dict
+            relative time costs of changing the parameters,
+            {parameter name: cost}, e.g. settling times. The costly
+            parameters are swept in the outer loops, so that they change
+            rarely. Parameters not in the dict have zero cost. By default
+            parameters are nested in the order of set_swept_parameters(...)
+        """
+        if order not in ("raster", "serpentine", "min_slew"):
+            raise ValueError("Unknown sweep order: %s" % order)
+        self._sweep_order = order
+        self._parameter_costs = parameter_costs
+
+    def set_adaptive_sampling(self, enabled=True, coarse_step=4, max_fraction=0.3,
+                              cells_per_batch=4, uniform_weight=0.05):
+        """
+        Enables the refining sampling of the swept parameters grid: a coarse
+        subgrid is measured first, then the points are added where the data
+        changes most until max_fraction of the grid is measured. The rest of
+        the points are interpolated, and the mask of the measured ones is
+        stored in the result data as "measured_points".
+
+        See AdaptiveSampler for the parameters
+        """
+        if enabled:
+            self._adaptive_sampling = {"coarse_step": coarse_step,
+                                       "max_fraction": max_fraction,
+                                       "cells_per_batch": cells_per_batch,
+                                       "uniform_weight": uniform_weight}
+        else:
+            self._adaptive_sampling = None
+
+    def set_checkpointing(self, enabled=True, queue_size=1000):
+        """
+        Enables streaming of every measured point to
+            data/<sample name>/DD MM YYYY/HH-MM-SS - <name>/<name>_checkpoint.h5
+        during the measurement, so that it may be continued with resume()
+        after a crash.
+
+        Parameters
+        ----------
+        enabled: bool
+        queue_size: int
+            maximum number of points waiting to be written; the measurement
+            is paused only when the disk can not keep up with it
+        """
+        self._checkpointing = enabled
+        self._checkpoint_queue_size = queue_size
+
+    def resume(self, checkpoint_path=None):
+        """
+        Continues the measurement from the checkpoint file skipping the points
+        that are already measured. Fixed and swept parameters must be set
+        in the same way as for the interrupted measurement.
+
+        Parameters
+        ----------
+        checkpoint_path: str
+            path to the <name>_checkpoint.h5 file; the latest one for this
+            measurement name and sample is used if not specified
+        """
+        if checkpoint_path is None:
+            paths = find(self._name + "_checkpoint.h5",
+                         os.path.join("data", self._sample_name))
+            if len(paths) == 0:
+                print("Checkpoint for '%s' not found" % self._name)
+                return
+            checkpoint_path = max(paths, key=os.path.getmtime)
+
+        raw_data, done_points = ResultStorage.read_checkpoint(checkpoint_path)
+        shape = tuple(len(self._swept_pars[name][1]) for name in self._swept_pars_names)
+        if done_points.shape != shape:
+            raise ValueError("Checkpoint shape %s does not match the swept "
+                             "parameters shape %s" % (done_points.shape, shape))
+
+        print("Resuming from %s, %d of %d points are done" %
+              (checkpoint_path, done_points.sum(), done_points.size))
+        self._raw_data = raw_data
+        self._done_points = done_points
+        self._checkpointing = True
+        self._checkpoint_path = checkpoint_path
+        try:
+            return self.launch()
+        finally:
+            self._done_points = None
+            self._checkpoint_path = None
+
     def launch(self):
 
         self._interrupted = False  # ensure
@@ -253,66 +560,226 @@ class Measurement:
         self._measurement_result.set_is_finished(False)  # ensure
 
         try:
-            self._record_data()
+            self._checkpoint = self._open_checkpoint()
+            try:
+                self._record_data()
+            finally:
+                if self._checkpoint is not None:
+                    self._checkpoint, checkpoint = None, self._checkpoint
+                    checkpoint.close()
         except Exception:
             self._measurement_result.set_exception_info(sys.exc_info())
         finally:
             self._measurement_result.set_is_finished(True)
 
+    def _open_checkpoint(self):
+        if not self._checkpointing:
+            return None
+        path = self._checkpoint_path
+        if path is None:
+            path = os.path.join(self._measurement_result.get_save_path(),
+                                self._name + "_checkpoint.h5")
+        parameters_values = [self._swept_pars[name][1] for name in self._swept_pars_names]
+        return ResultStorage.CheckpointWriter(path, self._swept_pars_names,
+                                              parameters_values,
+                                              self._checkpoint_queue_size)
+
     def _record_data(self):
         par_names = self._swept_pars_names
         done_iterations = 0
         start_time = self._measurement_result.get_start_datetime()
+        last_report_time = None
 
         parameters_values = [self._swept_pars[parameter_name][1] for parameter_name in par_names]
-        parameters_idxs = [list(range(len(self._swept_pars[parameter_name][1]))) for parameter_name in par_names]
-        raw_data_shape = [len(indices) for indices in parameters_idxs]
-        total_iterations = reduce(mul, raw_data_shape, 1)
-
-        for idx_group, values_group in zip(product(*parameters_idxs), product(*parameters_values)):
-            self._call_setters(values_group)
-            # This should be implemented in child classes:
-            data = self._recording_iteration()
+        raw_data_shape = [len(values) for values in parameters_values]
+
+        # parameters swept by the hardware within each acquisition
+        hardware_par_names = list(self._hardware_swept_pars.keys())
+        hardware_parameters_values = [values for arm_func, values in self._hardware_swept_pars.values()]
+        hardware_shape = [len(values) for values in hardware_parameters_values]
+
+        # all index and value combinations are computed once, in the order
+        # set by set_sweep_order(...)
+        if self._parameter_costs is not None:
+            # stable sort keeps the original nesting for equal costs
+            axes_order = sorted(range(len(par_names)),
+                                key=lambda axis: -self._parameter_costs.get(par_names[axis], 0))
+        else:
+            axes_order = None
+        if self._adaptive_sampling is not None:
+            if self._done_points is not None:
+                raise ValueError("Adaptive sampling can not be resumed")
+            sampler = AdaptiveSampler(raw_data_shape, **self._adaptive_sampling)
+            total_iterations = sampler.get_max_points_number()
+            # the points of every batch are chosen after the previous batch
+            # is stored in self._raw_data
+            batches = ((idx_grid, self._make_values_grid(idx_grid, parameters_values))
+                       for idx_grid in sampler.batches(lambda: self._raw_data))
+        else:
+            sampler = None
+            idx_grid, values_grid = self._make_sweep_grids(parameters_values, self._sweep_order, axes_order)
+            if self._done_points is not None:
+                not_done = ~self._done_points[tuple(idx_grid.T)]
+                idx_grid, values_grid = idx_grid[not_done], values_grid[not_done]
+            total_iterations = len(idx_grid)
+            batches = [(idx_grid, values_grid)]
+
+        def store_point(idx_group, values_group, data):
+            nonlocal done_iterations, last_report_time
+            if len(hardware_shape) > 1:
+                # flat data from a multidimensional hardware sweep
+                data = np.reshape(data, hardware_shape)
 
-            # dynamically allocating memory for the measurement based on
-            # the returned data dimensions
             if done_iterations == 0:
-                try:
-                    self._raw_data = zeros(raw_data_shape + [len(data)], dtype=complex_)
-                except TypeError:  # data has no __len__ attribute
-                    self._raw_data = zeros(raw_data_shape, dtype=complex_)
-            self._raw_data[idx_group] = data
+                # dynamically allocating memory for the measurement based on
+                # the returned data dimensions
+                if self._done_points is None or self._raw_data is None:
+                    self._raw_data = zeros(raw_data_shape + list(np.shape(data)), dtype=complex_)
+
+                # The result gets the reference to self._raw_data which is
+                # then filled in place.
+                # This may need to be extended in child classes:
+                measurement_data = self._prepare_measurement_result_data(
+                    par_names + hardware_par_names,
+                    parameters_values + hardware_parameters_values)
+                if sampler is not None:
+                    measurement_data["measured_points"] = sampler.get_measured_mask()
+                self._measurement_result.set_data(measurement_data)
 
-            # This may need to be extended in child classes:
-            measurement_data = self._prepare_measurement_result_data(par_names, parameters_values)
-            self._measurement_result.set_data(measurement_data)
+            self._raw_data[idx_group] = data
+            if self._checkpoint is not None:
+                self._checkpoint.write(idx_group, data)
             self._measurement_result._iter_idx_ready = idx_group
+            self._measurement_result.increment_data_version()
 
             done_iterations += 1
 
-            avg_time = (dt.now() - start_time).total_seconds() / done_iterations
-            time_left = self._format_time_delta(avg_time * (total_iterations - done_iterations))
-
-            formatted_values_group = "["
-            for idx, value in enumerate(values_group):
-                if isinstance(value, (float, int, np.float)):
-                    formatted_values_group += "{}: {:.2f}, ".format(par_names[idx], value)
-                else:
-                    formatted_values_group += "{}: {}, ".format(par_names[idx], value)
-            formatted_values_group = formatted_values_group[:-2] + "]"
-
-            print("\rTime left: " + time_left + ", %s" % formatted_values_group +
-                  ", average cycle time: " + str(round(avg_time, 2)) + " s       ",
-                  end="", flush=True)
+            now = dt.now()
+            if last_report_time is None or done_iterations == total_iterations or \
+                    (now - last_report_time).total_seconds() >= self._progress_update_interval:
+                last_report_time = now
+                avg_time = (now - start_time).total_seconds() / done_iterations
+                time_left = self._format_time_delta(avg_time * max(total_iterations - done_iterations, 0))
+                print("\rTime left: " + time_left + ", %s" % self._format_values_group(values_group) +
+                      ", average cycle time: " + str(round(avg_time, 2)) + " s       ",
+                      end="", flush=True)
+
+        # In the pipelined mode the instruments are still handled by this
+        # thread only, while _process_iteration(...) runs in the pool. Points
+        # are stored in the sweep order as soon as the oldest one is processed.
+        pool = ThreadPoolExecutor(self._pipeline_workers) if self._pipeline_workers > 0 else None
+        pending = deque()
+        try:
+            for idx_grid, values_grid in batches:
+                if sampler is not None:
+                    # interpolated points have been updated
+                    self._measurement_result.increment_data_version()
+                for idx_group, values_group in zip(map(tuple, idx_grid.tolist()), values_grid):
+                    self._call_setters(values_group)
+                    self._arm_hardware_sweeps()
+
+                    if pool is None:
+                        # This should be implemented in child classes:
+                        store_point(idx_group, values_group, self._recording_iteration())
+                    else:
+                        raw_data = self._acquire_iteration()
+                        pending.append((idx_group, values_group,
+                                        pool.submit(self._process_iteration, raw_data)))
+                        while len(pending) > self._pipeline_workers or \
+                                (len(pending) > 0 and pending[0][2].done()):
+                            idx, values, future = pending.popleft()
+                            store_point(idx, values, self._store_iteration(future.result()))
+
+                    if self._interrupted:
+                        break
+
+                while len(pending) > 0:
+                    idx, values, future = pending.popleft()
+                    store_point(idx, values, self._store_iteration(future.result()))
+                if self._interrupted:
+                    break
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False)
 
-            if self._interrupted:
-                return
+        if self._interrupted:
+            return
+        self._measurement_result.increment_data_version()
 
         self._measurement_result.set_recording_time(dt.now() - start_time)
         print("\nElapsed time: %s" % self._format_time_delta((dt.now() - start_time)
                                                              .total_seconds()))
         self._finalize()
 
+    @staticmethod
+    def _make_sweep_grids(parameters_values, order="raster", axes_order=None):
+        """
+        Parameters
+        ----------
+        parameters_values: list
+            values of every swept parameter
+        order: str
+            "raster", "serpentine" or "min_slew", see set_sweep_order(...)
+        axes_order: list of int
+            nesting of the parameters loops from the outermost to the
+            innermost, range(len(parameters_values)) by default
+
+        Returns
+        -------
+        idx_grid: numpy.ndarray of int, shape (points number, parameters number)
+            indices of the swept parameters values for every point
+        values_grid: numpy.ndarray of object, same shape
+            the values themselves (kept as objects, so that the setters get
+            exactly the items of the swept values lists)
+        """
+        shape = [len(values) for values in parameters_values]
+        if axes_order is None:
+            axes_order = list(range(len(shape)))
+        loops_shape = [shape[axis] for axis in axes_order]
+        loops_idx = np.indices(loops_shape).reshape(len(shape), int(np.prod(shape))).T
+
+        if order in ("serpentine", "min_slew"):
+            # a loop runs backwards when the number of the passes made over it
+            # before, i.e. the raster number of the outer loops point, is odd;
+            # it is counted from the raster indices, not the reflected ones
+            raster_idx = loops_idx.copy()
+            for loop in range(1, len(shape)):
+                passes = np.ravel_multi_index(tuple(raster_idx[:, :loop].T), loops_shape[:loop])
+                backwards = passes % 2 == 1
+                loops_idx[backwards, loop] = loops_shape[loop] - 1 - loops_idx[backwards, loop]
+
+        idx_grid = np.empty_like(loops_idx)
+        idx_grid[:, axes_order] = loops_idx
+        if order == "min_slew":
+            # every loop runs over the values sorted ascending
+            for par_idx, values in enumerate(parameters_values):
+                try:
+                    sorting = np.argsort(np.asarray(values, dtype=float), kind="stable")
+                except (TypeError, ValueError):
+                    continue  # not numeric, keep the given order
+                idx_grid[:, par_idx] = sorting[idx_grid[:, par_idx]]
+
+        return idx_grid, Measurement._make_values_grid(idx_grid, parameters_values)
+
+    @staticmethod
+    def _make_values_grid(idx_grid, parameters_values):
+        values_grid = np.empty(idx_grid.shape, dtype=object)
+        for par_idx, values in enumerate(parameters_values):
+            values_array = np.empty(len(values), dtype=object)
+            for value_idx, value in enumerate(values):
+                values_array[value_idx] = value
+            values_grid[:, par_idx] = values_array[idx_grid[:, par_idx]]
+        return values_grid
+
+    def _format_values_group(self, values_group):
+        formatted_values_group = "["
+        for par_name, value in zip(self._swept_pars_names, values_group):
+            if isinstance(value, (float, int, np.float)):
+                formatted_values_group += "{}: {:.2f}, ".format(par_name, value)
+            else:
+                formatted_values_group += "{}: {}, ".format(par_name, value)
+        return formatted_values_group[:-2] + "]"
+
     def _finalize(self):
         """
         Post-measurement clean-up. E.g. setting all voltage/current sources to 0,
@@ -336,6 +803,43 @@ class Measurement:
         """
         pass
 
+    def _acquire_iteration(self):
+        """
+        This method MAY be overridden together with _process_iteration(...)
+        to support the pipelined mode (see set_pipelining(...)).
+
+        Should contain the instrument part of _recording_iteration() and
+        return the raw data along with everything _process_iteration(...)
+        will need, since the setters for the next point may be called
+        before the processing starts.
+        """
+        raise NotImplementedError
+
+    def _process_iteration(self, raw_data):
+        """
+        Processing part of _recording_iteration(), called with the output of
+        _acquire_iteration() in a worker thread in the pipelined mode.
+        Should not access the instruments.
+
+        Returns data for the point just as _recording_iteration() does, or
+        whatever _store_iteration(...) takes.
+        """
+        raise NotImplementedError
+
+    def _store_iteration(self, processed):
+        """
+        This method MAY be overridden together with _process_iteration(...).
+
+        Called with the output of _process_iteration(...) in the measurement
+        thread and in the sweep order, even if the points were processed
+        in a different order. Side results of the processing (e.g. raw traces
+        kept for debugging) should be collected here, so that they match the
+        stored points.
+
+        Returns data for the point.
+        """
+        return processed
+
     def _prepare_measurement_result_data(self, parameter_names, parameter_values):
         """
         This method MAY be overridden for a new measurement type.
@@ -9,10 +9,11 @@ from IPython.display import clear_output
 import matplotlib
 from matplotlib import animation, pyplot as plt
 from matplotlib._pylab_helpers import Gcf
-from numpy import array, where
+from numpy import array, where, ndarray
 import copy
 import shutil
 import locale
+from lib2 import ResultStorage
 locale.setlocale(locale.LC_TIME, "C")
 
 def find(pattern, path):
@@ -49,6 +50,8 @@ class MeasurementResult:
         self._sample_name = sample_name
         self._data_lock = Lock()
         self._data = {}
+        # incremented on every set_data(...) call
+        self._data_version = 0
         self._context = ContextBase()
         self._parameter_names = None
 
@@ -126,12 +129,49 @@ class MeasurementResult:
         for idx, path in enumerate(paths):
             try:
                 with open(path, "rb") as f:
-                    results.append(pickle.load(f))
+                    result = pickle.load(f)
             except pickle.UnpicklingError as e:
                 results.append(e)
+                continue
+
+            # results saved before the HDF5 storage have the data pickled
+            # along with the object
+            hdf5_path = path[:-len(".pkl")] + ".h5"
+            if os.path.exists(hdf5_path):
+                result._data = ResultStorage.read(hdf5_path)
+            results.append(result)
 
         return results[0] if len(results) == 1 and not return_all else results
 
+    @staticmethod
+    def load_data(sample_name, name, date='', subfolder=""):
+        """
+        Finds the measurement result like load(...) does, but returns only its
+        data without reading it into memory.
+
+        Returns:
+            ResultStorage.HDF5Data, a read-only dictionary of h5py datasets
+            that are read from disk only when sliced, or
+            ResultStorage.InMemoryData with the raw data for the results saved
+            in the old .pkl-only format
+
+        Example usage:
+        >>> from lib2.MeasurementResult import MeasurementResult
+        >>> with MeasurementResult.load_data("<sample_name>", "<name>") as data:
+        >>>     last_row = data["data"][-1]
+        """
+        paths = MeasurementResult._find_paths_by(sample_name, name, ".pkl", date, subfolder)
+
+        if paths is None:
+            return
+
+        path = paths[0][:-len(".pkl")]
+        if os.path.exists(path + ".h5"):
+            return ResultStorage.HDF5Data(path + ".h5")
+
+        with open(path + "_raw_data.pkl", "rb") as f:
+            return ResultStorage.InMemoryData(pickle.load(f))
+
     @staticmethod
     def _find_paths_by(sample_name, name, extension, date, subfolder, return_all=False):
         paths = find(name + extension, os.path.join('data', sample_name, subfolder, date))
@@ -196,6 +236,8 @@ class MeasurementResult:
     def __setstate__(self, state):
         self.__dict__.update(state)
         self._data_lock = Lock()
+        if "_data_version" not in state:
+            self._data_version = 0
 
     def save(self, plot_maximized = True):
         """
@@ -208,19 +250,28 @@ class MeasurementResult:
         The path is structured as follows:
             data/<sample name>/DD MM YYYY/HH-MM-SS - <name>/
 
-        At least <name>.pkl with serialized object, <name>_raw_data.pkl with raw
-        data only and human-readable context will be stored, though
-        child methods should save additional files in their overridden methods,
-        i.e. plot pictures
+        At least <name>.pkl with serialized object, <name>.h5 with the data
+        (see lib2.ResultStorage) and human-readable context will be stored,
+        though child methods should save additional files in their overridden
+        methods, i.e. plot pictures
         """
         fig, axes, caxes = self.visualize(plot_maximized)
 
         with self._data_lock:
-            with open(os.path.join(self.get_save_path(), self._name + '.pkl'), 'w+b') as f:
-                pickle.dump(self, f)
-            with open(os.path.join(self.get_save_path(), self._name + '_raw_data.pkl'), 'w+b') as f:
-                pickle.dump(self._data, f)
-            with open(os.path.join(self.get_save_path(), self._name + '_context.txt'), 'w+') as f:
+            save_path = os.path.join(self.get_save_path(), self._name)
+
+            # data goes to the HDF5 file, not to the pickle
+            data, self._data = self._data, {}
+            try:
+                with open(save_path + '.pkl', 'w+b') as f:
+                    pickle.dump(self, f)
+            finally:
+                self._data = data
+
+            ResultStorage.write(save_path + '.h5', self._data,
+                                self._parameter_names,
+                                self.get_context().to_string())
+            with open(save_path + '_context.txt', 'w+') as f:
                 f.write(self.get_context().to_string())
 
         plt.savefig(os.path.join(self.get_save_path(), self._name + ".png"), bbox_inches='tight')
@@ -250,8 +301,18 @@ class MeasurementResult:
         return fig, axes, caxes
 
     def _yield_data(self):
+        last_version = None
         while not self.is_finished():
-            yield self.get_data()
+            if self._data_version != last_version:
+                last_version = self._data_version
+                yield self.get_data()
+            else:
+                yield None
+
+    def _plot_dynamic(self, data):
+        # data is None when it has not changed since the last frame
+        if data is not None:
+            self._plot(data)
 
     def visualize_dynamic(self):
         """
@@ -275,7 +336,7 @@ class MeasurementResult:
             # we are probably in the notebook regime
             fig.set_size_inches(10, 5)
 
-        self._anim = animation.FuncAnimation(fig, self._plot,
+        self._anim = animation.FuncAnimation(fig, self._plot_dynamic,
                                              frames=self._yield_data,
                                              repeat=False, interval=100)
 
@@ -416,8 +477,30 @@ class MeasurementResult:
         self._recording_time = recording_time
 
     def get_data(self):
+        """
+        Returns a snapshot of the data: a new dictionary with read-only views
+        of the stored arrays, so no data is copied. Use .copy() on an array
+        before modifying it.
+        """
+        with self._data_lock:
+            return {key: self._read_only(value) for key, value in self._data.items()}
+
+    def get_data_version(self):
+        return self._data_version
+
+    def increment_data_version(self):
+        """
+        Signals that the arrays passed to set_data(...) were modified in place
+        """
         with self._data_lock:
-            return copy.deepcopy(self._data)
+            self._data_version += 1
+
+    @staticmethod
+    def _read_only(value):
+        if isinstance(value, ndarray):
+            value = value.view()
+            value.flags.writeable = False
+        return value
 
     def get_context(self):
         return self._context
@@ -426,9 +509,14 @@ class MeasurementResult:
         """
         Data should consist only of built-in data types to be easy to use on
         other computers without the whole measurement library.
+
+        The arrays are not copied: the measurement is expected to keep filling
+        its preallocated arrays in place and to call set_data(...) to signal
+        that new points are ready.
         """
         with self._data_lock:
-            self._data = copy.deepcopy(data)
+            self._data = dict(data)
+            self._data_version += 1
 
     def _latex_float(self, f):
         float_str = "{0:.2e}".format(f)
@@ -0,0 +1,323 @@
+"""
+Chunked HDF5 storage for the data of MeasurementResult objects.
+
+The file <name>.h5 is laid out as follows:
+
+    /axes/<parameter name>   swept parameter values, one dataset per parameter
+    /data                    the (complex) measurement array, chunked by rows
+                             of the outermost swept parameter
+    /extra/<key>             any other entries of MeasurementResult._data
+    /context                 human-readable context string
+
+Original dictionary keys are kept in the "key" attribute of each dataset, so
+that names like "Frequency [Hz]" survive the round trip. Entries that can not
+be represented as a plain numeric/string array are pickled into an opaque
+byte dataset marked with the "pickled" attribute.
+"""
+import pickle
+from collections.abc import Mapping
+from queue import Queue, Full
+from threading import Thread
+
+import h5py
+import numpy as np
+
+
+AXES_GROUP = "axes"
+EXTRA_GROUP = "extra"
+DATA_DATASET = "data"
+CONTEXT_DATASET = "context"
+DONE_DATASET = "done"
+
+# target chunk size in bytes for the rows of the "data" dataset
+CHUNK_BYTES = 1024 ** 2
+
+
+def _dataset_name(key):
+    # HDF5 uses '/' as a group separator
+    return str(key).replace("/", "|")
+
+
+def _row_chunks(shape, itemsize):
+    """
+    Chunk shape for an array that is written and read by rows of the first
+    (outermost swept parameter) axis.
+    """
+    if len(shape) == 0 or 0 in shape:
+        return None
+    row_shape = tuple(shape[1:])
+    row_bytes = int(np.prod(row_shape, dtype=int)) * itemsize
+    rows_per_chunk = max(1, min(shape[0], CHUNK_BYTES // max(row_bytes, 1)))
+    return (rows_per_chunk,) + row_shape
+
+
+def _write_value(group, name, key, value, chunked=False):
+    try:
+        array = np.asarray(value)
+        if array.dtype.kind in "U":
+            array = array.astype(h5py.string_dtype())
+        elif array.dtype.kind not in "biufcS?":
+            raise TypeError
+        chunks = _row_chunks(array.shape, array.dtype.itemsize) \
+            if chunked and array.dtype.kind in "biufc" else None
+        dataset = group.create_dataset(name, data=array, chunks=chunks)
+    except (TypeError, ValueError):
+        dataset = group.create_dataset(name, data=np.void(pickle.dumps(value)))
+        dataset.attrs["pickled"] = True
+    dataset.attrs["key"] = str(key)
+    return dataset
+
+
+def _read_value(dataset):
+    if dataset.attrs.get("pickled", False):
+        return pickle.loads(dataset[()].tobytes())
+    value = dataset[()]
+    if h5py.check_string_dtype(dataset.dtype) is not None:
+        value = dataset.asstr()[()]
+    return value
+
+
+def write(path, data, parameter_names=None, context=""):
+    """
+    Writes the data dictionary of a MeasurementResult into an HDF5 file
+
+    Parameters
+    ----------
+    path: str
+        file path, will be overwritten
+    data: dict
+        MeasurementResult._data
+    parameter_names: list of str
+        names of the swept parameters that are stored in the "axes" group
+    context: str
+        output of the ContextBase.to_string() method
+    """
+    parameter_names = parameter_names if parameter_names is not None else []
+    with h5py.File(path, "w") as f:
+        axes = f.create_group(AXES_GROUP)
+        extra = f.create_group(EXTRA_GROUP)
+        for key, value in data.items():
+            if key == DATA_DATASET:
+                _write_value(f, DATA_DATASET, key, value, chunked=True)
+            elif key in parameter_names:
+                _write_value(axes, _dataset_name(key), key, value)
+            else:
+                _write_value(extra, _dataset_name(key), key, value)
+        f.attrs["parameter_names"] = [str(name) for name in parameter_names]
+        f.create_dataset(CONTEXT_DATASET, data=context,
+                         dtype=h5py.string_dtype())
+
+
+def read(path):
+    """
+    Reads the whole data dictionary from an HDF5 file written by write(...)
+    """
+    with HDF5Data(path) as lazy_data:
+        return {key: lazy_data.read(key) for key in lazy_data}
+
+
+def read_context(path):
+    with h5py.File(path, "r") as f:
+        return f[CONTEXT_DATASET].asstr()[()]
+
+
+class HDF5Data(Mapping):
+    """
+    Read-only dictionary-like view on a data file written by write(...).
+
+    Values are returned as h5py.Dataset objects so that only the requested
+    slices are read from disk:
+
+    >>> with HDF5Data(path) as data:
+    >>>     row = data["data"][10]
+    >>>     currents = data["Current [A]"][:]
+
+    Use read(key) to get the whole value as a numpy array instead.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._file = h5py.File(path, "r")
+        self._datasets = {}
+        for group_name in (AXES_GROUP, EXTRA_GROUP):
+            for dataset in self._file[group_name].values():
+                self._datasets[dataset.attrs["key"]] = dataset
+        if DATA_DATASET in self._file:
+            self._datasets[DATA_DATASET] = self._file[DATA_DATASET]
+
+    def __getitem__(self, key):
+        dataset = self._datasets[key]
+        if dataset.attrs.get("pickled", False):
+            return _read_value(dataset)
+        return dataset
+
+    def __iter__(self):
+        return iter(self._datasets)
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def read(self, key):
+        return _read_value(self._datasets[key])
+
+    def get_parameter_names(self):
+        return list(self._file.attrs["parameter_names"])
+
+    def get_context(self):
+        return self._file[CONTEXT_DATASET].asstr()[()]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class InMemoryData(Mapping):
+    """
+    Read-only view with the HDF5Data interface on a data dictionary that is
+    already in memory, e.g. loaded from a result in the old .pkl-only format
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def read(self, key):
+        return self._data[key]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CheckpointWriter(Thread):
+    """
+    Write-behind log of the measured points.
+
+    Points are put into a bounded queue by the measurement thread and written
+    into an HDF5 file by this thread, so the measurement does not wait for the
+    disk unless the queue is full. The file contains
+
+        /axes/<parameter name>   swept parameter values
+        /data                    raw data, allocated with the first point
+        /done                    boolean mask of the points already written
+
+    and may be read back with read_checkpoint(...) to resume the measurement.
+    """
+
+    # interval of checking that the writer is alive while the queue is full, s
+    PUT_TIMEOUT = 0.1
+
+    def __init__(self, path, parameter_names=None, parameter_values=None,
+                 queue_size=1000):
+        super().__init__(daemon=True)
+        self._path = path
+        self._queue = Queue(maxsize=queue_size)
+        self._exception = None
+        self._file = h5py.File(path, "a")
+
+        if parameter_names is not None and AXES_GROUP not in self._file:
+            axes = self._file.create_group(AXES_GROUP)
+            for name, values in zip(parameter_names, parameter_values):
+                _write_value(axes, _dataset_name(name), name, values)
+            self._file.attrs["parameter_names"] = [str(name) for name in parameter_names]
+            self._file.create_dataset(DONE_DATASET, dtype=bool,
+                                      data=np.zeros([len(values) for values in parameter_values],
+                                                    dtype=bool))
+        self.start()
+
+    def get_path(self):
+        return self._path
+
+    def write(self, idx_group, data):
+        """
+        Queues the point for writing. Blocks only if the queue is full.
+        """
+        if not self._put((idx_group, np.array(data, dtype=np.complex128))):
+            raise self._exception or RuntimeError("Checkpoint writer is closed")
+
+    def close(self):
+        """
+        Writes the remaining queued points and closes the file.
+        """
+        self._put(None)
+        self.join()
+        if self._exception is not None:
+            raise self._exception
+
+    def _put(self, item):
+        # the writer may fail while the queue is full and stop consuming, so
+        # the waiting is interrupted to check it
+        while self._exception is None and self.is_alive():
+            try:
+                self._queue.put(item, timeout=self.PUT_TIMEOUT)
+                return True
+            except Full:
+                pass
+        return False
+
+    def run(self):
+        closing = False
+        while not closing:
+            points = [self._queue.get()]
+            # write everything that is already waiting in one go
+            while not self._queue.empty():
+                points.append(self._queue.get_nowait())
+            if points[-1] is None:
+                closing = True
+                points.pop()
+            try:
+                self._write_points(points)
+            except Exception as e:
+                self._exception = e
+                break
+        self._file.close()
+
+    def _write_points(self, points):
+        if len(points) == 0:
+            return
+        done = self._file[DONE_DATASET]
+        if DATA_DATASET not in self._file:
+            point_shape = points[0][1].shape
+            shape = done.shape + point_shape
+            self._file.create_dataset(DATA_DATASET, shape=shape,
+                                      dtype=np.complex128,
+                                      chunks=_row_chunks(shape, np.dtype(np.complex128).itemsize))
+        data = self._file[DATA_DATASET]
+        for idx_group, point in points:
+            data[idx_group] = point
+            done[idx_group] = True
+        self._file.flush()
+
+
+def read_checkpoint(path):
+    """
+    Reads the log written by CheckpointWriter
+
+    Returns
+    -------
+    raw_data, done: numpy.ndarray
+        raw data (None if no points were written) and the boolean mask of
+        the measured points
+    """
+    with h5py.File(path, "r") as f:
+        done = f[DONE_DATASET][()]
+        raw_data = f[DATA_DATASET][()] if DATA_DATASET in f else None
+    return raw_data, done
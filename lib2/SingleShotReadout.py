@@ -0,0 +1,180 @@
+"""
+Integration and state discrimination of single-shot readout traces.
+
+Every shot (a segment of the multiple recording mode of the digitizer) is
+integrated with complex weights into a point of the IQ plane:
+
+    S = sum_n conj(w_n) (I_n + 1j Q_n)
+
+All the shots of an acquisition are integrated at once by matrix products.
+The weights are either the demodulation at the intermediate frequency or the
+matched filter obtained from the traces of the prepared ground and excited
+states. The points are then classified by a discriminator trained on the
+integrated shots of the same prepared states.
+"""
+import numpy as np
+
+from lib2 import DigitalDownConversion
+
+
+def demodulation_weights(n_samples, sample_rate, if_frequency):
+    """
+    Weights that make integrate(...) equal to DigitalDownConversion.demodulate
+    (..., bin_centered=True) of every shot
+
+    Returns
+    -------
+    numpy.ndarray of complex, shape (n_samples,)
+    """
+    cos_ref, sin_ref = DigitalDownConversion.reference(n_samples, float(sample_rate),
+                                                       (float(if_frequency),), None, True)
+    return cos_ref[0] + 1j * sin_ref[0]
+
+
+def matched_filter_weights(ground_traces, excited_traces):
+    """
+    Weights that maximize the separation of the integrated ground and excited
+    shots relative to the noise: the difference of the mean traces divided by
+    the noise variance at every sample
+
+    Parameters
+    ----------
+    ground_traces, excited_traces: numpy.ndarray of complex, shape (n_shots, n_samples)
+
+    Returns
+    -------
+    numpy.ndarray of complex, shape (n_samples,)
+        normalized so that the sum of their absolute values is 1
+    """
+    ground_mean = ground_traces.mean(axis=0)
+    excited_mean = excited_traces.mean(axis=0)
+    variance = (np.mean(np.abs(ground_traces - ground_mean) ** 2, axis=0) +
+                np.mean(np.abs(excited_traces - excited_mean) ** 2, axis=0)) / 2
+    weights = (excited_mean - ground_mean) / np.maximum(variance, np.finfo(float).tiny)
+    return weights / np.sum(np.abs(weights))
+
+
+def integrate(data_i, data_q, weights):
+    """
+    Parameters
+    ----------
+    data_i, data_q: numpy.ndarray, shape (n_shots, n_samples)
+        I and Q quadratures of the shots
+    weights: numpy.ndarray of complex, shape (n_samples,)
+
+    Returns
+    -------
+    numpy.ndarray of complex, shape (n_shots,)
+    """
+    # conj(w) (I + jQ) without complex temporaries of the data size
+    weights_real = np.real(weights).astype(data_i.dtype)
+    weights_imag = np.imag(weights).astype(data_i.dtype)
+    real = np.dot(data_i, weights_real) + np.dot(data_q, weights_imag)
+    imag = np.dot(data_q, weights_real) - np.dot(data_i, weights_imag)
+    return real + 1j * imag
+
+
+def _as_points(shots):
+    shots = np.asarray(shots)
+    return np.stack((np.real(shots), np.imag(shots)), axis=-1).astype(float)
+
+
+class Discriminator:
+    """
+    Base class of the classifiers of the integrated shots: 0 for the ground
+    and 1 for the excited state
+    """
+
+    def fit(self, ground_shots, excited_shots):
+        raise NotImplementedError
+
+    def predict(self, shots):
+        raise NotImplementedError
+
+    def get_population(self, shots):
+        """
+        Fraction of the shots classified as the excited state
+        """
+        return np.mean(self.predict(shots))
+
+    def get_assignment_fidelity(self, ground_shots, excited_shots):
+        """
+        1 - (P(e|g) + P(g|e)) / 2
+        """
+        return 1 - (self.get_population(ground_shots) +
+                    1 - self.get_population(excited_shots)) / 2
+
+
+class LinearDiscriminator(Discriminator):
+    """
+    Linear discriminant analysis: the shots are split by a line, assuming the
+    same noise covariance for both of the states
+    """
+
+    def __init__(self):
+        self._direction = None
+        self._threshold = None
+
+    def fit(self, ground_shots, excited_shots):
+        ground, excited = _as_points(ground_shots), _as_points(excited_shots)
+        ground_mean, excited_mean = ground.mean(axis=0), excited.mean(axis=0)
+        covariance = (np.cov(ground, rowvar=False) + np.cov(excited, rowvar=False)) / 2
+        self._direction = np.linalg.solve(covariance, excited_mean - ground_mean)
+        self._threshold = self._direction @ (ground_mean + excited_mean) / 2
+        return self
+
+    def predict(self, shots):
+        return (_as_points(shots) @ self._direction > self._threshold).astype(int)
+
+
+class GaussianMixtureDiscriminator(Discriminator):
+    """
+    Mixture of two gaussian components with full covariances. The components
+    are initialized with the shots of the prepared states and refined by the
+    expectation-maximization algorithm on all of them, which accounts for the
+    shots that relaxed or were excited during the preparation.
+    """
+
+    def __init__(self, n_iterations=20):
+        self._n_iterations = n_iterations
+        self._weights = None
+        self._means = None
+        self._covariances = None
+
+    def fit(self, ground_shots, excited_shots):
+        ground, excited = _as_points(ground_shots), _as_points(excited_shots)
+        self._weights = np.array([0.5, 0.5])
+        self._means = np.array([ground.mean(axis=0), excited.mean(axis=0)])
+        self._covariances = np.array([np.cov(ground, rowvar=False),
+                                      np.cov(excited, rowvar=False)])
+
+        points = np.concatenate((ground, excited))
+        for _ in range(self._n_iterations):
+            log_likelihoods = self._log_likelihoods(points)
+            responsibilities = np.exp(log_likelihoods - log_likelihoods.max(axis=1, keepdims=True))
+            responsibilities /= responsibilities.sum(axis=1, keepdims=True)
+
+            totals = responsibilities.sum(axis=0)
+            self._weights = totals / len(points)
+            self._means = responsibilities.T @ points / totals[:, np.newaxis]
+            deviations = points[np.newaxis, :, :] - self._means[:, np.newaxis, :]
+            self._covariances = np.einsum("kn,kni,knj->kij", responsibilities.T,
+                                          deviations, deviations) / totals[:, np.newaxis, np.newaxis]
+        return self
+
+    def predict(self, shots):
+        return np.argmax(self._log_likelihoods(_as_points(shots)), axis=1)
+
+    def _log_likelihoods(self, points):
+        """
+        Returns
+        -------
+        numpy.ndarray, shape (number of points, 2)
+            logarithms of the weighted probability densities of the components
+        """
+        deviations = points[np.newaxis, :, :] - self._means[:, np.newaxis, :]
+        inverse = np.linalg.inv(self._covariances)
+        mahalanobis = np.einsum("kni,kij,knj->kn", deviations, inverse, deviations)
+        log_norms = np.log(self._weights) - np.log(2 * np.pi) - \
+            np.log(np.linalg.det(self._covariances)) / 2
+        return (log_norms[:, np.newaxis] - mahalanobis / 2).T
@@ -229,7 +229,7 @@ class SingleToneSpectroscopyResult(MeasurementResult):
             "avg_freq" for frequency slice subtraction
 
         """
-        s_data = self.get_data()["data"]
+        s_data = self.get_data()["data"].copy()
         len_freq = s_data.shape[1]
         len_cur = s_data.shape[0]
         if direction is "avg_cur":
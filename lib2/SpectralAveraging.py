@@ -0,0 +1,192 @@
+"""
+Acquisition -> FFT -> accumulation pipeline for averaging the power spectra
+of long series of digitizer traces in several processes.
+
+The acquiring process writes the traces into the slots of a ring in shared
+memory, and only the slot numbers travel through the queues, so the traces
+are never pickled. The number of slots limits how far the acquisition may run
+ahead of the processing: put(...) blocks until a slot is released by a worker.
+Every worker accumulates the power spectra into its own row of a shared
+accumulator, and the rows are summed on request:
+
+>>> with SpectralAveragingPipeline(trace_length, nfft, start_idx, end_idx) as pipeline:
+>>>     for trace in traces:
+>>>         pipeline.put(trace)
+>>>         print(pipeline.get_count(), end="\\r")
+>>> power_spectrum, = pipeline.get_average()
+"""
+import multiprocessing as mp
+from queue import Empty
+
+import numpy as np
+from scipy import fftpack
+
+
+def _shared_array(shape, dtype):
+    """
+    Zero-filled array in the shared memory, its buffer is passed to the
+    worker processes when they are started
+    """
+    buffer = mp.RawArray("b", int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    return buffer, _as_array(buffer, shape, dtype)
+
+
+def _as_array(buffer, shape, dtype):
+    return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
+def _accumulate_spectra(worker_idx, slots_buffer, slots_shape, accumulator_buffer, accumulator_shape,
+                        counts, free_slots, filled_slots, nfft, spectrum_idx):
+    # module level function to be picklable for the worker processes
+    slots = _as_array(slots_buffer, slots_shape, np.complex128)
+    accumulator = _as_array(accumulator_buffer, accumulator_shape, np.float64)[worker_idx]
+    for slot in iter(filled_slots.get, None):
+        spectra = fftpack.fft(slots[slot], nfft, axis=-1)[:, spectrum_idx] / nfft
+        free_slots.put(slot)
+        accumulator += spectra.real ** 2 + spectra.imag ** 2
+        counts[worker_idx] += 1
+
+
+class SpectralAveragingPipeline:
+
+    def __init__(self, trace_length, nfft, start_idx, end_idx, n_parts=1,
+                 n_workers=3, n_slots=None):
+        """
+        Parameters
+        ----------
+        trace_length: int
+            number of samples in the traces
+        nfft: int
+            number of FFT points, the traces are zero-padded or cut to it
+        start_idx, end_idx: int
+            first and last indices of the fftshift'ed spectrum to accumulate
+        n_parts: int
+            number of traces put at once, e.g. 2 for a signal and a
+            background, their spectra are accumulated separately
+        n_workers: int
+            number of the processes computing the spectra
+        n_slots: int
+            number of the traces that may wait for processing before put(...)
+            blocks, 4 * n_workers if None
+        """
+        self._n_parts = n_parts
+        self._n_workers = n_workers
+        self._n_slots = n_slots if n_slots is not None else 4 * n_workers
+        self._nfft = nfft
+        # indices of the unshifted FFT that correspond to the requested range
+        self._spectrum_idx = (np.arange(start_idx, end_idx + 1) - nfft // 2) % nfft
+
+        self._slots_shape = (self._n_slots, n_parts, trace_length)
+        self._accumulator_shape = (n_workers, n_parts, len(self._spectrum_idx))
+        self._slots_buffer = None
+        self._accumulator_buffer = None
+        self._slots = None
+        self._accumulator = None
+        self._counts = None
+        self._free_slots = None
+        self._filled_slots = None
+        self._workers = []
+
+    def start(self):
+        self._slots_buffer, self._slots = _shared_array(self._slots_shape, np.complex128)
+        self._accumulator_buffer, self._accumulator = _shared_array(self._accumulator_shape,
+                                                                    np.float64)
+
+        # every worker only writes into its own counter
+        self._counts = mp.Array("q", self._n_workers, lock=False)
+        self._free_slots = mp.Queue()
+        self._filled_slots = mp.Queue()
+        for slot in range(self._n_slots):
+            self._free_slots.put(slot)
+
+        self._workers = [mp.Process(target=_accumulate_spectra, daemon=True,
+                                    args=(worker_idx, self._slots_buffer, self._slots_shape,
+                                          self._accumulator_buffer, self._accumulator_shape,
+                                          self._counts, self._free_slots, self._filled_slots,
+                                          self._nfft, self._spectrum_idx))
+                         for worker_idx in range(self._n_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, *traces):
+        """
+        Copies the traces into a free slot and queues it for processing.
+        Blocks while all the slots are occupied.
+
+        Parameters
+        ----------
+        traces: numpy.ndarray
+            n_parts traces of trace_length samples
+        """
+        while True:
+            try:
+                slot = self._free_slots.get(timeout=1)
+                break
+            except Empty:
+                if not any(worker.is_alive() for worker in self._workers):
+                    raise RuntimeError("Spectral averaging workers are not running")
+        for part, trace in enumerate(traces):
+            self._slots[slot, part] = trace
+        self._filled_slots.put(slot)
+
+    def get_count(self):
+        """
+        Number of the processed put(...) calls
+        """
+        return sum(self._counts)
+
+    def get_sum(self):
+        """
+        Returns
+        -------
+        numpy.ndarray, shape (n_parts, end_idx - start_idx + 1)
+            sums of the power spectra processed so far
+        """
+        return self._accumulator.sum(axis=0)
+
+    def get_average(self):
+        """
+        Returns
+        -------
+        numpy.ndarray, shape (n_parts, end_idx - start_idx + 1)
+            averages of the power spectra processed so far
+        """
+        return self.get_sum() / max(self.get_count(), 1)
+
+    def close(self, wait=True):
+        """
+        Stops the workers and releases the shared memory. The accumulated
+        spectra stay available.
+
+        Parameters
+        ----------
+        wait: bool
+            if True, all the traces that were put are processed first,
+            otherwise the workers are terminated
+        """
+        if self._slots_buffer is None:
+            return
+        for worker in self._workers:
+            if wait:
+                self._filled_slots.put(None)
+            else:
+                worker.terminate()
+        for worker in self._workers:
+            worker.join()
+
+        # keep the results after the shared memory is gone
+        self._accumulator = self._accumulator.copy()
+        self._counts = list(self._counts)
+        self._slots = None
+        self._slots_buffer = None
+        self._accumulator_buffer = None
+
+        if wait and any(worker.exitcode != 0 for worker in self._workers):
+            raise RuntimeError("Spectral averaging worker failed")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(wait=exc_type is None)
@@ -1,9 +1,96 @@
 from lib2.Measurement import *
 from lib2.VNATimeResolvedDispersiveMeasurement import *
+from lib2.FitWorker import FitWorker
 
 from numpy.linalg import pinv # you will have to deal with this, FUCKING PSEUDOINVERSE, BABY
 import numpy as np
 from scipy.optimize import least_squares, curve_fit
+from threading import Lock
+from inspect import signature
+
+
+def _batched_least_squares(function, x0, lower_bounds, upper_bounds,
+                           max_iterations=500, ftol=1e-5):
+    """
+    Levenberg-Marquardt minimization of many independent least squares
+    problems at once, the steps are clipped to the bounds
+
+    Parameters
+    ----------
+    function: callable
+        function(x, problems) -> residuals, x is an array of shape (len(problems),
+        number of parameters), the residuals are of shape (len(problems),
+        number of residuals)
+    x0, lower_bounds, upper_bounds: arrays of shape (number of problems,
+        number of parameters)
+
+    Returns
+    -------
+    x: array
+        the optima
+    jac: array of shape (number of problems, number of residuals,
+        number of parameters)
+        the Jacobians at the optima
+    """
+    problems = arange(len(x0))
+    x = x0.copy()
+    residuals = function(x, problems)
+    costs = sum(residuals ** 2, axis=1)
+    jac = _batched_jacobian(function, x, problems, residuals, upper_bounds)
+    damping = full(len(x), 1e-3)
+    active = ones(len(x), dtype=bool)
+
+    for _ in range(max_iterations):
+        fits = where(active)[0]
+        if len(fits) == 0:
+            break
+        hessians = einsum("fri,frj->fij", jac[fits], jac[fits])
+        gradients = einsum("fri,fr->fi", jac[fits], residuals[fits])
+        # Marquardt's scaling of the damping by the curvatures makes the
+        # steps independent of the units of the parameters
+        curvatures = diagonal(hessians, axis1=1, axis2=2)
+        curvatures = maximum(curvatures, 1e-12 * curvatures.max(axis=1, keepdims=True) + 1e-300)
+        hessians = hessians + eye(x.shape[1]) * (damping[fits, np.newaxis] * curvatures)[:, np.newaxis, :]
+        steps = -np.linalg.solve(hessians, gradients[..., np.newaxis])[..., 0]
+
+        x_new = clip(x[fits] + steps, lower_bounds[fits], upper_bounds[fits])
+        residuals_new = function(x_new, fits)
+        costs_new = sum(residuals_new ** 2, axis=1)
+
+        improved = costs_new < costs[fits]
+        converged = (costs[fits] - costs_new <= ftol * costs[fits]) & improved
+        accepted = fits[improved]
+        x[accepted] = x_new[improved]
+        residuals[accepted] = residuals_new[improved]
+        costs[accepted] = costs_new[improved]
+        damping[accepted] /= 3
+        damping[fits[~improved]] *= 2
+
+        active[fits[converged]] = False
+        # no step along the gradient reduces the cost any more
+        active[damping > 1e10] = False
+        updated = accepted[active[accepted]]
+        if len(updated) > 0:
+            jac[updated] = _batched_jacobian(function, x[updated], updated,
+                                             residuals[updated], upper_bounds[updated])
+
+    jac[~active] = _batched_jacobian(function, x[~active], problems[~active],
+                                     residuals[~active], upper_bounds[~active])
+    return x, jac
+
+
+def _batched_jacobian(function, x, problems, residuals, upper_bounds):
+    """
+    Forward difference estimation of the Jacobians for _batched_least_squares(...)
+    """
+    jac = empty(residuals.shape + (x.shape[1],))
+    for param_idx in range(x.shape[1]):
+        steps = sqrt(finfo(float).eps) * maximum(abs(x[:, param_idx]), 1)
+        steps = where(x[:, param_idx] + steps > upper_bounds[:, param_idx], -steps, steps)
+        x_shifted = x.copy()
+        x_shifted[:, param_idx] += steps
+        jac[:, :, param_idx] = (function(x_shifted, problems) - residuals) / steps[:, np.newaxis]
+    return jac
 
 
 class VNATimeResolvedDispersiveMeasurement1D(VNATimeResolvedDispersiveMeasurement):
@@ -50,6 +137,13 @@ class VNATimeResolvedDispersiveMeasurement1DResult( \
         self._fit_lines = [None] * 2
         self._anno = [None] * 2
 
+        # (data version, is finished) the fit was done for
+        self._fit_version = None
+        self._fit_lock = Lock()
+        # number of points at the last fit from the generated initial guess
+        self._cold_fit_size = 0
+        self._fit_worker = None
+
     def _cost_function(self, params, x, data):
         return np.abs(self._model(x, *params) - data)
 
@@ -63,8 +157,34 @@ class VNATimeResolvedDispersiveMeasurement1DResult( \
 
         return true_arr
 
+    def get_model_parameter_names(self):
+        """
+        Returns
+        -------
+        list of str
+            names of the fit parameters in the order of _model(...)
+        """
+        return list(signature(self._model).parameters)[1:]
+
     def _fit_complex_curve(self, X, data):
         p0, bounds = self._generate_fit_arguments(X, data)
+
+        if self._fit_params is not None and len(data) < 2 * self._cold_fit_size \
+                and not self.is_finished():
+            # only a few points were added since the last full fit, so the
+            # previous optimum is a good initial guess
+            try:
+                result = least_squares(self._cost_function, self._fit_params,
+                                       args=(X, data), bounds=bounds, x_scale="jac",
+                                       max_nfev=1000, ftol=1e-5)
+                if result.success:
+                    sigma = std(abs(self._model(X, *result.x) - data))
+                    return result, sqrt(diag(sigma ** 2 * pinv(result.jac.T.dot(result.jac))))
+            except ValueError:
+                # the previous optimum is out of the new bounds
+                pass
+
+        self._cold_fit_size = len(data)
         try:
             p0, err = curve_fit(lambda x, *params: real(self._model(x, *params)) + imag(self._model(x, *params)),
                                 X, real(data) + imag(data),
@@ -107,8 +227,85 @@ class VNATimeResolvedDispersiveMeasurement1DResult( \
 
             return result, sqrt(diag(sigma ** 2 * pinv(result.jac.T.dot(result.jac))))
 
+    def _fit_complex_curves(self, X, traces):
+        """
+        Fits many traces at once, e.g. the rows of a 2D measurement. Like in
+        _fit_complex_curve(...), every trace is fitted from two initial
+        guesses: its generated one and the optimum of a neighbour, here the
+        middle trace, which is fitted on its own first.
+
+        The fits are independent, so they are done in lockstep by
+        _batched_least_squares(...): the model is evaluated for all the
+        traces at once and the Jacobians are estimated with a few such
+        evaluations. The model must accept columns of parameters for that.
+
+        Parameters
+        ----------
+        X: array of shape (number of points,)
+        traces: array of shape (number of traces, number of points)
+            zeros are not fitted
+
+        Returns
+        -------
+        params, errors: arrays of shape (number of traces, number of parameters)
+            NaN for the traces with less than 5 points
+        """
+        masks = traces != 0
+        fitted = where(masks.sum(axis=1) >= 5)[0]
+        n_params = len(self.get_model_parameter_names())
+        params, errors = full((len(traces), n_params), nan), full((len(traces), n_params), nan)
+        if len(fitted) == 0:
+            return params, errors
+
+        middle = fitted[len(fitted) // 2]
+        try:
+            seed = self._fit_complex_curve(X[masks[middle]], traces[middle][masks[middle]])[0].x
+        except Exception:
+            seed = None
+
+        starts, lower_bounds, upper_bounds, owners = [], [], [], []
+        for idx in fitted:
+            p0, bounds = self._generate_fit_arguments(X[masks[idx]], traces[idx][masks[idx]])
+            lower_bound, upper_bound = hstack(bounds[0]), hstack(bounds[1])
+            for start in (p0, seed) if seed is not None else (p0,):
+                starts.append(clip(hstack(start), lower_bound, upper_bound))
+                lower_bounds.append(lower_bound)
+                upper_bounds.append(upper_bound)
+                owners.append(idx)
+        owners = array(owners)
+
+        def cost_function(params, fits):
+            differences = (self._model(X, *params.T[:, :, np.newaxis]) - traces[owners[fits]]) * \
+                          masks[owners[fits]]
+            return hstack((real(differences), imag(differences)))
+
+        fit_params, jac = _batched_least_squares(cost_function, array(starts, dtype=float),
+                                                 array(lower_bounds, dtype=float),
+                                                 array(upper_bounds, dtype=float))
+
+        best_sigmas = full(len(traces), inf)
+        for fit_idx, idx in enumerate(owners):
+            sigma = std(abs(self._model(X, *fit_params[fit_idx]) - traces[idx])[masks[idx]])
+            if sigma < best_sigmas[idx]:
+                best_sigmas[idx] = sigma
+                params[idx] = fit_params[fit_idx]
+                errors[idx] = sqrt(diag(sigma ** 2 * pinv(jac[fit_idx].T.dot(jac[fit_idx]))))
+        return params, errors
+
     def fit(self):
+        """
+        Fits the data unless it has not changed since the last fit. While the
+        measurement is running, the fit starts from the previous optimum
+        until the number of points doubles since the last full fit
+        """
+        with self._fit_lock:
+            version = (self.get_data_version(), self.is_finished())
+            if version == self._fit_version:
+                return
+            self._fit_version = version
+            self._fit()
 
+    def _fit(self):
         meas_data = self.get_data()
         # hotfix. KeyError happens sometimes. Due to the fact that
         # I manually set _data to {} in order overcome to avoid
@@ -201,7 +398,12 @@ class VNATimeResolvedDispersiveMeasurement1DResult( \
 
     def _plot_fit(self, axes, do_fit=True):
         if do_fit:
-            self.fit()
+            if getattr(self, "_dynamic", False) and not self.is_finished():
+                # the last fit available is drawn, the new one is done in
+                # the background
+                self._get_fit_worker().request()
+            else:
+                self.fit()
         if self._fit_params is None:
             return
 
@@ -228,9 +430,24 @@ class VNATimeResolvedDispersiveMeasurement1DResult( \
             self._annotate_fit_plot(idx, ax, opt_params, err)
             plt.draw()
 
+    def _get_fit_worker(self):
+        if self._fit_worker is None:
+            self._fit_worker = FitWorker(self.fit)
+        return self._fit_worker
+
     def __getstate__(self):
         d = super().__getstate__()
         d['_lines'] = [None]*2
         d['_fit_lines'] = [None]*2
         d['_anno'] = [None]*2
-        return d
\ No newline at end of file
+        d['_fit_lock'] = None
+        d['_fit_worker'] = None
+        return d
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._fit_lock = Lock()
+        # results saved before the fit cache
+        self.__dict__.setdefault("_fit_version", None)
+        self.__dict__.setdefault("_cold_fit_size", 0)
+        self.__dict__.setdefault("_fit_worker", None)
\ No newline at end of file
@@ -1,6 +1,12 @@
 from matplotlib import pyplot as plt, colorbar
 from lib2.VNATimeResolvedDispersiveMeasurement import *
 
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _fit_traces(trace_result, X, traces):
+    return trace_result._fit_complex_curves(X, traces)
+
 
 class VNATimeResolvedDispersiveMeasurement2D(VNATimeResolvedDispersiveMeasurement):
 
@@ -11,10 +17,73 @@ class VNATimeResolvedDispersiveMeasurement2D(VNATimeResolvedDispersiveMeasuremen
 
 class VNATimeResolvedDispersiveMeasurement2DResult(VNATimeResolvedDispersiveMeasurementResult):
 
+    # 1D result class fitting a single trace of the data and the parameter
+    # along the traces, to be set in child classes, see fit_traces(...)
+    _trace_result_class = None
+    _trace_parameter_name = None
+
     def __init__(self, name, sample_name):
         super().__init__(name, sample_name)
         self._maps = [None]*4
         self._cbs = [None]*4
+        self._fit_maps = None
+
+    def fit_traces(self, n_workers=0, chunk_size=16):
+        """
+        Fits every trace of the data along self._trace_parameter_name with
+        the model of self._trace_result_class, see
+        VNATimeResolvedDispersiveMeasurement1DResult._fit_complex_curves(...)
+
+        Parameters
+        ----------
+        n_workers: int
+            number of processes sharing the chunks of traces, 0 to fit them
+            in this process
+        chunk_size: int
+            number of neighbouring traces fitted at once
+
+        Returns
+        -------
+        dict
+            {model parameter name: (values, errors)}, the arrays have the
+            shape of the data without the trace axis, NaN where there were
+            too few points to fit
+        """
+        data = self.get_data()
+        trace_axis = self._parameter_names.index(self._trace_parameter_name)
+        traces = moveaxis(data["data"], trace_axis, -1)
+        maps_shape = traces.shape[:-1]
+        traces = traces.reshape(-1, traces.shape[-1])
+
+        trace_result = self._trace_result_class(self._name, self._sample_name)
+        trace_result.set_parameter_names([self._trace_parameter_name])
+        X = trace_result._prepare_data_for_plot(
+            {self._trace_parameter_name: data[self._trace_parameter_name],
+             "data": traces[0]})[0]
+
+        chunks = [traces[i:i + chunk_size] for i in range(0, len(traces), chunk_size)]
+        if n_workers > 0:
+            with ProcessPoolExecutor(n_workers) as executor:
+                results = list(executor.map(_fit_traces, [trace_result] * len(chunks),
+                                            [X] * len(chunks), chunks))
+        else:
+            results = [_fit_traces(trace_result, X, chunk) for chunk in chunks]
+
+        params = concatenate([result[0] for result in results])
+        errors = concatenate([result[1] for result in results])
+        self._fit_maps = {name: (params[:, idx].reshape(maps_shape),
+                                 errors[:, idx].reshape(maps_shape))
+                          for idx, name in enumerate(trace_result.get_model_parameter_names())}
+        return self._fit_maps
+
+    def get_fit_maps(self):
+        """
+        Returns
+        -------
+        dict
+            the result of the last fit_traces(...), None if there was none
+        """
+        return self._fit_maps
 
     def _prepare_figure(self):
         fig, axes, caxes = super()._prepare_figure()
@@ -75,4 +144,9 @@ class VNATimeResolvedDispersiveMeasurement2DResult(VNATimeResolvedDispersiveMeas
         d = super().__getstate__()
         d['_maps'] = [None]*4
         d['_cbs'] = [None]*4
-        return d
\ No newline at end of file
+        return d
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        # results saved before fit_traces(...)
+        self.__dict__.setdefault("_fit_maps", None)
\ No newline at end of file
@@ -9,6 +9,7 @@ from lib2.Measurement import Measurement
 import lib2.MeasurementResult
 reload(lib2.MeasurementResult)
 from lib2.MeasurementResult import MeasurementResult
+from lib2 import DigitalDownConversion
 
 from drivers.IQAWG import IQAWG
 from drivers.Spectrum_m4x import SPCM, SPCM_MODE,SPCM_TRIGGER
@@ -54,9 +55,9 @@ class DigVNA(Measurement):
         self._iqawg_amplitudes_calib: np.ndarray[float, float] = None
         # bandiwdth of the VNA being faked in Hz
         self._bandwidth: float = None
-        # index in 'fftshift'ed array of the IF frequency
+        # frequency of the sideband in the digitized IQ signal
         # this is set once and for all during call of 'set_fixed_parameters'
-        self._sideband_freq_idx: float = None
+        self._sideband_freq: float = None
 
         # for debug purposes
         self.dataI = []
@@ -103,9 +104,7 @@ class DigVNA(Measurement):
         trigger_every = np.ceil(dig._segment_size/dig.get_sample_rate() / if_period) * if_period  # there are only 1 segment
         iqawg.output_IQ_waves_from_calibration(trigger_sync_every=trigger_every)
 
-        trace_length = dig._segment_size - dig.get_how_many_samples_to_drop_in_front() - dig.get_how_many_samples_to_drop_in_end()
-        fft_freqs = np.fft.fftshift(np.fft.fftfreq(trace_length, 1/dig.get_sample_rate()))
-        self._sideband_freq_idx = np.argmin(np.abs(fft_freqs - (-iqawg._calibration._if_frequency)))
+        self._sideband_freq = -iqawg._calibration._if_frequency
 
     def set_swept_parameters(self, start_freq, stop_freq, nop):
         self._freqs_nop = nop
@@ -141,17 +140,17 @@ class DigVNA(Measurement):
     def _recording_iteration(self):
         dig = self._dig[0]
         iqawg = self._iqawg[0]
-        data = dig.measure(dig._bufsize).astype(float)
-        data_cut = SPCM.extract_useful_data(data, 2, dig._segment_size, dig.get_how_many_samples_to_drop_in_front(),
-                                            dig.get_how_many_samples_to_drop_in_end())
-        data_cut = data_cut / dig.n_avg / 128 * dig.ch_amplitude
-        dataI = data_cut[::2]
-        dataQ = data_cut[1::2]
+        data = dig.scale_data(dig.measure(dig._bufsize))
+        data_cut = SPCM.trim_segments(data, dig.get_how_many_samples_to_drop_in_front(),
+                                      dig.get_how_many_samples_to_drop_in_end())
+        dataI = data_cut[:, :, 0].flatten()
+        dataQ = data_cut[:, :, 1].flatten()
         self.dataI.append(dataI)
         self.dataQ.append(dataQ)
 
-        fft_data = np.fft.fftshift(np.fft.fft(dataI + 1j * dataQ, len(dataI))) / len(dataI)
-        S21 = fft_data[self._sideband_freq_idx]
+        # same as the DFT bin nearest to the sideband frequency
+        S21 = DigitalDownConversion.demodulate(dataI, dataQ, dig.get_sample_rate(),
+                                               self._sideband_freq, bin_centered=True)
 
         return S21
 
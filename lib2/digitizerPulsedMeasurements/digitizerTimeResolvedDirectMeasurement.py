@@ -2,6 +2,7 @@ from enum import Enum, auto
 
 from lib2.DispersivePiPulseAmplitudeCalibration import DispersivePiPulseAmplitudeCalibrationResult
 from lib2.Measurement import Measurement
+from lib2 import DigitalDownConversion, SingleShotReadout
 from lib2.DispersiveRabiOscillations import DispersiveRabiOscillationsResult
 import numpy as np
 from importlib import reload
@@ -39,6 +40,14 @@ class DigitizerTimeResolvedDirectMeasurement(Measurement):
         self._adc_parameters = None
         self._n_samples_to_drop_by_delay = 0
         self._n_samples_to_drop_in_end = 0
+
+        # single-shot readout, see set_single_shot(...)
+        self._single_shot = False
+        self._readout_weights = None
+        self._discriminator = None
+        self._histogram_bins = 50
+        self._histogram_range = None
+
         self._pulse_sequence_parameters: Dict[Union[str, int, float]] = \
             {"modulating_window": "rectangular", "excitation_amplitude": 1,
              "z_smoothing_coefficient": 0}
@@ -46,6 +55,9 @@ class DigitizerTimeResolvedDirectMeasurement(Measurement):
         # for debug purposes
         self.dataI = []
         self.dataQ = []
+        # IQ histograms of the integrated shots in the single-shot mode,
+        # one per processed point
+        self.iq_histograms = []
 
     def set_fixed_parameters(self, pulse_sequence_parameters, freq_limits = (0,50e6),
                              q_lo_params=[], q_iqawg_params=[], dig_params=[]):
@@ -63,7 +75,8 @@ class DigitizerTimeResolvedDirectMeasurement(Measurement):
         Notes
         ----------
         If digitizer 'mode' and 'trigger_source' are absent they
-        are set to 'averaging' and 'EXT0' respectively
+        are set to 'averaging' ('multimode' in the single-shot mode)
+        and 'EXT0' respectively
         """
 
         # LO source initialization
@@ -85,7 +98,7 @@ class DigitizerTimeResolvedDirectMeasurement(Measurement):
         # for all child experiments this parameters are default for
         # digitizer acquisition mode
         if "mode" not in dig_params[0]:
-            dig_params[0]["mode"] = SPCM_MODE.AVERAGING
+            dig_params[0]["mode"] = SPCM_MODE.MULTIMODE if self._single_shot else SPCM_MODE.AVERAGING
         if "trig_source" not in dig_params:
             dig_params[0]["trig_source"] = SPCM_TRIGGER.EXT0
 
@@ -96,6 +109,82 @@ class DigitizerTimeResolvedDirectMeasurement(Measurement):
             "pulse_sequence_parameters": pulse_sequence_parameters
         })
 
+    def set_single_shot(self, enabled=True, histogram_bins=50):
+        """
+        Switches to the single-shot readout: every segment of the digitizer
+        in the multiple recording mode is a separate shot. The shots are
+        integrated with the readout weights and, after train_single_shot(...),
+        classified, so the measured value is the excited state population.
+        Otherwise, it is the mean of the integrated shots projected on the
+        basis like in the averaging mode. Call before set_fixed_parameters(...)
+        with 'n_seg' being the number of shots per point. The background
+        subtraction (set_ult_calib(...)) is not supported in this mode.
+
+        Parameters
+        ----------
+        histogram_bins: int
+            number of bins along each axis of the IQ histograms of the shots
+            stored in 'iq_histograms'
+        """
+        if enabled and self._ult_calib:
+            raise ValueError("Background subtraction (set_ult_calib) is not "
+                             "supported in the single-shot readout")
+        self._single_shot = enabled
+        self._histogram_bins = histogram_bins
+        self._histogram_range = None
+
+    def measure_single_shot_traces(self):
+        """
+        Acquires the shots with the current pulse sequence
+
+        Returns
+        -------
+        numpy.ndarray of complex, shape (n_seg, number of samples)
+            I + 1j * Q traces of the shots, mV
+        """
+        dig_data, n_drop_by_delay, n_drop_in_end, sample_rate, if_frequency = self._acquire_trace()
+        dig_data = SPCM.trim_segments(dig_data, n_drop_by_delay, n_drop_in_end)
+        return dig_data[:, :, 0] + 1j * dig_data[:, :, 1]
+
+    def train_single_shot(self, ground_traces, excited_traces, discriminator="linear"):
+        """
+        Sets the matched filter readout weights and trains the discriminator
+        of the integrated shots
+
+        Parameters
+        ----------
+        ground_traces, excited_traces: numpy.ndarray of complex
+            outputs of measure_single_shot_traces() for the prepared states
+        discriminator: str
+            "linear" or "gmm", see SingleShotReadout
+
+        Returns
+        -------
+        float
+            assignment fidelity on the training shots
+        """
+        if discriminator == "linear":
+            self._discriminator = SingleShotReadout.LinearDiscriminator()
+        elif discriminator == "gmm":
+            self._discriminator = SingleShotReadout.GaussianMixtureDiscriminator()
+        else:
+            raise ValueError("Unknown discriminator: %s" % discriminator)
+
+        self._readout_weights = SingleShotReadout.matched_filter_weights(ground_traces, excited_traces)
+        ground_shots = SingleShotReadout.integrate(np.real(ground_traces), np.imag(ground_traces),
+                                                   self._readout_weights)
+        excited_shots = SingleShotReadout.integrate(np.real(excited_traces), np.imag(excited_traces),
+                                                    self._readout_weights)
+        self._discriminator.fit(ground_shots, excited_shots)
+        self._histogram_range = self._get_histogram_range(np.concatenate((ground_shots, excited_shots)))
+        return self._discriminator.get_assignment_fidelity(ground_shots, excited_shots)
+
+    @staticmethod
+    def _get_histogram_range(shots):
+        margin = 0.1 * max(np.ptp(np.real(shots)), np.ptp(np.imag(shots)), np.finfo(float).tiny)
+        return [[np.min(np.real(shots)) - margin, np.max(np.real(shots)) + margin],
+                [np.min(np.imag(shots)) - margin, np.max(np.imag(shots)) + margin]]
+
     def set_basis(self, basis):
         d_real, d_imag = self._calculate_basis_complex_amplitudes(basis)
         relation = d_real / d_imag
@@ -169,58 +258,124 @@ class DigitizerTimeResolvedDirectMeasurement(Measurement):
         return d_real, d_imag
 
     def set_ult_calib(self, value=False):
+        if value and self._single_shot:
+            raise ValueError("Background subtraction is not supported in the "
+                             "single-shot readout (set_single_shot)")
         self._ult_calib = value
 
     def _single_measurement(self):
+        IQ, data_i, data_q = self._demodulate_trace(*self._acquire_trace())
+        self.dataI.append(data_i)
+        self.dataQ.append(data_q)
+        return IQ
+
+    def _acquire_trace(self):
+        """
+        Reads a trace from the digitizer, converted to mV, along with the
+        acquisition settings required to process it later by
+        _demodulate_trace(...)
+        """
         dig = self._dig[0]
-        dig_data = dig.measure()
-        # convertion to mV is according to
-        # https://spectrum-instrumentation.com/sites/default/files/download/m4i_m4x_22xx_manual_english.pdf
-        # p.81
-        dig_data = dig_data.astype(float) / dig.n_avg / 128 * dig.ch_amplitude
+        # scaled copy, the digitizer buffer is reused by the next acquisition
+        return dig.scale_data(dig.measure()), \
+            self._n_samples_to_drop_by_delay, self._n_samples_to_drop_in_end, \
+            dig.get_sample_rate(), self._q_iqawg[0]._calibration._if_frequency
+
+    def _demodulate_trace(self, dig_data, n_drop_by_delay, n_drop_in_end,
+                          sample_rate, if_frequency):
+        # dig_data is (segments, samples, channels) array in mV
+        dig_data = SPCM.trim_segments(dig_data, n_drop_by_delay, n_drop_in_end)
 
         # I channel data exctraction
-        data_i = dig_data[0::2]
-        data_i = data_i.reshape(dig.n_seg, round(data_i.shape[0] / dig.n_seg))
-        data_i = data_i[:, self._n_samples_to_drop_by_delay: -self._n_samples_to_drop_in_end]
-        data_i = data_i.flatten()
+        data_i = dig_data[:, :, 0].flatten()
 
         # Q channel data exctraction
-        data_q = dig_data[1::2]
-        data_q = data_q.reshape(dig.n_seg, round(data_q.shape[0] / dig.n_seg))
-        data_q = data_q[:, self._n_samples_to_drop_by_delay: -self._n_samples_to_drop_in_end]
-        data_q = data_q.flatten()
-
-        freq = np.fft.fftfreq(len(data_i), d=1/self._dig[0].get_sample_rate())
-        freq = np.fft.fftshift(freq)
-        signal = np.fft.fftshift(np.fft.fft(data_i + 1j * data_q))
-        # next row can be optimized with np.searchsorted and 2 comparisons with nearest elements
-        idx = np.argmin(np.abs(freq - (self._q_iqawg[0]._calibration._if_frequency)))
-        IQ = signal[idx] / len(data_i)
-
-        # save full data in case of more detailed investigation
-        self.dataI.append(data_i)
-        self.dataQ.append(data_q)
-        return IQ
+        data_q = dig_data[:, :, 1].flatten()
+
+        # same as the DFT bin nearest to the IF frequency
+        IQ = DigitalDownConversion.demodulate(data_i, data_q, sample_rate, if_frequency,
+                                              bin_centered=True)
+        # full data is returned to be saved in case of more detailed investigation
+        return IQ, data_i, data_q
 
     def _recording_iteration(self):
+        return self._store_iteration(self._process_iteration(self._acquire_iteration()))
+
+    def _acquire_iteration(self):
+        # pulse sequence already played buy AWG
+        fg = self._acquire_trace()
         if self._ult_calib:
-            # pulse sequence already played buy AWG
-            fg = self._single_measurement()
             # close input mixer to measure background
             self._output_zero_sequence()
-            bg = self._single_measurement()
-            mean_data = fg - bg
+            bg = self._acquire_trace()
         else:
-            mean_data = self._single_measurement()
+            bg = None
+        return fg, bg, self._basis
 
-        if self._basis is None:
-            return mean_data
+    def _process_iteration(self, raw_data):
+        """
+        Returns
+        -------
+        data, traces, shots
+            data of the point, the (I, Q) traces for 'dataI' and 'dataQ' and
+            the single shots for 'iq_histograms' (None in the averaging mode),
+            see _store_iteration(...)
+        """
+        fg, bg, basis = raw_data
+        if self._single_shot:
+            shots = self._integrate_shots(*fg)
+            if self._discriminator is not None:
+                return self._discriminator.get_population(shots), [], shots
+            mean_data = np.mean(shots)
+            traces = []
+        else:
+            shots = None
+            mean_data, data_i, data_q = self._demodulate_trace(*fg)
+            traces = [(data_i, data_q)]
+            if bg is not None:
+                bg_data, data_i, data_q = self._demodulate_trace(*bg)
+                mean_data = mean_data - bg_data
+                traces.append((data_i, data_q))
+
+        if basis is None:
+            return mean_data, traces, shots
         else:
-            basis = self._basis
             p_r = (np.real(mean_data) - np.real(basis[0])) / (np.real(basis[1]) - np.real(basis[0]))
             p_i = (np.imag(mean_data) - np.imag(basis[0])) / (np.imag(basis[1]) - np.imag(basis[0]))
-            return p_r + 1j * p_i
+            return p_r + 1j * p_i, traces, shots
+
+    def _store_iteration(self, processed):
+        data, traces, shots = processed
+        for data_i, data_q in traces:
+            self.dataI.append(data_i)
+            self.dataQ.append(data_q)
+        if shots is not None:
+            # the range is taken from the first point in the sweep order, so
+            # all the histograms are binned the same way
+            if self._histogram_range is None:
+                self._histogram_range = self._get_histogram_range(shots)
+            self.iq_histograms.append(np.histogram2d(np.real(shots), np.imag(shots),
+                                                     bins=self._histogram_bins,
+                                                     range=self._histogram_range)[0])
+        return data
+
+    def _integrate_shots(self, dig_data, n_drop_by_delay, n_drop_in_end,
+                         sample_rate, if_frequency):
+        """
+        Integrates all the segments of a multiple recording acquisition
+
+        Returns
+        -------
+        numpy.ndarray of complex, shape (n_seg,)
+        """
+        dig_data = SPCM.trim_segments(dig_data, n_drop_by_delay, n_drop_in_end)
+        weights = self._readout_weights
+        if weights is None:
+            weights = SingleShotReadout.demodulation_weights(dig_data.shape[1], sample_rate, if_frequency)
+        elif len(weights) != dig_data.shape[1]:
+            raise ValueError("Readout weights are trained for %d samples, the shots have %d"
+                             % (len(weights), dig_data.shape[1]))
+        return SingleShotReadout.integrate(dig_data[:, :, 0], dig_data[:, :, 1], weights)
 
     def _output_zero_sequence(self):
         """
@@ -250,7 +405,11 @@ class DigitizerTimeResolvedDirectMeasurement(Measurement):
         self._n_samples_to_drop_by_delay = dig.get_how_many_samples_to_drop_in_front()
         dig.calc_segment_size()  # updates how many to drop in the end
         self._n_samples_to_drop_in_end = dig.get_how_many_samples_to_drop_in_end()
-        dig.setup_averaging_mode()  # loads new segment size into device
+        # loads new segment size into device
+        if self._single_shot:
+            dig.setup_multiple_recoding_mode()
+        else:
+            dig.setup_averaging_mode()
 
         # DIAGNOSE PHASE JUMPS WITH THIS TIMINGS OUTPUT
         # ns_in_sample = 1e9 / dig.get_sample_rate()
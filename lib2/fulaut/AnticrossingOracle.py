@@ -15,6 +15,38 @@ from scipy.optimize import *
 from scipy.signal import *
 import numpy as np
 
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# number of (candidate, point) pairs evaluated at once by the brute stage
+GRID_CHUNK_SIZE = 2 ** 20
+
+# the sweet spots are not searched any more after a fit as good as this, MHz
+SUFFICIENT_LOSS = 0.05
+
+
+class _SearchCancelled(Exception):
+    pass
+
+
+# index of the search that has already reached SUFFICIENT_LOSS, shared by the
+# worker processes of AnticrossingOracle._search_sweet_spots(...)
+_succeeded_search = None
+
+
+def _init_search_worker(succeeded_search):
+    global _succeeded_search
+    _succeeded_search = succeeded_search
+
+
+def _search_sweet_spot(oracle, idx, sweet_spot_cur):
+    def check_cancelled(*args):
+        # the searches after the succeeded one will not be used
+        if _succeeded_search.value < idx:
+            raise _SearchCancelled()
+
+    return oracle._search_sweet_spot(sweet_spot_cur, check_cancelled)
+
 
 class AnticrossingOracle():
     """
@@ -26,7 +58,12 @@ class AnticrossingOracle():
     qubit_spectra = {"transmon": transmon_spectrum}
 
     def __init__(self, qubit_type, sts_result, plot=False,
-                 fast_res_detect=True, hints={}, remove_outliers=True, silent=False):
+                 fast_res_detect=True, hints={}, remove_outliers=True, silent=False,
+                 n_workers=0):
+        """
+        n_workers: number of processes searching near the potential sweet
+            spots at once, 0 to search one after another in this process
+        """
         self._qubit_spectrum = AnticrossingOracle.qubit_spectra[qubit_type]
         self._sts_result = sts_result
         self._plot = plot
@@ -39,6 +76,7 @@ class AnticrossingOracle():
         self._res_points = []
         self._iteration_counter = 0
         self._silent = silent
+        self._n_workers = n_workers
 
         self._extract_data()
 
@@ -79,53 +117,17 @@ class AnticrossingOracle():
         self._period = self._find_period()
         potential_sweet_spots = self._find_potential_sweet_spots()
 
-        args = (self._res_points[:, 0], self._res_points[:, 1])
-
         self._loss = 1e100
         # We are not sure where the sweet spot is, so let's choose the best
         # fit among two possibilities:
-        for sweet_spot_cur in potential_sweet_spots:
-
-            mean_cur = mean(self._res_points[:, 0])
-            distance_to_sws = abs(mean_cur - sweet_spot_cur)
-            shift = round(distance_to_sws / self._period) * self._period * sign(
-                mean_cur - sweet_spot_cur)
-            sweet_spot_cur += shift
-
-            frozen_parameters = {key: self._hints[key] for key in self._default_parameter_ranges if key in self._hints}
-            frozen_parameters["period"] = self._period
-            frozen_parameters["sws_current"] = sweet_spot_cur
-            self.freeze_parameters(frozen_parameters)
-            brute_grids = self._generate_brute_grids()
-
-            self._iteration_counter = 0
-            brute_result = brute(self._cost_function,
-                                 brute_grids,
-                                 args=args,
-                                 finish=None)
-            brute_loss = \
-                sqrt(self._cost_function(brute_result, *args) / len(self._res_points)) / 1e6
-
-            brute_full_result = self._active_params_to_full_params(list(brute_result))
-
-            frozen_parameters = {key: self._hints[key] for key in self._default_parameter_ranges if key in self._hints}
-            self.freeze_parameters(frozen_parameters)
-            self._iteration_counter = 0
-            nm_result = minimize(self._cost_function,
-                                 self._full_parameters_to_active_parameters(brute_full_result),
-                                 args=args, method="Nelder-Mead").x
-            loss = \
-                sqrt(self._cost_function(nm_result, *args) / len(self._res_points)) / 1e6
-
+        for brute_full_result, brute_loss, opt_params, loss in \
+                self._search_sweet_spots(potential_sweet_spots):
             if loss < self._loss:
                 self._brute_opt_params = brute_full_result
                 self._brute_loss = brute_loss
-                self._opt_params = self._active_params_to_full_params(nm_result)
+                self._opt_params = opt_params
                 self._loss = loss
 
-            if loss < 0.05:
-                break
-
         res_freq, g, period, sweet_spot_cur, q_freq, d = self._opt_params
 
         if self._plot:
@@ -150,6 +152,113 @@ class AnticrossingOracle():
 
         return self._opt_params, self._loss
 
+    def _search_sweet_spots(self, sweet_spots):
+        """
+        Runs _search_sweet_spot(...) for the sweet spots in order until the
+        loss is below SUFFICIENT_LOSS, concurrently if n_workers > 0
+
+        Returns
+        -------
+        list
+            results of the searches that were needed
+        """
+        if self._n_workers == 0 or len(sweet_spots) < 2:
+            results = []
+            for sweet_spot_cur in sweet_spots:
+                results.append(self._search_sweet_spot(sweet_spot_cur))
+                if results[-1][-1] < SUFFICIENT_LOSS:
+                    break
+            return results
+
+        results = []
+        succeeded_search = multiprocessing.Value("i", len(sweet_spots))
+        with ProcessPoolExecutor(min(self._n_workers, len(sweet_spots)),
+                                 initializer=_init_search_worker,
+                                 initargs=(succeeded_search,)) as executor:
+            futures = [executor.submit(_search_sweet_spot, self, idx, sweet_spot_cur)
+                       for idx, sweet_spot_cur in enumerate(sweet_spots)]
+            # the results are taken in order, so the choice is the same as
+            # in the sequential search
+            for idx, future in enumerate(futures):
+                results.append(future.result())
+                if results[-1][-1] < SUFFICIENT_LOSS:
+                    succeeded_search.value = idx
+                    for pending in futures[idx + 1:]:
+                        pending.cancel()
+                    break
+        return results
+
+    def _search_sweet_spot(self, sweet_spot_cur, callback=None):
+        """
+        Fits the model with brute force and then Nelder-Mead for the sweet
+        spot near the given current
+
+        Parameters
+        ----------
+        callback: callable
+            called between the brute force chunks and the Nelder-Mead
+            iterations, may raise to stop the search
+
+        Returns
+        -------
+        brute_full_result: list
+        brute_loss: float, MHz
+        opt_params: list
+        loss: float, MHz
+        """
+        args = (self._res_points[:, 0], self._res_points[:, 1])
+
+        mean_cur = mean(self._res_points[:, 0])
+        distance_to_sws = abs(mean_cur - sweet_spot_cur)
+        shift = round(distance_to_sws / self._period) * self._period * sign(
+            mean_cur - sweet_spot_cur)
+        sweet_spot_cur += shift
+
+        frozen_parameters = {key: self._hints[key] for key in self._default_parameter_ranges if key in self._hints}
+        frozen_parameters["period"] = self._period
+        frozen_parameters["sws_current"] = sweet_spot_cur
+        self.freeze_parameters(frozen_parameters)
+        brute_grids = self._generate_brute_grids()
+
+        brute_result, brute_cost = self._brute(brute_grids, *args, callback=callback)
+        brute_loss = sqrt(brute_cost / len(self._res_points)) / 1e6
+
+        brute_full_result = self._active_params_to_full_params(list(brute_result))
+
+        frozen_parameters = {key: self._hints[key] for key in self._default_parameter_ranges if key in self._hints}
+        self.freeze_parameters(frozen_parameters)
+        self._iteration_counter = 0
+        nm_result = minimize(self._cost_function,
+                             self._full_parameters_to_active_parameters(brute_full_result),
+                             args=args, method="Nelder-Mead", callback=callback).x
+        loss = \
+            sqrt(self._cost_function(nm_result, *args) / len(self._res_points)) / 1e6
+
+        return brute_full_result, brute_loss, self._active_params_to_full_params(nm_result), loss
+
+    def _brute(self, slices, curs, res_freqs, callback=None):
+        """
+        Same as brute(self._cost_function, slices, args=(curs, res_freqs),
+        finish=None), but evaluates the model for many grid points at once
+
+        Returns
+        -------
+        active_params: numpy.ndarray
+        cost: float
+        """
+        grid = np.mgrid[tuple(slices)].reshape(len(slices), -1).T
+        chunk_size = max(GRID_CHUNK_SIZE // len(curs), 1)
+        costs = []
+        for start in range(0, len(grid), chunk_size):
+            if callback is not None:
+                callback(grid[start])
+            params = self._active_params_to_full_params(grid[start:start + chunk_size].T)
+            params = [np.reshape(param, (-1, 1)) for param in params]
+            costs.append(sum((self._model_fast(curs, params) - res_freqs) ** 2, axis=1))
+        costs = concatenate(costs)
+        best = argmin(costs)
+        return grid[best], costs[best]
+
     def _extract_data(self, plot=False):
         try:
             data = self._sts_result.get_data()
@@ -307,6 +416,10 @@ class AnticrossingOracle():
         return array([E0 - E0, E1 - E0, E2 - E0])
 
     def _model_fast(self, curs, params, plot=False):
+        """
+        The params may also be columns of values for many models at once, the
+        rows of the result are then the models
+        """
         f_r, g = params[:2]
         qubit_params = params[2:]
         #     phis_fine = linspace(phis[0],phis[-1], 1000)
@@ -324,7 +437,7 @@ class AnticrossingOracle():
         upper_limit = f_r + freq_span
         lower_limit = f_r - freq_span
 
-        res_freqs_model = zeros_like(curs) + 0.5 * (self._freqs[-1] + self._freqs[0])
+        res_freqs_model = zeros_like(levels[1]) + 0.5 * (self._freqs[-1] + self._freqs[0])
         idcs1 = where(logical_and(lower_limit < levels[1, :],
                                   levels[1, :] < upper_limit))
         idcs2 = where(logical_and(lower_limit < levels[2, :],
@@ -367,5 +480,16 @@ class AnticrossingOracle():
         self._iteration_counter += 1
         return sum(cost)
 
+    def __getstate__(self):
+        # for the search workers, which only need the extracted data
+        state = self.__dict__.copy()
+        del state["_sts_result"], state["_logger"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sts_result = None
+        self._logger = LoggingServer.getInstance("")
+
     def get_res_points(self):
         return self._res_points
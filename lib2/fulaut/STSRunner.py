@@ -47,7 +47,8 @@ class STSRunner():
         ao = AnticrossingOracle("transmon", self._sts_result,
                                 plot=True,
                                 fast_res_detect=False,
-                                hints = STSRunnerParameters().anticrossing_oracle_hints)
+                                hints = STSRunnerParameters().anticrossing_oracle_hints,
+                                n_workers=2)
         res_points = ao.get_res_points()
         params, loss = ao.launch()
 
@@ -13,6 +13,8 @@ import os
 import pickle
 from threading import Lock
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 from IPython.display import clear_output
 import locale
@@ -26,6 +28,85 @@ def find(pattern, path):
     return result
 
 
+# number of (candidate, point) pairs evaluated at once by the grid rankings
+GRID_CHUNK_SIZE = 2 ** 20
+
+
+def _coarse_rankings(spectrum, params, points, y_scan_area_size, n_parameter_values):
+    """
+    SpectrumOracle._cost_function_coarse(...) for many candidates at once
+
+    Parameters
+    ----------
+    params: numpy.ndarray, shape (number of candidates, 4)
+
+    Returns
+    -------
+    valid: numpy.ndarray of bool
+        candidates that the cost function would record
+    nop_ranking, distance_ranking: numpy.ndarray
+        recorded rankings of the candidates
+    """
+    distances = abs(spectrum(points[:, 0], *params.T[:, :, np.newaxis]) - points[:, 1])
+    chosen = distances < y_scan_area_size
+    n_chosen = chosen.sum(axis=1)
+    valid = (n_chosen >= n_parameter_values / 10) & (params[:, 3] <= 0.9)
+
+    bin = round(n_parameter_values * 0.1, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nop_ranking = 1 / (np.round(n_chosen / bin, 0) * bin)
+        distance_ranking = np.where(chosen, distances, 0).sum(axis=1) ** 2 / n_chosen
+    return valid, nop_ranking, distance_ranking
+
+
+def _fine_rankings(spectrum, params, points, y_scan_area_size, n_parameter_values):
+    """
+    SpectrumOracle._cost_function_fine_fast(...) for many candidates at once,
+    see _coarse_rankings(...)
+
+    Parameters
+    ----------
+    params: numpy.ndarray, shape (number of candidates, 5)
+    """
+    n_points = len(points)
+    x = points[:, 0]
+    q_freqs = spectrum(x, *params.T[:4, :, np.newaxis])
+    shifts = -np.arange(4) * params[:, 4:5]
+    distances = abs(q_freqs[:, np.newaxis, :] - points[:, 1] + shifts[:, :, np.newaxis])
+    distances = distances.reshape(-1, n_points)
+    chosen = distances < y_scan_area_size
+
+    # The closest point is taken from every group of the chosen points with the
+    # same x. A group starts where x differs from the previous chosen point
+    # (or from 0 for the first one); the last group is dropped if its x is 0.
+    point_idx = np.arange(n_points)
+    last_chosen = np.maximum.accumulate(np.where(chosen, point_idx, -1), axis=1)
+    previous_chosen = np.concatenate((np.full((len(chosen), 1), -1), last_chosen[:, :-1]), axis=1)
+    previous_x = np.where(previous_chosen >= 0, x[previous_chosen], 0)
+    starts = chosen & (x != previous_x)
+
+    last_start = np.maximum.accumulate(np.where(starts, point_idx, -1), axis=1)[:, -1]
+    kept_starts = starts.copy()
+    dropped = (last_chosen[:, -1] >= 0) & (x[last_chosen[:, -1]] == 0) & (last_start >= 0)
+    kept_starts[dropped, last_start[dropped]] = False
+
+    # segments end at the next group or at the end of a row
+    segments = np.union1d(np.flatnonzero(starts), np.arange(len(chosen)) * n_points)
+    minima = np.minimum.reduceat(np.where(chosen, distances, np.inf).ravel(), segments)
+    kept = kept_starts.ravel()[segments]
+    rows = segments[kept] // n_points
+    n_groups = np.bincount(rows, minlength=len(chosen)).reshape(-1, 4)
+    squares_sums = np.bincount(rows, weights=minima[kept] ** 2,
+                               minlength=len(chosen)).reshape(-1, 4)
+
+    valid = n_groups[:, 0] >= 0.33 * n_parameter_values
+    bin = round(n_parameter_values * 0.25, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nop_ranking = 1 / (np.round(n_groups.sum(axis=1) / bin, 0) * bin)
+        distance_ranking = squares_sums.sum(axis=1) / n_groups[:, 0]
+    return valid, nop_ranking, distance_ranking
+
+
 class SpectrumOracle:
     """
     This class automatically processes spectral data for different types of qubits
@@ -33,17 +114,21 @@ class SpectrumOracle:
     qubit_spectra = {"transmon": transmon_spectrum}
 
     def __init__(self, qubit_type, tts_result, initial_guess_qubit_params,
-                 plot=False):
+                 plot=False, n_workers=0):
         """
         parameter_period_grid = grids[0]
         parameter_at_sweet_spot_grid = grids[1]
         frequency_grid = grids[2]
         d_grid = grids[3]
         alpha_grid = grids[4]
+
+        n_workers: number of processes sharing the brute force grids, 0 to
+            evaluate them in this process
         """
         self._tts_result = tts_result
         self._qubit_spectrum = SpectrumOracle.qubit_spectra[qubit_type]
         self._plot = plot
+        self._n_workers = n_workers
         self._extract_data()
 
         self._y_scan_area_size = 35e-3
@@ -102,23 +187,10 @@ class SpectrumOracle:
 
         # refine frequency
         self._counter = 0
-        self._coarse_brute_candidates = []
-        self._coarse_brute_nop_ranking = []
-        self._coarse_brute_distance_ranking = []
-        self._coarse_brute_frequency_ranking = []
-
-        brute(self._cost_function_coarse,
-              (period_slice, sws_slice, freq_slice, d_slice),
-              args=(self._y_scan_area_size * 2,
-                    self._points),
-              full_output=False,
-              finish=None)
-
         nop_rank, mean_dist, opt_params_very_coarse = \
-            sorted(zip(self._coarse_brute_nop_ranking,
-                       self._coarse_brute_distance_ranking,
-                       self._coarse_brute_candidates),
-                   key=itemgetter(0, 1))[0]
+            self._rank_grid(_coarse_rankings,
+                            (period_slice, sws_slice, freq_slice, d_slice),
+                            self._y_scan_area_size * 2)
         # return
         freq_slice = slice(opt_params_very_coarse[2] - 100e-3,
                            opt_params_very_coarse[2] + 101e-3,
@@ -131,22 +203,10 @@ class SpectrumOracle:
         self._iterations = (self._grids[1][2] + 1) * 21 * 11
 
         self._counter = 0
-        self._coarse_brute_candidates = []
-        self._coarse_brute_nop_ranking = []
-        self._coarse_brute_distance_ranking = []
-        self._coarse_brute_frequency_ranking = []
-
-        brute(self._cost_function_coarse,
-              (period_slice, sws_slice, freq_slice, d_slice),
-              args=args,
-              full_output=True,
-              finish=None)
-
         nop_rank, mean_dist, opt_params_coarse = \
-            sorted(zip(self._coarse_brute_nop_ranking,
-                       self._coarse_brute_distance_ranking,
-                       self._coarse_brute_candidates),
-                   key=itemgetter(0, 1))[0]
+            self._rank_grid(_coarse_rankings,
+                            (period_slice, sws_slice, freq_slice, d_slice),
+                            self._y_scan_area_size)
 
         self._coarse_brute_loss = (nop_rank, mean_dist)
         chosen_points = \
@@ -195,18 +255,8 @@ class SpectrumOracle:
         self._iterations = 21 * (self._grids[-1][2] + 1)
 
         self._counter = 0
-        self._fine_brute_candidates = []
-        self._fine_brute_nop_ranking = []
-        self._fine_brute_distance_ranking = []
-
-        brute(self._cost_function_fine_fast, self._fine_slices,
-              args=args, Ns=1,
-              full_output=False, finish=None)
-
-        best_solution = sorted(zip(self._fine_brute_nop_ranking,
-                                   self._fine_brute_distance_ranking,
-                                   self._fine_brute_candidates),
-                               key=itemgetter(0, 1))[0][-1]
+        best_solution = self._rank_grid(_fine_rankings, self._fine_slices,
+                                        self._y_scan_area_size)[-1]
 
         chosen_points = self._cost_function_fine_fast(best_solution, self._y_scan_area_size,
                                                       self._points, True)[1]
@@ -245,6 +295,57 @@ class SpectrumOracle:
         self._fine_opt_params[2] = self._fine_opt_params[2] * 1e9
         return array(self._fine_opt_params)
 
+    def _rank_grid(self, rankings, slices, y_scan_area_size):
+        """
+        Evaluates the rankings on the same grid as scipy.optimize.brute(...)
+        in chunks, stores the recorded candidates and rankings like the cost
+        functions do
+
+        Parameters
+        ----------
+        rankings: _coarse_rankings or _fine_rankings
+        slices: tuple of slice
+
+        Returns
+        -------
+        tuple
+            nop ranking, distance ranking and parameters of the best candidate
+        """
+        grid = np.mgrid[tuple(slices)]
+        grid = grid.reshape(len(slices), -1).T
+        chunk_size = max(GRID_CHUNK_SIZE // (4 * len(self._points)), 1)
+        chunks = [grid[i:i + chunk_size] for i in range(0, len(grid), chunk_size)]
+        args = (self._points, y_scan_area_size, len(self._parameter_values))
+
+        if self._n_workers > 0:
+            with ProcessPoolExecutor(self._n_workers) as executor:
+                results = list(executor.map(rankings, repeat(self._qubit_spectrum), chunks,
+                                            *[repeat(arg) for arg in args]))
+        else:
+            results = []
+            for idx, chunk in enumerate(chunks):
+                results.append(rankings(self._qubit_spectrum, chunk, *args))
+                print("\rDone: %.2f%%, %d/%d" % ((idx + 1) / len(chunks) * 100,
+                                                 min((idx + 1) * chunk_size, len(grid)),
+                                                 len(grid)), end="")
+        valid, nop_ranking, distance_ranking = \
+            [np.concatenate(result) for result in zip(*results)]
+
+        candidates = list(grid[valid])
+        nop_ranking, distance_ranking = nop_ranking[valid], distance_ranking[valid]
+        if rankings is _fine_rankings:
+            self._fine_brute_candidates = candidates
+            self._fine_brute_nop_ranking = list(nop_ranking)
+            self._fine_brute_distance_ranking = list(distance_ranking)
+        else:
+            self._coarse_brute_candidates = candidates
+            self._coarse_brute_nop_ranking = list(nop_ranking)
+            self._coarse_brute_distance_ranking = list(distance_ranking)
+
+        # the first one of the equally ranked in the order of evaluation
+        best = np.lexsort((distance_ranking, nop_ranking))[0]
+        return nop_ranking[best], distance_ranking[best], candidates[best]
+
     def _extract_data(self):
         try:
             parameter_name = self._tts_result._parameter_names[0]
@@ -7,12 +7,10 @@ import inspect
 from scipy import signal
 from scipy import fftpack
 import matplotlib.pyplot as plt
-import multiprocessing as mp
-import threading as th
-from time import sleep
 from datetime import datetime as dt
 import os
-import psutil
+
+from lib2.SpectralAveraging import SpectralAveragingPipeline
 
 import lib2.IQPulseSequence
 reload(lib2.IQPulseSequence)
@@ -34,6 +32,7 @@ class MollowTriplet(Measurement):
         self._measurement_result = MollowTripletResult(name, sample_name)
 
         self._ult_calib = False
+        self._streaming = False
         self._n_samples_to_drop_by_dig_delay = 0
         self._n_samples_to_drop_in_end = 0
 
@@ -52,10 +51,7 @@ class MollowTriplet(Measurement):
         self._start_idx = None
         # self._frequencies[self._end_idx-1]  < self._freq_limits[1] <= self._frequencies[self._end_idx]
         self._end_idx = None
-
-        self.data_queue = mp.Queue()
-        self.fft_queue = mp.Queue()
-        self.measuring_flag = False
+        self._trace_len = 0  # number of samples in a trace left after the dropped ones
 
     def set_fixed_parameters(self, internal_avg=100, freq_limits=(0,50e6), **dev_params):
         """
@@ -90,8 +86,9 @@ class MollowTriplet(Measurement):
 
         # Fourier and measurement parameters setup
         self._freq_limits = freq_limits
-        trace_len = self._dig[0]._segment_size - self._n_samples_to_drop_in_end - self._n_samples_to_drop_by_dig_delay
-        self._nfft = fftpack.helper.next_fast_len(trace_len)
+        self._trace_len = self._dig[0]._segment_size - self._n_samples_to_drop_in_end - \
+            self._n_samples_to_drop_by_dig_delay
+        self._nfft = fftpack.helper.next_fast_len(self._trace_len)
         xf = fftpack.fftshift(fftpack.fftfreq(self._nfft, 1 / self._dig[0].get_sample_rate()))
         self._start_idx = np.searchsorted(xf, self._freq_limits[0])
         self._end_idx = np.searchsorted(xf, self._freq_limits[1])
@@ -127,7 +124,10 @@ class MollowTriplet(Measurement):
         self._n_samples_to_drop_by_dig_delay = dig.get_how_many_samples_to_drop_in_front()
 
         dig.calc_segment_size(extra=self._n_samples_to_drop_by_dig_delay)
-        dig.setup_standard_mode()
+        if self._streaming and not self._ult_calib:
+            dig.setup_fifo_mode(num_segments=1, num_averages=1)
+        else:
+            dig.setup_standard_mode()
         self._n_samples_to_drop_in_end = dig.get_how_many_samples_to_drop_in_end()
 
     def __setup_signal_source(self):
@@ -138,169 +138,81 @@ class MollowTriplet(Measurement):
     def set_ult_calib(self, value=False):
         self._ult_calib = value
 
-    """This method will be launched in a new thread of the main process and therefore does not have to be static,
-    as it is allowed access to shared memory. It is convenient that this method should stay in the local process, as it
-    requires access to measurement equipment and most of of the time does nothing, except waiting for result.
-    Threading almost does not speed up the execution."""
-    def _measurer(self):
-        self.measuring_flag = True
-        if self._ult_calib:
-            for i in range(self._internal_avg):
-                self.turn_signal_on()
-                fg = self._single_measurement()
-                self.turn_signal_off()
-                bg = self._single_measurement()
-                self.data_queue.put((fg, bg))
-        else:
-            self.turn_signal_on()
-            for i in range(self._internal_avg):
-                fg = self._single_measurement()
-                self.data_queue.put((fg,))
-        self.data_queue.put(None)
-        self.measuring_flag = False
+    def set_streaming(self, value=False):
+        """
+        Acquire the traces in the FIFO mode of the digitizer, so it keeps
+        recording while the previous traces are transferred and processed.
+        Only applies without ultimate calibration, as the signal has to be
+        switched between the traces otherwise. Call before
+        set_fixed_parameters(...).
+        """
+        self._streaming = value
 
-    def _measurer_serial(self):
-        self.measuring_flag = True
+    def _acquire_traces(self):
+        """
+        Yields the traces to be averaged: (signal, background) pairs with the
+        ultimate calibration and (signal,) otherwise
+        """
         if self._ult_calib:
             for i in range(self._internal_avg):
                 self.turn_signal_on()
                 fg = self._single_measurement()
                 self.turn_signal_off()
                 bg = self._single_measurement()
-                self.data_queue.put((fg, bg))
+                yield fg, bg
+        elif self._streaming:
+            self.turn_signal_on()
+            for dig_data in self._dig[0].stream(self._internal_avg):
+                # the trace is copied out of the ring buffer of the card here
+                yield (self._process_trace(dig_data),)
         else:
             self.turn_signal_on()
             for i in range(self._internal_avg):
-                fg = self._single_measurement()
-                self.data_queue.put((fg,))
-        self.data_queue.put(None)
-        self.measuring_flag = False
-
-    """The method has to be static, because it will be sent to another process and has no shared memory
-        with the main process, except for the arguments of a function. Creating new processes speeds up the execution"""
-    @staticmethod
-    def _power_spectrum(data_queue, fft_queue, nfft, start_idx, end_idx, ult_calib, counter, lock):
-        p = psutil.Process()
-        N = 100
-        n = 0
-        buff_fg = np.zeros(end_idx - start_idx + 1)
-        buff_bg = np.zeros(end_idx - start_idx + 1)
-        p.nice(psutil.HIGH_PRIORITY_CLASS)
-        if ult_calib:
-            for (fg_trace, bg_trace) in iter(data_queue.get, None):
-                # fg_pd = np.abs(signal.welch(fg_trace, 1.25e9, nperseg=nfft)[1])
-                # bg_pd = np.abs(signal.welch(bg_trace, 1.25e9, nperseg=nfft)[1])
-                # if len(buff_fg) != len(fg_pd):
-                #     buff_fg = np.zeros(len(fg_pd))
-                #     buff_bg = np.zeros(len(bg_pd))
-                fg_spectrum = fftpack.fftshift(fftpack.fft(fg_trace, nfft)) / nfft
-                bg_spectrum = fftpack.fftshift(fftpack.fft(bg_trace, nfft)) / nfft
-                fg_spectrum = fg_spectrum[start_idx:end_idx + 1]
-                bg_spectrum = bg_spectrum[start_idx:end_idx + 1]
-                buff_fg = np.add(np.abs(fg_spectrum) ** 2, buff_fg)
-                buff_bg = np.add(np.abs(bg_spectrum) ** 2, buff_bg)
-                # buff_fg = np.add(fg_pd, buff_fg)
-                # buff_bg = np.add(bg_pd, buff_bg)
-                n += 1
-                if n == N:
-                    fft_queue.put((buff_fg, buff_bg))
-                    buff_fg = np.zeros(end_idx - start_idx + 1)
-                    buff_bg = np.zeros(end_idx - start_idx + 1)
-                    n = 0
-        else:
-            for (fg_trace,) in iter(data_queue.get, None):
-                fg_spectrum = fftpack.fftshift(fftpack.fft(fg_trace, nfft)) / nfft
-                fgsp_cut = fg_spectrum[start_idx:end_idx + 1]
-                buff_fg = np.add(np.abs(fgsp_cut) ** 2, buff_fg)
-                n += 1
-                if n == N:
-                    fft_queue.put((buff_fg, ))
-                    buff_fg = np.zeros(end_idx - start_idx + 1)
-                    n = 0
-            if n > 0:
-                fft_queue.put((buff_fg))
-        data_queue.put(None)
-        with lock:
-            counter.value -= 1
-
-    """This method will be launched in a new thread of the main process and therefore does not have to be static,
-    as it is allowed access to shared memory. It is convenient that this method should stay in the local process, as it
-    executes one simple task: adding new data to the all one. Threading almost does not speed up the execution."""
-    def _summator(self, counter, lock, done_iterations, lock2):
-        is_running = True
-        N = 100
-        while is_running or not self.fft_queue.empty():
-            with lock:
-                if counter.value == 0:
-                    is_running = False
-            if not self.fft_queue.empty():
-                if self._ult_calib:
-                    power_spectrum_fg, power_spectrum_bg = self.fft_queue.get()
-                    self._internal_data = np.add(self._internal_data, power_spectrum_fg)
-                    self._internal_data_bg = np.add(self._internal_data_bg, power_spectrum_bg)
-                else:
-                    power_spectrum_fg, = self.fft_queue.get()
-                    self._internal_data = np.add(self._internal_data, power_spectrum_fg)
-                with lock2:
-                    done_iterations.value += N
-
-    def _record_data(self):
-        start_time = self._measurement_result.get_start_datetime()
-        number_of_workers = 3 #mp.cpu_count() # PXI CPU has 8 cores
-
-        done_iterations = mp.Value("i", 0)
-        lock1 = mp.Lock()
-        active_workers_number = mp.Value("i", number_of_workers)
-        lock2 = mp.Lock()
-
-        self.measuring_flag = True
-        measurer = th.Thread(target=self._measurer)
-        measurer.start()
-        worker_args = (self.data_queue, self.fft_queue, self._nfft, self._start_idx, self._end_idx, self._ult_calib,
-                       active_workers_number, lock2)
-        pool = mp.Pool(number_of_workers, MollowTriplet._power_spectrum, worker_args)
-        summator = th.Thread(target=self._summator, args=(active_workers_number, lock2, done_iterations, lock1))
-        summator.start()
-
-        while summator.is_alive():
-            with lock1:
-                time_since = (dt.now() - start_time).total_seconds()
-                if done_iterations.value > 0:
-                    avg_time = time_since / done_iterations.value
-                    measurement_data = self._measurement_result.get_data()
-                    if self._ult_calib:
-                        measurement_data["data"] = self._internal_data.copy() / self._internal_data_bg.copy()
-                    else:
-                        measurement_data["data"] = self._internal_data.copy()
-                    self._measurement_result.set_data(measurement_data)
-                else:
-                    avg_time = time_since
-                time_left = self._format_time_delta(avg_time * (self._internal_avg - done_iterations.value))
-
-                print(f"Time left: {time_left}, iteration number: {done_iterations.value}, "
-                      f"measurement queue size: {self.data_queue.qsize()}, fft queue size: {self.fft_queue.qsize()}, "
-                      f"average cycle time: {round(avg_time, 2)} s",
-                      end="\r", flush=True)
-
-            if self._interrupted:
-                self._dig[0].stop_card()
-                measurer.join()
-                pool.terminate()
-                summator.join()
-                return
-            sleep(5.0)
+                yield (self._single_measurement(),)
 
+    def _store_spectrum(self, pipeline):
+        if pipeline.get_count() == 0:
+            return
         measurement_data = self._measurement_result.get_data()
         if self._ult_calib:
-            measurement_data["data"] = self._internal_data.copy() / self._internal_data_bg.copy()
+            power_spectrum_fg, power_spectrum_bg = pipeline.get_sum()
+            measurement_data["data"] = power_spectrum_fg / power_spectrum_bg
         else:
-            measurement_data["data"] = self._internal_data.copy() / self._internal_avg
+            measurement_data["data"], = pipeline.get_average()
         self._measurement_result.set_data(measurement_data)
 
-        measurer.join()
-        summator.join()
-        pool.terminate()
-        pool.close()
+    def _record_data(self):
+        """
+        Traces are acquired in this thread while their power spectra are
+        computed and accumulated by a pool of processes, see
+        SpectralAveragingPipeline
+        """
+        start_time = self._measurement_result.get_start_datetime()
+        number_of_workers = 3  # PXI CPU has 8 cores
+
+        pipeline = SpectralAveragingPipeline(self._trace_len, self._nfft, self._start_idx, self._end_idx,
+                                             n_parts=2 if self._ult_calib else 1,
+                                             n_workers=number_of_workers)
+        last_report_time = dt.now()
+        with pipeline:
+            for traces in self._acquire_traces():
+                pipeline.put(*traces)
+                if self._interrupted:
+                    pipeline.close(wait=False)
+                    return
+
+                now = dt.now()
+                if (now - last_report_time).total_seconds() >= self._progress_update_interval:
+                    last_report_time = now
+                    done_iterations = pipeline.get_count()
+                    time_since = (now - start_time).total_seconds()
+                    avg_time = time_since / max(done_iterations, 1)
+                    time_left = self._format_time_delta(avg_time * (self._internal_avg - done_iterations))
+                    self._store_spectrum(pipeline)
+                    print(f"Time left: {time_left}, iteration number: {done_iterations}, "
+                          f"average cycle time: {round(avg_time, 2)} s",
+                          end="\r", flush=True)
+        self._store_spectrum(pipeline)
 
         self._measurement_result.set_recording_time(dt.now() - start_time)
         print("\nElapsed time: %s" % self._format_time_delta((dt.now() - start_time)
@@ -309,10 +221,13 @@ class MollowTriplet(Measurement):
 
     def _single_measurement(self):
         dig = self._dig[0]
-        dig_data = dig.measure(dig._bufsize)
+        return self._process_trace(dig.measure(dig._bufsize))
+
+    def _process_trace(self, dig_data):
+        dig = self._dig[0]
         # WTF??
         # dig_data = (2*(dig_data / dig.n_avg + 128) / 255 - 1) * dig.ch_amplitude
-        dig_data = dig_data / dig.n_avg / 128 * dig.ch_amplitude
+        dig_data = dig.scale_data(dig_data).reshape(-1)
         data_i = dig_data[0::2]
         data_i = data_i[self._n_samples_to_drop_by_dig_delay: -self._n_samples_to_drop_in_end]
 
@@ -278,13 +278,27 @@ class PulseMixing(DigitizerTimeResolvedDirectMeasurement):
         self._output_pulse_sequence()
 
     def _measure_one_trace(self):
-        dig = self._dig[0]
-        dig_data = dig.measure().astype(float)
+        return self._process_one_trace(self._acquire_one_trace())
 
-        # convertion to mV is according to
-        # https://spectrum-instrumentation.com/sites/default/files/download/m4i_m4x_22xx_manual_english.pdf
-        # p.81
-        dig_data = dig_data / dig.n_avg / 128 * dig.ch_amplitude
+    def _acquire_one_trace(self):
+        """
+        Reads a trace from the digitizer, converted to mV, along with the
+        settings required to process it later by _process_one_trace(...)
+        """
+        dig = self._dig[0]
+        acquisition = {"n_seg": dig.n_seg, "sample_rate": dig.get_sample_rate(),
+                       "n_drop_by_delay": self._n_samples_to_drop_by_delay,
+                       "n_drop_in_end": self._n_samples_to_drop_in_end,
+                       "pause_in_samples": self._pause_in_samples_before_next_trigger,
+                       "cut": self.__cut, "cut_pulses": self.__cut_pulses,
+                       "pulse_sequence_parameters": dict(self._pulse_sequence_parameters)}
+        # scaled copy, the digitizer buffer is reused by the next acquisition
+        return dig.scale_data(dig.measure()), acquisition
+
+    def _process_one_trace(self, trace):
+        # dig_data is (segments, samples, channels) array in mV
+        dig_data, acq = trace
+        pulse_sequence_parameters = acq["pulse_sequence_parameters"]
 
         '''
         In order to allow digitizer to not miss very next trigger while the acquisition
@@ -296,92 +310,63 @@ class PulseMixing(DigitizerTimeResolvedDirectMeasurement):
         '''
 
 
+        data = SPCM.trim_segments(dig_data, acq["n_drop_by_delay"], acq["n_drop_in_end"])
+
         # I channel data exctraction
-        data_i = dig_data[0::2]
         # 2D array that will be set to the trace avg value
         # and appended to the end of each segment of the trace
-        # scalar average is multiplied by 'np.ones()' of the appropriate 2D shape
-        avgs_to_concat = np.average(data_i)*np.ones((dig.n_seg, self._pause_in_samples_before_next_trigger))
-        data_i = data_i.reshape(dig.n_seg, round(data_i.shape[0] / dig.n_seg))
-        # if 'pm.pm._n_samples_to_drop_in_end' equals zero, the empty list is produced
-        if self._n_samples_to_drop_in_end == 0:
-            slice_stop = data_i.shape[1]
-        else:
-            slice_stop = -self._n_samples_to_drop_in_end
-        data_i = data_i[:, self._n_samples_to_drop_by_delay: slice_stop]
-        data_i = np.concatenate((data_i, avgs_to_concat), axis=1)
-        data_i = data_i.flatten()
+        avgs_to_concat = np.full((acq["n_seg"], acq["pause_in_samples"]),
+                                 np.average(dig_data[:, :, 0]), dtype=float)
+        data_i = np.concatenate((data[:, :, 0], avgs_to_concat), axis=1).flatten()
 
         # Q channel data exctraction
-        data_q = dig_data[1::2]
-        # 2D array that will be set to the trace avg value
-        # and appended to the end of each segment of the trace
-        # scalar average is multiplied by 'np.ones()' of the appropriate 2D shape
-        avgs_to_concat = np.average(data_i) * np.ones((dig.n_seg, self._pause_in_samples_before_next_trigger))
-        data_q = data_q.reshape(dig.n_seg, round(data_q.shape[0] / dig.n_seg))
-        # if 'pm.pm._n_samples_to_drop_in_end' equals zero, the empty list is produced
-        if self._n_samples_to_drop_in_end == 0:
-            slice_stop = data_q.shape[1]
-        else:
-            slice_stop = -self._n_samples_to_drop_in_end
-        data_q = data_q[:, self._n_samples_to_drop_by_delay: slice_stop]
-        data_q = np.concatenate((data_q, avgs_to_concat), axis=1)
-        data_q = data_q.flatten()
+        avgs_to_concat = np.full((acq["n_seg"], acq["pause_in_samples"]),
+                                 np.average(data_i), dtype=float)
+        data_q = np.concatenate((data[:, :, 1], avgs_to_concat), axis=1).flatten()
 
-        if self.__cut is True:
+        if acq["cut"] is True:
             # cutting out parts of signals that do not carry any
             # useful information
-            sampling_freq = self._dig[0].get_sample_rate()
-            samples_n = len(data_i)  # total amount of samples
-            repetition_period = self._pulse_sequence_parameters["repetition_period"]
-            sampling_points_times = 1e9 * np.arange(0, samples_n / sampling_freq, 1 / sampling_freq)  # ns
-            readout_duration = self._pulse_sequence_parameters["readout_duration"]  # ns
+            readout_duration = pulse_sequence_parameters["readout_duration"]  # ns
 
             # the whole pulse sequence + readout duration after is exctracted untouched
 
             # parameters below are calculated and stored into 'pulse_sequence_parameters'
             # during the last call to 'self._sequence_generator' function
-            first_pulse_start = self._pulse_sequence_parameters["first_pulse_start"]
-            last_pulse_end = self._pulse_sequence_parameters["last_pulse_end"]
+            first_pulse_start = pulse_sequence_parameters["first_pulse_start"]
+            last_pulse_end = pulse_sequence_parameters["last_pulse_end"]
 
-            if self.__cut_pulses:  # if it is configured to cut out excitation pulses
-                target_intervals = [(last_pulse_end, last_pulse_end + readout_duration)]
-                # print(f"cut pulses intervals: {desired_intervals}")
+            if acq["cut_pulses"]:  # if it is configured to cut out excitation pulses
+                target_intervals = ((last_pulse_end, last_pulse_end + readout_duration),)
             else:  # excitation pulses remain untouched
-                target_intervals = [(first_pulse_start, last_pulse_end + readout_duration)]
-                # print(f"NO cut pulses intervals: {desired_intervals}")
-
-            def belongs(t, intervals):
-                ret = False
-                for interval in intervals:
-                    if (interval[0] <= t <= interval[1]):
-                        ret = True
-                        break
-                return ret
-
-            sampling_points_times_mask = np.zeros(len(sampling_points_times))
-            avgI = np.mean(data_i)
-            avgQ = np.mean(data_q)
-
-            # constructing mask for data to be cutted out
-            for i, t in enumerate(sampling_points_times):
-                t_inside_pulse = t % repetition_period
-                if belongs(t_inside_pulse, target_intervals):
-                    sampling_points_times_mask[i] = 1
+                target_intervals = ((first_pulse_start, last_pulse_end + readout_duration),)
+
+            # mask of the data to be kept, cached for the pulse sequence
+            mask = SPCM.gate_mask(len(data_i), acq["sample_rate"],
+                                  pulse_sequence_parameters["repetition_period"], target_intervals)
 
             # the rest of the signal is equalized to the average value
-            data_i = (data_i * sampling_points_times_mask + (1 - sampling_points_times_mask) * avgI)
-            data_q = (data_q * sampling_points_times_mask + (1 - sampling_points_times_mask) * avgQ)
+            data_i = np.where(mask, data_i, np.mean(data_i))
+            data_q = np.where(mask, data_q, np.mean(data_q))
         return data_i + 1j * data_q
 
     def _recording_iteration(self):
-        data = self._measure_one_trace()
-        # for debug purposes
-        self.dataI.append(np.real(data))
-        self.dataQ.append(np.imag(data))
+        return self._store_iteration(self._process_iteration(self._acquire_iteration()))
 
+    def _acquire_iteration(self):
+        return self._acquire_one_trace()
+
+    def _process_iteration(self, raw_data):
+        data = self._process_one_trace(raw_data)
         fft_data = fftpack.fftshift(fftpack.fft(data, self._nfft)) / self._nfft
         yf = fft_data[self._start_idx:self._end_idx + 1]
+        return yf, data
+
+    def _store_iteration(self, processed):
+        yf, data = processed
+        # for debug purposes, in the order of the stored points
+        self.dataI.append(np.real(data))
+        self.dataQ.append(np.imag(data))
         return yf
 
     def _output_pulse_sequence(self, zero=False):
@@ -259,7 +259,7 @@ class CrosstalksCalibrationResult(MeasurementResult):
             "v" for vertical slice subtraction
 
         """
-        s_data = self.get_data()["data"]
+        s_data = self.get_data()["data"].copy()
         len_freq = s_data.shape[1]
         len_cur = s_data.shape[0]
         if direction is "avg_cur":
@@ -10,6 +10,6 @@ setup(
 	packages=['lib','lib2', 'lib2.tests', 'drivers'],
 	package_dir = {'lib': 'lib', 'lib2': 'lib2', 'drivers': 'drivers'},
 	long_description=open('README.md').read(),
-	install_requires=['numpy', 'PySide2', 'scipy', 'ipython', 'matplotlib', 'tqdm', 'Cython', 'pyvisa', 'qutip', 'resonator-tools-vdrhtc', 'loggingserver'],
+	install_requires=['numpy', 'PySide2', 'scipy', 'ipython', 'matplotlib', 'tqdm', 'Cython', 'pyvisa', 'qutip', 'resonator-tools-vdrhtc', 'loggingserver', 'h5py'],
 	zip_safe=False,
 )
@@ -0,0 +1,56 @@
+"""
+VISA resource stand-in for the driver tests, which records the messages and
+counts the bus round trips
+"""
+
+
+class MockResource:
+
+    def __init__(self, replies=None):
+        """
+        Parameters
+        ----------
+        replies: dict
+            {query header: reply}, e.g. {"SOUR:POW?": "-10"}, the headers are
+            compared case-insensitively without the leading colon; "0" is
+            replied to the unknown queries
+        """
+        self.timeout = 2000
+        self.messages = []
+        self.round_trips = 0
+        self._replies = {self._header(query): reply for query, reply in (replies or {}).items()}
+
+    def write(self, message):
+        self.messages.append(message)
+        self.round_trips += 1
+
+    def read(self):
+        self.round_trips += 1
+        return "0"
+
+    def query(self, message):
+        """
+        Replies to every query of a semicolon-joined message like an SCPI
+        instrument does
+        """
+        self.messages.append(message)
+        self.round_trips += 1
+        return ";".join(self._replies.get(self._header(command), "0")
+                        for command in message.split(";")
+                        if command.split(" ")[0].strip().endswith("?"))
+
+    def get_commands(self):
+        """
+        Returns
+        -------
+        list of str
+            all the commands sent so far, joined messages are split
+        """
+        return [command.strip() for message in self.messages for command in message.split(";")]
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _header(command):
+        return command.strip().lstrip(":").upper()
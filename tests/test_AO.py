@@ -0,0 +1,59 @@
+import io
+from contextlib import redirect_stdout
+
+from numpy import array, linspace, allclose
+from numpy.random import RandomState
+from scipy.optimize import brute
+
+from lib2.fulaut import AnticrossingOracle
+from lib2.fulaut.qubit_spectra import transmon_spectrum
+
+
+def _oracle(n_workers=0):
+    oracle = AnticrossingOracle.AnticrossingOracle.__new__(AnticrossingOracle.AnticrossingOracle)
+    oracle._qubit_spectrum = transmon_spectrum
+    oracle._freqs = linspace(7e9, 7.01e9, 201)
+    oracle._hints = {}
+    oracle._frozen_parameters = {}
+    oracle._iteration_counter = 0
+    oracle._silent = True
+    oracle._n_workers = n_workers
+    oracle._sts_result = None
+    oracle._logger = None
+    oracle._default_parameter_ranges = \
+        {"fr": slice(7.004e9, 7.0061e9, 1e6), "g": slice(20e6, 40.1e6, 4e6),
+         "period": None, "sws_current": None,
+         "fqmax": slice(5e9, 9.1e9, 100e6), "d": slice(0.1, 0.81, .1)}
+
+    curs = linspace(-1e-3, 1e-3, 51)
+    oracle._period = 1.3e-3
+    res_freqs = oracle._model_fast(curs, [7.005e9, 30e6, 1.3e-3, 1e-4, 7.3e9, 0.5]) + \
+                2e4 * RandomState(0).randn(len(curs))
+    oracle._res_points = array([curs, res_freqs]).T
+    return oracle
+
+
+def test_vectorized_brute():
+    oracle = _oracle()
+    oracle.freeze_parameters({"period": 1.3e-3, "sws_current": 1e-4})
+    slices = oracle._generate_brute_grids()
+    args = (oracle._res_points[:, 0], oracle._res_points[:, 1])
+
+    with redirect_stdout(io.StringIO()):
+        expected = brute(oracle._cost_function, slices, args=args, finish=None)
+    params, cost = oracle._brute(slices, *args)
+    assert allclose(params, expected, rtol=0)
+    assert cost == oracle._cost_function(expected, *args)
+
+
+def test_parallel_search():
+    sweet_spots = [1e-4 + 1.3e-3 / 2, 1e-4]
+    serial = _oracle()._search_sweet_spots(sweet_spots)
+    parallel = _oracle(n_workers=2)._search_sweet_spots(sweet_spots)
+    assert len(serial) == len(parallel) == 2
+    for serial_result, parallel_result in zip(serial, parallel):
+        assert allclose(serial_result[2], parallel_result[2], rtol=0)
+        assert serial_result[-1] == parallel_result[-1]
+
+    # the search near the good sweet spot finishes the job
+    assert len(_oracle(n_workers=2)._search_sweet_spots(sweet_spots[::-1])) == 1
@@ -0,0 +1,60 @@
+from numpy import linspace, exp, zeros, abs, meshgrid
+
+from lib2.AdaptiveSampler import AdaptiveSampler
+
+
+def test_refines_at_features():
+    x, y = linspace(-1, 1, 65), linspace(-1, 1, 33)
+    xx, yy = meshgrid(x, y, indexing="ij")
+    line = exp(-((xx - 0.5 * yy ** 2) / 0.05) ** 2)
+
+    sampler = AdaptiveSampler(line.shape, coarse_step=8, max_fraction=0.2)
+    data = zeros(line.shape)
+    for points in sampler.batches(lambda: data):
+        data[tuple(points.T)] = line[tuple(points.T)]
+
+    measured = sampler.get_measured_mask()
+    assert measured.mean() < 0.25
+    assert (data[measured] == line[measured]).all()
+    # interpolated map is close to the true one, and the points gather on the line
+    assert abs(data - line).max() < 0.1
+    assert line[measured].mean() > 2 * line.mean()
+
+
+def test_incremental_fill():
+    x, y = linspace(-1, 1, 33), linspace(-1, 1, 17)
+    xx, yy = meshgrid(x, y, indexing="ij")
+    line = exp(-((xx - 0.5 * yy ** 2) / 0.1) ** 2)
+
+    sampler = AdaptiveSampler(line.shape, coarse_step=4, max_fraction=0.5)
+    data = zeros(line.shape)
+    for batch_idx, points in enumerate(sampler.batches(lambda: data)):
+        if batch_idx > 0:
+            # only the split cells are refilled, but the whole grid is
+            # interpolated from the measured points
+            measured = sampler.get_measured_mask()
+            assert data.min() >= data[measured].min() and data.max() <= data[measured].max()
+        data[tuple(points.T)] = line[tuple(points.T)]
+
+    refilled = data.copy()
+    sampler.fill(refilled)
+    assert (refilled == data).all()
+
+
+def test_single_value_axes():
+    for shape in [(1, 50), (50, 1), (50,)]:
+        x = linspace(-1, 1, 50).reshape(shape)
+        peak = exp(-(x / 0.2) ** 2)
+
+        sampler = AdaptiveSampler(shape, coarse_step=8, max_fraction=0.3)
+        data = zeros(shape)
+        points_number = 0
+        for points in sampler.batches(lambda: data):
+            data[tuple(points.T)] = peak[tuple(points.T)]
+            points_number += len(points)
+
+        measured = sampler.get_measured_mask()
+        assert points_number == measured.sum() == sampler.get_max_points_number()
+        # refined around the peak, the rest is interpolated
+        assert peak[measured].mean() > 1.3 * peak.mean()
+        assert abs(data - peak).max() < 0.1
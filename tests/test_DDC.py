@@ -0,0 +1,27 @@
+from numpy import fft, argmin, abs, arange, exp, pi, isclose, allclose
+from numpy.random import RandomState
+
+from lib2 import DigitalDownConversion
+
+
+def test_demodulate_equals_fft_bin():
+    sample_rate, n_samples = 1.25e9, 10001
+    random = RandomState(0)
+    data_i, data_q = random.normal(size=n_samples), random.normal(size=n_samples)
+    freqs = fft.fftshift(fft.fftfreq(n_samples, 1 / sample_rate))
+    spectrum = fft.fftshift(fft.fft(data_i + 1j * data_q)) / n_samples
+
+    for if_frequency in [50e6, -50e6, 12.3e6]:
+        IQ = DigitalDownConversion.demodulate(data_i, data_q, sample_rate, if_frequency,
+                                              bin_centered=True)
+        assert isclose(IQ, spectrum[argmin(abs(freqs - if_frequency))], rtol=0, atol=1e-12)
+
+
+def test_demodulate_tones():
+    sample_rate = 1e9
+    times = arange(5000) / sample_rate
+    trace = 0.3 * exp(2j * pi * 20.1e6 * times + 0.4j) + 0.1 * exp(-2j * pi * 40.2e6 * times)
+
+    IQ = DigitalDownConversion.demodulate(trace.real, trace.imag, sample_rate,
+                                          [20.1e6, -40.2e6], window="hann")
+    assert allclose(IQ, [0.3 * exp(0.4j), 0.1], atol=1e-3)
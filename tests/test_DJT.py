@@ -0,0 +1,46 @@
+import io
+from contextlib import redirect_stdout
+from itertools import product
+
+import numpy as np
+from qutip import tensor, basis, identity, sigmaz, expect, fidelity
+
+from lib2.DispersiveJointTomography import Tomo
+
+
+def _tomo():
+    rotations = ["+I", "+X/2", "+Y/2", "-X/2", "-Y/2", "+X"]
+    meas_op = tensor(sigmaz(), identity(2)) * (0.3 + 0.1j) + \
+              tensor(identity(2), sigmaz()) * (0.2 - 0.05j) + \
+              tensor(sigmaz(), sigmaz()) * 0.1
+    bell_state = (tensor(basis(2, 0), basis(2, 0)) + tensor(basis(2, 1), basis(2, 1))).unit()
+    rho = 0.9 * bell_state * bell_state.dag() + 0.1 * tensor(identity(2), identity(2)) / 4
+
+    tomo = Tomo(dim=4)
+    tomo.upload_measurement_operators([meas_op])
+    tomo.upload_rotation_sequence_from_command_list(list(product(rotations, rotations)))
+    tomo.construct_measurements_from_matrix(rho)
+    return tomo, rho
+
+
+def test_likelihood():
+    tomo, rho = _tomo()
+    x = np.random.RandomState(0).randn(16)
+
+    rho_x = Tomo.x_to_rho(x)
+    expected = sum(abs(expect(rho_x, op) - ex) ** 2 for op, ex in tomo._measurements[0])
+    assert np.isclose(tomo.likelihood(x), expected, rtol=1e-12)
+
+    from lib2.DispersiveJointTomography import _likelihood_and_gradient
+    gradient = _likelihood_and_gradient(x, *tomo._get_stacked_measurements())[1]
+    numerical_gradient = [(tomo.likelihood(x + 1e-6 * e) - tomo.likelihood(x - 1e-6 * e)) / 2e-6
+                          for e in np.identity(16)]
+    assert np.allclose(gradient, numerical_gradient, rtol=1e-5, atol=1e-8)
+
+
+def test_find_rho():
+    tomo, rho = _tomo()
+    np.random.seed(0)
+    with redirect_stdout(io.StringIO()):
+        found_rho = tomo.find_rho(averages=5)
+    assert fidelity(found_rho, rho) > 0.9999
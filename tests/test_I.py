@@ -0,0 +1,88 @@
+from drivers.instrument import Instrument
+
+
+class FakeSource(Instrument):
+
+    def __init__(self):
+        Instrument.__init__(self, "fake")
+        self.writes = []
+        self._level = 0.
+        self.add_parameter('level', type=float,
+                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE,
+                           invalidates=['range'])
+        self.add_parameter('range', type=float,
+                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_CACHE)
+
+    def do_set_level(self, level):
+        self.writes.append(("level", level))
+        self._level = round(level, 1)
+
+    def do_get_level(self):
+        return self._level
+
+    def do_set_range(self, value):
+        self.writes.append(("range", value))
+
+    def do_get_range(self):
+        return 1.
+
+
+def test_redundant_sets_are_skipped():
+    source = FakeSource()
+    source.set_level(0.123)
+    source.set_range(1)
+    source.set_level(0.123)
+    source.set_range(1)
+    assert source.writes == [("level", 0.123), ("range", 1)]
+
+    # the device rounded the value, but nothing has changed since the set
+    assert source.get_level() == 0.1
+    source.set_level(0.123)
+    assert source.get_level() == 0.1
+    source.set_level(0.123)
+    assert len(source.writes) == 2
+
+    source._level = 0.5  # e.g. changed from the front panel
+    source.get_level()
+    source.set_level(0.123)
+    assert len(source.writes) == 3
+
+
+def test_cache_invalidation():
+    source = FakeSource()
+    source.set_range(1)
+    source.set_level(1)
+    source.set_range(1)
+    assert source.writes[-1] == ("range", 1) and len(source.writes) == 3
+
+    source.invalidate_cache()
+    source.set_level(1)
+    assert len(source.writes) == 4
+
+
+def test_batched_commands():
+    from unittest.mock import patch
+
+    from drivers import E8257D
+    from tests.mock_visa import MockResource
+
+    resource = MockResource({"SOUR:POW?": "-10", "SOURce:POWer?": "-10"})
+    with patch.object(E8257D.visa, "ResourceManager") as resource_manager:
+        resource_manager.return_value.open_resource.return_value = resource
+        mxg = E8257D.MXG("MXG")
+
+    resource.round_trips = 0
+    mxg.set_parameters({"power": -10, "frequency": 5e9, "frequencies": [5e9, 6e9],
+                        "sweep_trg_src": "EXT", "InSweep_trg_src": "BUS"})
+    assert resource.round_trips == 1
+    assert resource.messages[-1].startswith(":SOURce:POWer -10DBM;:SOURce:FREQuency:CW")
+
+    with mxg.batch() as batch:
+        mxg.write("FREQ:MODE CW")
+        power = batch.defer_query("SOUR:POW?")
+        frequency = batch.defer_query("SOUR:FREQ:CW?")
+        assert mxg.get_power() == -10
+    assert resource.round_trips == 2
+    assert resource.messages[-1] == "FREQ:MODE CW;:SOUR:POW?;:SOUR:FREQ:CW?;:SOURce:POWer?"
+    assert (power.get_value(), frequency.get_value()) == ("-10", "0")
+    assert mxg._visainstrument is resource
@@ -0,0 +1,106 @@
+from numpy import *
+from scipy import signal
+
+from lib.iq_mixer_calibration import IQCalibrationData
+from lib2.IQPulseSequence import IQPulseBuilder
+
+calibration = IQCalibrationData("test", 0, 6e9, 13, 100e6, "left", -10, 1,
+                                (0.01, -0.02), (0.5, 0.45), (0.001, -0.002), (0.4, 0.38), 0.3,
+                                {"dc": -90}, 1, None)
+
+
+def eager_sine_pulse(total_points, duration, phase, amplitude_mult, window, hd_amplitude,
+                     window_parameter=0.5):
+    """
+    Both quadratures of IQPulseBuilder.add_sine_pulse(...) computed directly
+    """
+    if_offs1, if_offs2 = calibration.get_optimization_results()[0]["if_offsets"]
+    if_amp1, if_amp2 = array(calibration.get_optimization_results()[0]["if_amplitudes"]) * amplitude_mult
+    if_phase = calibration.get_optimization_results()[0]["if_phase"]
+    frequency = 2 * pi * calibration.get_radiation_parameters()["if_frequency"] / 1e9
+    resolution = calibration.get_radiation_parameters()["waveform_resolution"]
+
+    N_time_steps = int(round(duration / resolution))
+    duration = N_time_steps * resolution
+    phase += total_points * resolution * frequency
+    points = linspace(0, duration, N_time_steps, endpoint=False)
+
+    if window == "rectangular":
+        window = ones_like(points)
+    elif window == "gaussian":
+        B = exp(-(duration / 2) ** 2 / 2 / (duration / 3) ** 2)
+        window = (exp(-(points - duration / 2) ** 2 / 2 / (duration / 3) ** 2) - B) / (1 - B)
+    elif window == "hahn":
+        window = sin(pi * linspace(0, N_time_steps, N_time_steps, endpoint=False) / N_time_steps) ** 2
+    elif window == "tukey":
+        window = signal.tukey(N_time_steps, alpha=window_parameter)
+    elif window == "kaiser":
+        window = signal.kaiser(N_time_steps, beta=window_parameter)
+    derivative = gradient(window, resolution)
+    derivative[0] = derivative[-1] = 0
+    hd_correction = - derivative * hd_amplitude / 2 / (-2 * pi * 0.2)
+
+    carrier_I = if_amp1 * exp(1j * (frequency * points + if_phase + phase))
+    carrier_Q = if_amp2 * exp(1j * (frequency * points + phase))
+    return window * real(carrier_I) + hd_correction * imag(carrier_I) + if_offs1, \
+        window * real(carrier_Q) + hd_correction * imag(carrier_Q) + if_offs2
+
+
+def build_sequence(pulses):
+    """
+    Builds the sequence of (duration, phase, amplitude, window, hd_amplitude)
+    sine pulses separated by zero pulses with IQPulseBuilder and directly
+    """
+    builder = IQPulseBuilder(calibration)
+    dc_offsets = calibration.get_optimization_results()[0]["dc_offsets"]
+    I, Q = [], []
+    for pulse in pulses:
+        builder.add_zero_pulse(7)
+        I.append(zeros(7) + dc_offsets[0])
+        Q.append(zeros(7) + dc_offsets[1])
+
+        builder.add_sine_pulse(*pulse[:2], amplitude_mult=pulse[2], window=pulse[3],
+                               hd_amplitude=pulse[4])
+        pulse_I, pulse_Q = eager_sine_pulse(len(concatenate(I)), *pulse)
+        I.append(pulse_I)
+        Q.append(pulse_Q)
+    return builder.build(), concatenate(I), concatenate(Q)
+
+
+pulses = [(20, 0, 1, "rectangular", 0), (30, pi / 2, 0.5, "gaussian", 1),
+          (30, pi, 0.5, "gaussian", 1), (25, 0, 1, "hahn", 0.5),
+          (40, 0.3, 0.8, "tukey", 0), (40, 0.3, 0.8, "kaiser", 0.2),
+          (20, -pi / 2, 1, "rectangular", 0)]
+
+
+def test_sine_pulses():
+    sequence, I, Q = build_sequence(pulses)
+    assert allclose(sequence.get_I_waveform(), I, rtol=0, atol=1e-12)
+    assert allclose(sequence.get_Q_waveform(), Q, rtol=0, atol=1e-12)
+
+    # the cached windows are shared between the pulses, but not modified
+    sequence, I, Q = build_sequence(pulses[::-1])
+    assert allclose(sequence.get_I_waveform(), I, rtol=0, atol=1e-12)
+    assert allclose(sequence.get_Q_waveform(), Q, rtol=0, atol=1e-12)
+
+
+def test_sequences_addition():
+    sequence1, I1, Q1 = build_sequence(pulses[:3])
+    sequence2, I2, Q2 = build_sequence(pulses[3:])
+
+    total = sequence1 + sequence2
+    assert allclose(total.get_I_waveform(), concatenate((I1[:-1], I2)), rtol=0, atol=1e-12)
+    assert allclose(total.get_Q_waveform(), concatenate((Q1[:-1], Q2)), rtol=0, atol=1e-12)
+    assert total.get_duration() == sequence1.get_duration() + sequence2.get_duration() - \
+        sequence1.get_waveform_resolution()
+
+    # same durations, so that the sequences can be summed
+    sequence3, I3, Q3 = build_sequence([(pulse[0], pulse[1] + 1, 0.5, "hahn", 1)
+                                        for pulse in pulses[3:]])
+    total = sequence2.direct_add(sequence3)
+    assert allclose(total.get_I_waveform(), I2 + I3, rtol=0, atol=1e-12)
+    assert allclose(total.get_Q_waveform(), Q2 + Q3, rtol=0, atol=1e-12)
+
+    # the operands are left intact
+    assert allclose(sequence1.get_I_waveform(), I1, rtol=0, atol=1e-12)
+    assert allclose(sequence2.get_Q_waveform(), Q2, rtol=0, atol=1e-12)
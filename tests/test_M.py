@@ -3,7 +3,11 @@ from lib2.Measurement import Measurement
 from lib2.MeasurementResult import MeasurementResult, ContextBase
 from unittest.mock import MagicMock, Mock
 from time import sleep
-from numpy import linspace
+from random import seed, uniform
+from datetime import datetime
+from numpy import linspace, array, diff, all, prod
+from numpy.random import RandomState
+import pytest
 
 class DataGen:
 
@@ -97,3 +101,129 @@ def test_loading_pars_to_devices():
     #         i.set_parameters.assert_called_with(one_pair[1][b])
 
 
+
+
+def test_parallel_loading_with_dependencies():
+    from time import perf_counter
+
+    intervals = {}
+
+    class SlowDevice:
+        def __init__(self, name):
+            self._name = name
+
+        def set_parameters(self, params):
+            start = perf_counter()
+            sleep(0.1)
+            intervals[self._name] = (start, perf_counter())
+
+    def overlap(name1, name2):
+        return intervals[name1][0] < intervals[name2][1] and \
+               intervals[name2][0] < intervals[name1][1]
+
+    lo, awg, vna_dev = SlowDevice("lo"), SlowDevice("awg"), SlowDevice("vna")
+    meas = Measurement("test_delete", "test", {"q_lo": [lo], "q_awg": [awg], "vna": [vna_dev]})
+    meas.set_measurement_result(MagicMock())
+
+    # sequential by default
+    meas.set_fixed_parameters(q_awg=[{}], vna=[{}], q_lo=[{}])
+    assert not overlap("vna", "lo") and not overlap("vna", "awg")
+    assert intervals["lo"][1] <= intervals["awg"][0]
+
+    # the AWG waits for the LO by default, the VNA is loaded alongside them
+    meas.set_parameter_loading()
+    meas.set_fixed_parameters(q_awg=[{}], vna=[{}], q_lo=[{}])
+    assert intervals["lo"][1] <= intervals["awg"][0]
+    assert overlap("vna", "lo") or overlap("vna", "awg")
+
+    meas.set_parameter_loading(vna=["q_awg"])
+    meas.set_fixed_parameters(q_awg=[{}], vna=[{}], q_lo=[{}])
+    assert intervals["lo"][1] <= intervals["awg"][0] <= intervals["awg"][1] <= intervals["vna"][0]
+
+
+class PipelinedMeasurement(Measurement):
+
+    def __init__(self, failing_value=None):
+        super().__init__("test_delete", "test", {})
+        self._failing_value = failing_value
+        self.side_results = []
+        self.set_measurement_result(MagicMock())
+        self._measurement_result.get_data.return_value = {}
+        self._measurement_result.get_start_datetime.return_value = datetime.now()
+        self._value = None
+
+    def _set_value(self, value):
+        self._value = value
+
+    def _acquire_iteration(self):
+        return self._value
+
+    def _process_iteration(self, raw_data):
+        sleep(uniform(0, 0.02))
+        if raw_data == self._failing_value:
+            raise ValueError(raw_data)
+        return raw_data * 1j, raw_data
+
+    def _store_iteration(self, processed):
+        data, side_result = processed
+        self.side_results.append(side_result)
+        return data
+
+
+def test_pipelined_recording():
+    seed(0)
+    values = linspace(0, 1, 30)
+    meas = PipelinedMeasurement()
+    meas.set_swept_parameters(value=(meas._set_value, values))
+    meas.set_pipelining(workers=3)
+    meas._record_data()
+
+    assert all(meas._raw_data == values * 1j)
+    assert meas.side_results == list(values)
+
+    meas = PipelinedMeasurement(failing_value=values[10])
+    meas.set_swept_parameters(value=(meas._set_value, values))
+    meas.set_pipelining(workers=3)
+    with pytest.raises(ValueError):
+        meas._record_data()
+    assert meas.side_results == list(values[:10])
+
+
+def test_sweep_grids_order():
+    from itertools import product
+    values = [linspace(0, 1, 3), ["a", "b"], [(1, 2), (3, 4)]]
+    idx_grid, values_grid = Measurement._make_sweep_grids(values)
+
+    assert [tuple(idxs) for idxs in idx_grid.tolist()] == \
+           list(product(*[range(len(par_values)) for par_values in values]))
+    assert [tuple(values_group) for values_group in values_grid] == \
+           list(product(*values))
+
+
+def test_sweep_grids_serpentine():
+    values = [linspace(0, 1, 3), [2, 0, 1], ["a", "b"]]
+    for order in ["serpentine", "min_slew"]:
+        for axes_order in [None, [2, 0, 1]]:
+            idx_grid, values_grid = Measurement._make_sweep_grids(values, order, axes_order)
+
+            # every point is visited exactly once and the values match the indices
+            assert sorted(map(tuple, idx_grid.tolist())) == \
+                sorted(map(tuple, Measurement._make_sweep_grids(values)[0].tolist()))
+            assert all(values_grid[:, 1] == array(values[1])[idx_grid[:, 1]])
+
+            # only one parameter changes by one step at a time
+            steps = abs(diff(idx_grid if order == "serpentine" else
+                             array(values_grid[:, :2], dtype=float) * [2, 1], axis=0))
+            assert all(steps.sum(axis=1) <= 1)
+
+    # 3D grids with even and odd loop sizes, the values are permuted ranks
+    for shape in [(3, 4, 5), (2, 2, 2), (3, 3, 2), (2, 3, 4)]:
+        values = [list(RandomState(len(shape) + size).permutation(size)) for size in shape]
+        for order in ["serpentine", "min_slew"]:
+            for axes_order in [None, [2, 0, 1], [1, 2, 0]]:
+                idx_grid, values_grid = Measurement._make_sweep_grids(values, order, axes_order)
+                assert len(set(map(tuple, idx_grid.tolist()))) == prod(shape)
+
+                positions = idx_grid if order == "serpentine" else array(values_grid, dtype=int)
+                steps = abs(diff(positions, axis=0))
+                assert all(steps.sum(axis=1) == 1)
@@ -1,7 +1,10 @@
 import datetime
+import os
+import pickle
 
 from lib2.MeasurementResult import MeasurementResult, find
 from matplotlib import pyplot as plt
+from numpy import linspace, outer, all
 
 
 
@@ -22,4 +25,61 @@ def test_save_delete():
     MeasurementResult.delete("test", "test_delete", delete_all=True)
     assert len(find("*test_delete*", "data")) == 0
 
-    plt.close("all")
\ No newline at end of file
+    plt.close("all")
+
+def test_save_load_hdf5():
+    result = MeasurementResult("test_delete", "test")
+    result._datetime = datetime.datetime(2005, 11, 11)
+    currents = linspace(0, 1, 5)
+    frequencies = linspace(1e9, 2e9, 11)
+    S21s = outer(currents, frequencies) * (1 + 1j)
+    result.set_parameter_names(["Current [A]"])
+    result.set_data({"Current [A]": currents, "Frequency [Hz]": frequencies,
+                     "data": S21s})
+    result.save()
+
+    result1 = MeasurementResult.load("test", "test_delete")
+    assert all(result1.get_data()["data"] == S21s)
+    assert all(result1.get_data()["Current [A]"] == currents)
+
+    with MeasurementResult.load_data("test", "test_delete") as data:
+        assert all(data["data"][2] == S21s[2])
+        assert all(data["Frequency [Hz]"][:3] == frequencies[:3])
+
+    MeasurementResult.delete("test", "test_delete", delete_all=True)
+    plt.close("all")
+
+
+def test_load_data_old_format():
+    result = MeasurementResult("test_delete", "test")
+    result._datetime = datetime.datetime(2005, 11, 11)
+    S21s = linspace(0, 1, 5) * (1 + 1j)
+    result.set_data({"data": S21s})
+    result.save()
+
+    # results saved before the HDF5 storage kept the data in a pickle
+    path = os.path.join(result.get_save_path(), "test_delete")
+    os.remove(path + ".h5")
+    with open(path + "_raw_data.pkl", "w+b") as f:
+        pickle.dump({"data": S21s}, f)
+
+    with MeasurementResult.load_data("test", "test_delete") as data:
+        assert all(data["data"] == S21s)
+        assert all(data.read("data") == S21s)
+        assert list(data) == ["data"]
+
+    MeasurementResult.delete("test", "test_delete", delete_all=True)
+    plt.close("all")
+
+
+def test_get_data_snapshot():
+    result = MeasurementResult("test_delete", "test")
+    raw_data = linspace(0, 1, 10)
+    version = result.get_data_version()
+    result.set_data({"data": raw_data})
+    assert result.get_data_version() == version + 1
+
+    data = result.get_data()
+    assert not data["data"].flags.writeable
+    raw_data[0] = 5  # measurement fills its arrays in place
+    assert data["data"][0] == 5
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+
+from pytest import raises
+from pyvisa import constants
+from pyvisa.errors import VisaIOError
+
+from drivers.OperationCompletion import OperationCompletion, run_concurrently_async
+
+
+class FakeResource:
+    """
+    Completes the operations *OPC is sent for after the given delay
+    """
+
+    def __init__(self, delay=0.05, srq=True):
+        self.timeout = 2000
+        self.commands = []
+        self._delay = delay
+        self._srq = srq
+        self._complete = threading.Event()
+
+    def write(self, command):
+        self.commands.append(command)
+        if command == "*OPC":
+            threading.Timer(self._delay, self._complete.set).start()
+
+    def query(self, command):
+        self.write(command)
+        if command == "*OPC?":
+            if self.timeout is not None and self.timeout / 1e3 < self._delay:
+                raise VisaIOError(constants.StatusCode.error_timeout)
+            time.sleep(self._delay)
+            return "1"
+
+    def enable_event(self, event_type, mechanism):
+        if not self._srq:
+            raise VisaIOError(constants.StatusCode.error_nonsupported_mechanism)
+
+    def wait_on_event(self, event_type, timeout):
+        if not self._complete.wait(timeout / 1e3):
+            raise VisaIOError(constants.StatusCode.error_timeout)
+
+    def read_stb(self):
+        return 64 + 32
+
+    def disable_event(self, event_type, mechanism):
+        pass
+
+    def discard_events(self, event_type, mechanism):
+        pass
+
+
+def test_srq_wait():
+    resource = FakeResource()
+    completion = OperationCompletion(resource)
+    completion.prepare()
+    completion.wait(1)
+    assert resource.commands == ["*CLS", "*ESE 1", "*SRE 32", "*OPC"]
+
+
+def test_opc_query_fallback():
+    resource = FakeResource(srq=False)
+    completion = OperationCompletion(resource)
+    completion.prepare()
+    completion.wait()
+    assert resource.commands[-1] == "*OPC?"
+    assert resource.timeout == 2000
+
+    completion.prepare()
+    assert "*SRE 32" not in resource.commands[-2:]
+
+
+def test_timeout():
+    completion = OperationCompletion(FakeResource(delay=1))
+    completion.prepare()
+    with raises(TimeoutError):
+        completion.wait(0.01)
+
+
+def test_concurrent_waits():
+    completions = [OperationCompletion(FakeResource(delay=0.2)) for _ in range(3)]
+    for completion in completions:
+        completion.prepare()
+
+    async def wait_all():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*[completion.wait_async(1) for completion in completions])
+        return loop.time() - start
+
+    assert asyncio.run(wait_all()) < 0.5
+    assert asyncio.run(run_concurrently_async(lambda: 1, lambda: 2)) == [1, 2]
@@ -0,0 +1,71 @@
+import os
+import pytest
+
+from numpy import linspace, all, zeros
+
+from lib2 import ResultStorage
+
+
+def test_checkpoint_write_read(tmpdir):
+    path = os.path.join(str(tmpdir), "test_checkpoint.h5")
+    currents = linspace(0, 1, 3)
+    powers = linspace(-10, 0, 4)
+
+    writer = ResultStorage.CheckpointWriter(path, ["current", "power"],
+                                            [currents, powers], queue_size=2)
+    for idx in range(5):
+        writer.write((idx // 4, idx % 4), [idx, 1j * idx])
+    writer.close()
+
+    raw_data, done = ResultStorage.read_checkpoint(path)
+    assert raw_data.shape == (3, 4, 2)
+    assert done.sum() == 5
+    assert all(done.ravel()[:5]) and not any(done.ravel()[5:])
+    assert raw_data[1, 0, 1] == 4j
+
+    # appending to the same file, as resume() does
+    writer = ResultStorage.CheckpointWriter(path, ["current", "power"],
+                                            [currents, powers])
+    writer.write((2, 3), zeros(2) + 11)
+    writer.close()
+    raw_data, done = ResultStorage.read_checkpoint(path)
+    assert done.sum() == 6
+    assert raw_data[2, 3, 0] == 11
+
+
+def test_checkpoint_write_error(tmpdir):
+    from threading import Event, Thread
+
+    path = os.path.join(str(tmpdir), "test_checkpoint_error.h5")
+    writer = ResultStorage.CheckpointWriter(path, ["current"], [linspace(0, 1, 10)],
+                                            queue_size=1)
+    writing = Event()
+    failing = Event()
+
+    def write_points(points):
+        writing.set()
+        failing.wait()
+        raise OSError("disk is full")
+
+    writer._write_points = write_points
+    writer.write((0,), [0])
+    writing.wait(1)
+    writer.write((1,), [1])  # fills the queue
+
+    errors = []
+
+    def blocked_write():
+        try:
+            writer.write((2,), [2])
+        except OSError as e:
+            errors.append(e)
+
+    # blocks in put(...) until the writer fails
+    thread = Thread(target=blocked_write)
+    thread.start()
+    failing.set()
+    thread.join(5)
+    assert not thread.is_alive() and len(errors) == 1
+
+    with pytest.raises(OSError):
+        writer.close()
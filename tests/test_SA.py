@@ -0,0 +1,19 @@
+from numpy import fft, abs, allclose
+from numpy.random import RandomState
+
+from lib2.SpectralAveraging import SpectralAveragingPipeline
+
+
+def test_pipeline_averages_power_spectra():
+    trace_length, nfft, start_idx, end_idx = 1000, 1024, 200, 700
+    random = RandomState(0)
+    traces = random.normal(size=(50, 2, trace_length)) + 1j * random.normal(size=(50, 2, trace_length))
+
+    with SpectralAveragingPipeline(trace_length, nfft, start_idx, end_idx, n_parts=2,
+                                   n_workers=2, n_slots=3) as pipeline:
+        for fg, bg in traces:
+            pipeline.put(fg, bg)
+
+    spectra = fft.fftshift(fft.fft(traces, nfft, axis=-1), axes=-1)[..., start_idx:end_idx + 1] / nfft
+    assert pipeline.get_count() == 50
+    assert allclose(pipeline.get_average(), (abs(spectra) ** 2).mean(axis=0))
@@ -0,0 +1,51 @@
+import io
+from contextlib import redirect_stdout
+
+from numpy import array, linspace, repeat, mgrid, allclose
+from numpy.random import RandomState
+
+from lib2.fulaut import SpectrumOracle
+from lib2.fulaut.qubit_spectra import transmon_spectrum
+
+
+def _oracle(parameter_values):
+    oracle = SpectrumOracle.SpectrumOracle.__new__(SpectrumOracle.SpectrumOracle)
+    oracle._qubit_spectrum = transmon_spectrum
+    oracle._parameter_values = parameter_values
+    oracle._counter = 0
+    oracle._iterations = 1
+    oracle._coarse_brute_candidates, oracle._fine_brute_candidates = [], []
+    oracle._coarse_brute_nop_ranking, oracle._fine_brute_nop_ranking = [], []
+    oracle._coarse_brute_distance_ranking, oracle._fine_brute_distance_ranking = [], []
+    return oracle
+
+
+def test_grid_rankings_match_cost_functions():
+    random = RandomState(0)
+    # the sweep starts at zero, which the fine cost function treats specially
+    parameter_values = linspace(0, 1e-3, 21)
+    x = repeat(parameter_values, 3)
+    y = transmon_spectrum(x, 4e-3, 0.3e-3, 6.5, 0.4) - \
+        0.12 * (random.rand(len(x)) > 0.5) + 0.01 * random.randn(len(x))
+    points = array([x, y]).T
+
+    for rankings, cost_function, kind, slices in \
+            [(SpectrumOracle._coarse_rankings, "_cost_function_coarse", "coarse",
+              (slice(4e-3, 4.01e-3, 1), slice(0.28e-3, 0.32e-3, 0.01e-3),
+               slice(6.3, 6.7, 0.05), slice(0.1, 1, 0.1))),
+             (SpectrumOracle._fine_rankings, "_cost_function_fine_fast", "fine",
+              (slice(4e-3, 4.01e-3, 1), slice(0.3e-3, 0.31e-3, 1),
+               slice(6.4, 6.6, 0.02), slice(0.4, 0.41, 1), slice(0.1, 0.15, 0.005)))]:
+        oracle = _oracle(parameter_values)
+        grid = mgrid[slices].reshape(len(slices), -1).T
+        with redirect_stdout(io.StringIO()):
+            for params in grid:
+                getattr(oracle, cost_function)(params, 35e-3, points)
+
+        valid, nop_ranking, distance_ranking = \
+            rankings(transmon_spectrum, grid, points, 35e-3, len(parameter_values))
+        assert valid.any()
+        assert allclose(grid[valid], getattr(oracle, "_%s_brute_candidates" % kind))
+        assert allclose(nop_ranking[valid], getattr(oracle, "_%s_brute_nop_ranking" % kind))
+        assert allclose(distance_ranking[valid],
+                        getattr(oracle, "_%s_brute_distance_ranking" % kind), rtol=1e-12)
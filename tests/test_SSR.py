@@ -0,0 +1,37 @@
+from numpy import arange, exp, pi, isclose, allclose, real, imag
+from numpy.random import RandomState
+
+from lib2 import DigitalDownConversion, SingleShotReadout
+
+
+def _shots(random, amplitude, n_shots, n_samples=200, sample_rate=1e9, if_frequency=50e6):
+    times = arange(n_samples) / sample_rate
+    signal = amplitude * exp(2j * pi * if_frequency * times)
+    return signal + 2 * (random.normal(size=(n_shots, n_samples)) +
+                         1j * random.normal(size=(n_shots, n_samples)))
+
+
+def test_demodulation_weights_integrate_like_ddc():
+    random = RandomState(0)
+    traces = _shots(random, 1, 10)
+    weights = SingleShotReadout.demodulation_weights(200, 1e9, 50e6)
+    shots = SingleShotReadout.integrate(real(traces), imag(traces), weights)
+    assert allclose(shots, DigitalDownConversion.demodulate(real(traces), imag(traces), 1e9, 50e6,
+                                                            bin_centered=True))
+
+
+def test_discriminators_find_populations():
+    random = RandomState(1)
+    ground_traces, excited_traces = _shots(random, 1, 2000), _shots(random, 1j, 2000)
+    weights = SingleShotReadout.matched_filter_weights(ground_traces, excited_traces)
+    ground, excited = [SingleShotReadout.integrate(real(traces), imag(traces), weights)
+                       for traces in (ground_traces, excited_traces)]
+    mixed = SingleShotReadout.integrate(real(excited_traces[:300]), imag(excited_traces[:300]), weights)
+    mixed = list(mixed) + list(SingleShotReadout.integrate(real(ground_traces[:700]),
+                                                           imag(ground_traces[:700]), weights))
+
+    for discriminator in (SingleShotReadout.LinearDiscriminator(),
+                          SingleShotReadout.GaussianMixtureDiscriminator()):
+        discriminator.fit(ground, excited)
+        assert discriminator.get_assignment_fidelity(ground, excited) > 0.99
+        assert isclose(discriminator.get_population(mixed), 0.3, atol=0.02)
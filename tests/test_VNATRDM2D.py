@@ -49,4 +49,32 @@ def test_save_load_no_excess_plot(result):
     # assert np.all(result1.get_data()["echo_delay"] == result1.get_data()["echo_delay"])
     assert len(Gcf.get_all_fig_managers()) == 0
 
-    MeasurementResult.delete("test", "test_no_excess_plot", delete_all=True)
\ No newline at end of file
+    MeasurementResult.delete("test", "test_no_excess_plot", delete_all=True)
+
+def test_fit_traces():
+    from numpy import exp, cos, pi, sqrt, isnan, median, abs
+    from numpy.random import RandomState
+
+    random_state = RandomState(0)
+    durations = linspace(0, 2000, 101)
+    frequencies = linspace(5.995e9, 6.005e9, 24)
+    t = durations[:, None] / 1e3
+    rabi_frequencies = sqrt((2 * pi * 5) ** 2 + (2 * pi * (frequencies - 6e9) / 1e6) ** 2)
+    populations = (2 * pi * 5 / rabi_frequencies) ** 2 * (1 - exp(-t / 1.5) * cos(rabi_frequencies * t)) / 2
+    data = (0.3 + 0.1j) + (0.2 - 0.4j) * populations + \
+           0.005 * (random_state.randn(*populations.shape) + 1j * random_state.randn(*populations.shape))
+    data[:, 0] = 0  # not measured yet
+
+    result = DispersiveRabiChevronsResult("test_fit_traces", "test")
+    result.set_parameter_names(['excitation_duration', 'excitation_frequency'])
+    result.set_data({"excitation_duration": durations,
+                     "excitation_frequency": frequencies,
+                     "data": data})
+    maps = result.fit_traces(chunk_size=8)
+
+    values, errors = maps["Omega_R"]
+    assert values.shape == errors.shape == (24,)
+    assert isnan(values[0])
+    assert median(abs(values[1:] / rabi_frequencies[1:] - 1)) < 1e-3
+    assert median(abs(maps["T_R"][0][1:] - 1.5)) < 0.1
+    assert result.get_fit_maps() is maps
@@ -33,4 +33,51 @@ def test_save_load_no_excess_plot(result):
     # assert np.all(result1.get_data()["echo_delay"] == result1.get_data()["echo_delay"])
     assert len(Gcf.get_all_fig_managers()) == 0
 
-    MeasurementResult.delete("test", "test_no_excess_plot", delete_all=True)
\ No newline at end of file
+    MeasurementResult.delete("test", "test_no_excess_plot", delete_all=True)
+
+def test_fit_cache_and_warm_start():
+    from unittest.mock import patch
+    from lib2.DispersiveRabiOscillations import DispersiveRabiOscillationsResult
+
+    result = DispersiveRabiOscillationsResult("test_fit_cache", "test")
+    result.set_parameter_names(["excitation_duration"])
+    durations = linspace(0, 2000, 101)
+    S21s = result._model(durations / 1e3, 1, 0.5, 1, 2 * pi * 3, 0.2, 0.1)
+    data = np.zeros_like(S21s)
+    data[:60] = S21s[:60]
+    result.set_data({"excitation_duration": durations, "data": data})
+
+    result.fit()
+    assert allclose(result._fit_params[2:4], [1, 2 * pi * 3], rtol=1e-3)
+
+    with patch("lib2.VNATimeResolvedDispersiveMeasurement1D.curve_fit") as curve_fit:
+        result.fit()
+        data[60:80] = S21s[60:80]
+        result.increment_data_version()
+        result.fit()
+        # the data has not changed, then the previous optimum is refined
+        curve_fit.assert_not_called()
+
+        result.set_is_finished(True)
+        result.fit()
+        curve_fit.assert_called_once()
+
+
+def test_fit_worker():
+    from threading import Event
+    from lib2.FitWorker import FitWorker
+
+    fits = []
+    release = Event()
+
+    def fit():
+        release.wait()
+        fits.append(1)
+
+    worker = FitWorker(fit)
+    for _ in range(3):
+        worker.request()
+    release.set()
+    assert worker.wait(1)
+    # the requests made during a fit are merged into one
+    assert 1 <= len(fits) <= 2
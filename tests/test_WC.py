@@ -0,0 +1,54 @@
+from numpy import linspace
+
+from drivers.WaveformCache import WaveformCache
+
+
+def test_make_key():
+    waveform = linspace(0, 1, 11)
+    assert WaveformCache.make_key(waveform, 1e9) == WaveformCache.make_key(waveform.copy(), 1e9)
+    assert WaveformCache.make_key(waveform, 1e9) != WaveformCache.make_key(waveform, 2e9)
+    assert WaveformCache.make_key(waveform) != WaveformCache.make_key(waveform.astype(complex))
+
+
+def test_lru_eviction():
+    cache = WaveformCache(max_points=30)
+    assert cache.put("a", "file_a", 10) == []
+    assert cache.put("b", "file_b", 10) == []
+    assert cache.put("c", "file_c", 10) == []
+
+    # "a" becomes the most recently used one, so "b" goes first
+    assert cache.get("a") == "file_a"
+    assert cache.put("d", "file_d", 10) == [("b", "file_b")]
+    assert cache.get("b") is None
+
+    # a large waveform evicts as many entries as needed
+    assert cache.put("e", "file_e", 25) == [("c", "file_c"), ("a", "file_a"), ("d", "file_d")]
+    assert cache.get("e") == "file_e"
+
+    # replacing an entry releases its points
+    assert cache.put("e", "file_e", 20) == []
+    assert cache.put("f", "file_f", 10) == []
+
+
+def test_max_entries():
+    cache = WaveformCache(max_points=100, max_entries=2)
+    cache.put("a", 1, 1)
+    cache.put("b", 2, 1)
+    assert cache.put("c", 3, 1) == [("a", 1)]
+    assert cache.pop("b") == 2
+    assert cache.put("d", 4, 1) == []
+
+
+def test_protected_entries():
+    cache = WaveformCache(max_points=30)
+    cache.put("a", "file_a", 10)
+    cache.put("b", "file_b", 10)
+    cache.put("c", "file_c", 10)
+
+    # the oldest file is still loaded into a channel
+    assert cache.put("d", "file_d", 10, protected={"file_a", None}) == [("b", "file_b")]
+    assert cache.get("a") == "file_a"
+
+    # nothing else may be evicted, so the budget is exceeded
+    assert cache.put("e", "file_e", 20, protected={"file_a", "file_c", "file_d"}) == []
+    assert [cache.get(key) for key in "acde"] == ["file_a", "file_c", "file_d", "file_e"]